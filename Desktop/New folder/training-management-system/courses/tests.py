@@ -1,3 +1,42 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.http import HttpResponse
 from django.test import TestCase
+from django.urls import reverse
+
+from training_management.test_runner import FlushCountersMixin
+from users.models import Formateur, Utilisateur
+
+from . import views
+from .models import Cours
+
+
+class CourseViewCountTests(FlushCountersMixin, TestCase):
+    """Course views are counted once per visitor and written in batches"""
+
+    def setUp(self):
+        caches['default'].clear()
+        formateur = Formateur.objects.create(utilisateur=Utilisateur.objects.create_user(
+            'formateur', 'formateur@example.com', 'x', nom='Formateur', prenom='Test'
+        ))
+        self.course = Cours.objects.create(
+            titre='Cours', description='Description', contenu='Contenu', formateur=formateur,
+            duree_minutes=30, niveau='debutant', categorie='Test', mots_cles='test', publie=True
+        )
+        self.url = reverse('courses:detail', args=[self.course.id])
+
+    def view(self, address):
+        with mock.patch.object(views, 'render', return_value=HttpResponse()) as render, \
+                mock.patch.object(views.course_views, '_flush_interval', 3600):
+            self.client.get(self.url, REMOTE_ADDR=address)
+        return render.call_args.args[2]['course'].nb_vues
+
+    def test_anonymous_views_are_counted_once_per_address(self):
+        self.assertEqual(self.view('10.0.0.1'), 1)
+        self.assertEqual(self.view('10.0.0.1'), 1)
+        self.assertEqual(self.view('10.0.0.2'), 2)
 
-# Create your tests here.
+        views.course_views.flush()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.nb_vues, 2)
@@ -4,6 +4,10 @@ from django.contrib import messages
 from django.db.models import Q, Avg
 from .models import Cours, RessourceCours, ProgressionCours, CommentaireCours
 from users.models import Formateur, Apprenant
+from training_management.view_counts import ViewCounter
+
+
+course_views = ViewCounter(Cours)
 
 
 def courses_list(request):
@@ -50,6 +54,10 @@ def course_detail(request, course_id):
     user_enrolled = False
     user_progress = None
     
+    # Count the view, written to the database in batches
+    course_views.record(request, course)
+    course.nb_vues = course_views.count(course)
+    
     if request.user.is_authenticated:
         try:
             apprenant = Apprenant.objects.get(utilisateur=request.user)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MessagingConfig(AppConfig):
     name = 'messaging'
+    
+    def ready(self):
+        """Connect signal handlers when app is ready"""
+        import messaging.signals
@@ -0,0 +1,286 @@
+"""
+Conversation summaries of private messages
+Each pair of users has one Conversation row holding its last message and the
+unread count of both sides, updated in the same transaction as the messages,
+so the inbox is a single indexed query whatever the number of contacts
+"""
+
+from datetime import datetime
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Conversation, Message
+
+
+PREVIEW_LENGTH = Conversation._meta.get_field('apercu').max_length
+
+
+def conversation_lookup(user_id, other_user_id):
+    first_id, second_id = sorted([user_id, other_user_id])
+    return {'premier_utilisateur_id': first_id, 'second_utilisateur_id': second_id}
+
+
+def unread_field(lookup, user_id):
+    """Unread counter of ``user_id`` in the conversation matching ``lookup``"""
+    if lookup['premier_utilisateur_id'] == user_id:
+        return 'non_lus_premier'
+    return 'non_lus_second'
+
+
+def preview(content):
+    content = ' '.join((content or '').split())
+    if len(content) <= PREVIEW_LENGTH:
+        return content
+    return content[:PREVIEW_LENGTH - 1] + '…'
+
+
+def older_than(message):
+    """Conversations whose last message comes before ``message``"""
+    return (
+        Q(date_dernier_message__lt=message.date_envoi) |
+        Q(date_dernier_message=message.date_envoi, dernier_message_id__lt=message.id) |
+        Q(date_dernier_message=message.date_envoi, dernier_message__isnull=True)
+    )
+
+
+def record_message(message):
+    """
+    Count a new message unread for its recipient, and make it the last of its
+    conversation unless a later message was recorded first
+    """
+    lookup = conversation_lookup(message.expediteur_id, message.destinataire_id)
+    counter = unread_field(lookup, message.destinataire_id)
+    unread = 0 if message.lu else 1
+    values = {
+        'dernier_message_id': message.id,
+        'date_dernier_message': message.date_envoi,
+        'apercu': preview(message.contenu),
+    }
+
+    with transaction.atomic():
+        if not Conversation.objects.filter(**lookup).update(**{counter: F(counter) + unread}):
+            try:
+                with transaction.atomic():
+                    Conversation.objects.create(**lookup, **values, **{counter: unread})
+                return
+            except IntegrityError:
+                # The first message of the pair was recorded concurrently
+                Conversation.objects.filter(**lookup).update(**{counter: F(counter) + unread})
+
+        Conversation.objects.filter(older_than(message), **lookup).update(**values)
+
+
+def mark_conversation_read(reader, partner):
+    """Mark every message from ``partner`` to ``reader`` as read, with the conversation counter"""
+    lookup = conversation_lookup(reader.id, partner.id)
+    with transaction.atomic():
+        read = Message.objects.filter(
+            expediteur=partner, destinataire=reader, lu=False
+        ).update(lu=True, date_lecture=timezone.now())
+        if read:
+            # Messages arriving meanwhile stay counted
+            counter = unread_field(lookup, reader.id)
+            Conversation.objects.filter(**lookup).update(**{counter: Greatest(F(counter) - read, Value(0))})
+    return read
+
+
+def mark_message_read(message):
+    """Save ``message`` as read and take it off its conversation's unread counter"""
+    lookup = conversation_lookup(message.expediteur_id, message.destinataire_id)
+    counter = unread_field(lookup, message.destinataire_id)
+    with transaction.atomic():
+        # Only the request that marks it read takes it off the counter
+        read = Message.objects.filter(pk=message.pk, lu=False).update(lu=True, date_lecture=timezone.now())
+        if read:
+            Conversation.objects.filter(**lookup, **{f'{counter}__gt': 0}).update(**{counter: F(counter) - 1})
+    message.lu = True
+
+
+def refresh_conversation(user_id, other_user_id):
+    """
+    Recompute an existing conversation from its messages, after messages
+    were deleted; a conversation without messages is removed
+    """
+    lookup = conversation_lookup(user_id, other_user_id)
+    first_id, second_id = lookup['premier_utilisateur_id'], lookup['second_utilisateur_id']
+    messages = Message.objects.filter(
+        Q(expediteur_id=first_id, destinataire_id=second_id) |
+        Q(expediteur_id=second_id, destinataire_id=first_id)
+    )
+
+    last = messages.order_by('-date_envoi', '-id').first()
+    if last is None:
+        Conversation.objects.filter(**lookup).delete()
+        return
+
+    unread = messages.filter(lu=False)
+    Conversation.objects.filter(**lookup).update(
+        dernier_message_id=last.id,
+        date_dernier_message=last.date_envoi,
+        apercu=preview(last.contenu),
+        non_lus_premier=unread.filter(destinataire_id=first_id).count(),
+        non_lus_second=unread.filter(destinataire_id=second_id).count(),
+    )
+
+
+def rebuild_conversations(message_model, conversation_model):
+    """
+    Recreate every conversation from the messages, in one pass over them
+
+    Takes the models as arguments so migrations can pass their historical models.
+    """
+    conversations = {}
+    messages = message_model.objects.order_by('date_envoi', 'id').values(
+        'id', 'expediteur_id', 'destinataire_id', 'contenu', 'date_envoi', 'lu'
+    )
+    for message in messages.iterator(chunk_size=2000):
+        lookup = conversation_lookup(message['expediteur_id'], message['destinataire_id'])
+        key = (lookup['premier_utilisateur_id'], lookup['second_utilisateur_id'])
+        conversation = conversations.setdefault(key, dict(lookup, non_lus_premier=0, non_lus_second=0))
+        conversation.update(
+            dernier_message_id=message['id'],
+            date_dernier_message=message['date_envoi'],
+            apercu=message['contenu'],
+        )
+        if not message['lu']:
+            conversation[unread_field(lookup, message['destinataire_id'])] += 1
+
+    conversation_model.objects.all().delete()
+    conversation_model.objects.bulk_create(
+        [
+            conversation_model(**dict(values, apercu=preview(values['apercu'])))
+            for values in conversations.values()
+        ],
+        batch_size=500
+    )
+    return len(conversations)
+
+
+def parse_cursor(cursor):
+    """(date, id) of a pagination cursor, or None when it is missing or invalid"""
+    try:
+        date, pk = cursor.rsplit('_', 1)
+        date, pk = datetime.fromisoformat(date), int(pk)
+    except (AttributeError, ValueError):
+        return None
+    # Issued cursors carry their UTC offset: a naive date was not issued here
+    return (date, pk) if date.tzinfo is not None else None
+
+
+def format_cursor(date, pk):
+    return f"{date.isoformat()}_{pk}"
+
+
+def inbox_page(user, cursor=None, page_size=20):
+    """
+    One page of a user's conversations, most recent first, after ``cursor``
+
+    Returns:
+        tuple: (conversations, next cursor or None); each conversation has
+        ``partner`` and ``unread_count`` set for ``user``
+    """
+    conversations = Conversation.objects.filter(
+        Q(premier_utilisateur=user) | Q(second_utilisateur=user)
+    ).select_related('premier_utilisateur', 'second_utilisateur')
+
+    position = parse_cursor(cursor)
+    if position is not None:
+        date, conversation_id = position
+        conversations = conversations.filter(
+            Q(date_dernier_message__lt=date) |
+            Q(date_dernier_message=date, id__lt=conversation_id)
+        )
+
+    page = list(conversations.order_by('-date_dernier_message', '-id')[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        last = page[page_size - 1]
+        next_cursor = format_cursor(last.date_dernier_message, last.id)
+    page = page[:page_size]
+
+    for conversation in page:
+        conversation.partner = conversation.partner_of(user)
+        conversation.unread_count = conversation.unread_count_for(user)
+    return page, next_cursor
+
+
+def total_unread(user):
+    """Unread private messages of ``user`` across all conversations"""
+    totals = Conversation.objects.filter(
+        Q(premier_utilisateur=user) | Q(second_utilisateur=user)
+    ).aggregate(
+        premier=Sum('non_lus_premier', filter=Q(premier_utilisateur=user)),
+        second=Sum('non_lus_second', filter=Q(second_utilisateur=user)),
+    )
+    return (totals['premier'] or 0) + (totals['second'] or 0)
+
+
+def _after(queryset, position):
+    date, pk = position
+    return queryset.filter(Q(date_envoi__gt=date) | Q(date_envoi=date, id__gt=pk))
+
+
+def _before(queryset, position):
+    date, pk = position
+    return queryset.filter(Q(date_envoi__lt=date) | Q(date_envoi=date, id__lt=pk))
+
+
+def chat_history(user, other_user, before=None, after=None, limit=50):
+    """
+    Messages between two users on one side of a (date_envoi, id) cursor
+
+    Without cursor the latest messages are returned, with ``before`` the
+    ones just older than it and with ``after`` the ones just newer. Each
+    direction of the pair is a range scan of the sender/recipient index
+    limited to ``limit + 1`` rows, and both are merged here.
+
+    Returns:
+        tuple: (messages in chronological order, whether more messages
+        exist beyond them in the requested direction)
+    """
+    directions = [Message.objects.filter(expediteur=user, destinataire=other_user)]
+    if other_user.id != user.id:
+        directions.append(Message.objects.filter(expediteur=other_user, destinataire=user))
+
+    before, after = parse_cursor(before), parse_cursor(after)
+    newest_first = after is None
+
+    rows = []
+    for queryset in directions:
+        if after is not None:
+            queryset = _after(queryset, after).order_by('date_envoi', 'id')
+        else:
+            if before is not None:
+                queryset = _before(queryset, before)
+            queryset = queryset.order_by('-date_envoi', '-id')
+        rows.extend(queryset[:limit + 1])
+
+    rows.sort(key=lambda message: (message.date_envoi, message.id), reverse=newest_first)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if newest_first:
+        rows.reverse()
+    return rows, has_more
+
+
+def message_cursor(message):
+    return format_cursor(message.date_envoi, message.id)
+
+
+def serialize_chat_message(message, user):
+    local_date = timezone.localtime(message.date_envoi)
+    return {
+        'id': message.id,
+        'contenu': message.contenu,
+        'date_envoi': message.date_envoi.isoformat(),
+        'date': local_date.strftime('%Y-%m-%d'),
+        'heure': local_date.strftime('%H:%M'),
+        'envoye': message.expediteur_id == user.id,
+        'lu': message.lu,
+        'fichier_joint': message.fichier_joint.url if message.fichier_joint else None,
+        'fichier_nom': os.path.basename(message.fichier_joint.name) if message.fichier_joint else None,
+    }
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from messaging.models import DocumentRecherche, FilDiscussion, Message, MessageGroupe, ReponseDiscussion
+from messaging.search import rebuild_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search documents of the discussions, replies and messages'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_search_documents(
+                DocumentRecherche, FilDiscussion, ReponseDiscussion, Message, MessageGroupe
+            )
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} documents'))
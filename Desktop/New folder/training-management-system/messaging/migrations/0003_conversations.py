@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_conversations(apps, schema_editor):
+    from messaging.conversations import rebuild_conversations
+
+    rebuild_conversations(
+        apps.get_model('messaging', 'Message'),
+        apps.get_model('messaging', 'Conversation'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messaging', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_dernier_message', models.DateTimeField()),
+                ('apercu', models.CharField(blank=True, help_text='Début du dernier message', max_length=120)),
+                ('non_lus_premier', models.PositiveIntegerField(default=0, help_text='Messages non lus par le premier utilisateur')),
+                ('non_lus_second', models.PositiveIntegerField(default=0, help_text='Messages non lus par le second utilisateur')),
+                ('dernier_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message')),
+                ('premier_utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_premier', to=settings.AUTH_USER_MODEL)),
+                ('second_utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_second', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Conversation',
+                'verbose_name_plural': 'Conversations',
+                'ordering': ['-date_dernier_message', '-id'],
+                'indexes': [models.Index(fields=['premier_utilisateur', '-date_dernier_message', '-id'], name='messaging_c_premier_4df49a_idx'), models.Index(fields=['second_utilisateur', '-date_dernier_message', '-id'], name='messaging_c_second__ab8a2f_idx')],
+                'unique_together': {('premier_utilisateur', 'second_utilisateur')},
+            },
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_conversations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['expediteur', 'destinataire', 'date_envoi', 'id'], name='messaging_m_expedit_d3389f_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_schema(apps, schema_editor):
+    from messaging.search import create_search_schema
+
+    create_search_schema(schema_editor)
+
+
+def drop_search_schema(apps, schema_editor):
+    from messaging.search import drop_search_schema
+
+    drop_search_schema(schema_editor)
+
+
+def index_documents(apps, schema_editor):
+    from messaging.search import rebuild_search_documents
+
+    rebuild_search_documents(
+        apps.get_model('messaging', 'DocumentRecherche'),
+        apps.get_model('messaging', 'FilDiscussion'),
+        apps.get_model('messaging', 'ReponseDiscussion'),
+        apps.get_model('messaging', 'Message'),
+        apps.get_model('messaging', 'MessageGroupe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messaging', '0004_message_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRecherche',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_contenu', models.CharField(choices=[('discussion', 'Discussion'), ('reponse', 'Réponse de discussion'), ('message', 'Message privé'), ('message_groupe', 'Message de groupe')], max_length=20)),
+                ('objet_id', models.PositiveIntegerField()),
+                ('titre', models.CharField(blank=True, max_length=200)),
+                ('contenu', models.TextField(blank=True)),
+                ('date', models.DateTimeField()),
+                ('auteur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('destinataire', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('discussion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='messaging.fildiscussion')),
+                ('groupe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='messaging.groupechat')),
+            ],
+            options={
+                'verbose_name': 'Document de recherche',
+                'verbose_name_plural': 'Documents de recherche',
+                'indexes': [models.Index(fields=['type_contenu', 'date'], name='messaging_d_type_co_36e610_idx')],
+                'unique_together': {('type_contenu', 'objet_id')},
+            },
+        ),
+        migrations.RunPython(create_search_schema, drop_search_schema),
+        migrations.RunPython(index_documents, migrations.RunPython.noop),
+    ]
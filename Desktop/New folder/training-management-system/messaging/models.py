@@ -21,11 +21,51 @@ class Message(models.Model):
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         ordering = ['-date_envoi']
+        indexes = [
+            # Chat history of a sender/recipient pair, paginated on (date_envoi, id)
+            models.Index(fields=['expediteur', 'destinataire', 'date_envoi', 'id']),
+        ]
     
     def __str__(self):
         return f"De {self.expediteur} à {self.destinataire}: {self.sujet}"
 
 
+class Conversation(models.Model):
+    """Summary of the private messages between two users, for the inbox"""
+    # The user with the lowest id is always premier_utilisateur
+    premier_utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='conversations_premier')
+    second_utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='conversations_second')
+    dernier_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    date_dernier_message = models.DateTimeField()
+    apercu = models.CharField(max_length=120, blank=True, help_text="Début du dernier message")
+    non_lus_premier = models.PositiveIntegerField(default=0, help_text="Messages non lus par le premier utilisateur")
+    non_lus_second = models.PositiveIntegerField(default=0, help_text="Messages non lus par le second utilisateur")
+    
+    class Meta:
+        verbose_name = 'Conversation'
+        verbose_name_plural = 'Conversations'
+        ordering = ['-date_dernier_message', '-id']
+        unique_together = ['premier_utilisateur', 'second_utilisateur']
+        indexes = [
+            # Inbox of either participant, most recent first
+            models.Index(fields=['premier_utilisateur', '-date_dernier_message', '-id']),
+            models.Index(fields=['second_utilisateur', '-date_dernier_message', '-id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.premier_utilisateur} ↔ {self.second_utilisateur}"
+    
+    def partner_of(self, user):
+        if self.premier_utilisateur_id == user.id:
+            return self.second_utilisateur
+        return self.premier_utilisateur
+    
+    def unread_count_for(self, user):
+        if self.premier_utilisateur_id == user.id:
+            return self.non_lus_premier
+        return self.non_lus_second
+
+
 class GroupeChat(models.Model):
     """Group chats"""
     nom = models.CharField(max_length=100)
@@ -107,3 +147,36 @@ class ReponseDiscussion(models.Model):
     
     def __str__(self):
         return f"Réponse à {self.discussion.titre} par {self.auteur}"
+
+
+class DocumentRecherche(models.Model):
+    """Searchable text of a discussion, reply or message, indexed in full text"""
+    TYPE_CHOICES = [
+        ('discussion', 'Discussion'),
+        ('reponse', 'Réponse de discussion'),
+        ('message', 'Message privé'),
+        ('message_groupe', 'Message de groupe'),
+    ]
+    
+    type_contenu = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    objet_id = models.PositiveIntegerField()
+    titre = models.CharField(max_length=200, blank=True)
+    contenu = models.TextField(blank=True)
+    date = models.DateTimeField()
+    auteur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='+')
+    # Visibility: private messages to their two users, group messages to the
+    # group members, discussions and replies to every user
+    destinataire = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    groupe = models.ForeignKey(GroupeChat, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    discussion = models.ForeignKey(FilDiscussion, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    
+    class Meta:
+        verbose_name = 'Document de recherche'
+        verbose_name_plural = 'Documents de recherche'
+        unique_together = ['type_contenu', 'objet_id']
+        indexes = [
+            models.Index(fields=['type_contenu', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_type_contenu_display()} #{self.objet_id}"
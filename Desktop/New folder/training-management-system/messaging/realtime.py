@@ -0,0 +1,202 @@
+"""
+Real-time delivery of private and group messages over Server-Sent Events
+New messages are announced on an in-process pub/sub once their transaction
+commits. Each stream is an async generator: it waits for an announcement,
+or for the polling interval to catch messages saved by other processes, then
+sends every message newer than its cursor. Under ASGI a connected client
+costs a coroutine, not a worker thread; under WSGI or runserver the stream
+is buffered, so the pages fall back to polling when the ``ready`` event does
+not arrive.
+"""
+
+import asyncio
+from datetime import datetime, timezone as dt_timezone
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .conversations import (
+    chat_history,
+    format_cursor,
+    mark_conversation_read,
+    message_cursor,
+    parse_cursor,
+    serialize_chat_message,
+)
+from .models import Message, MessageGroupe
+
+
+class MessageBroker:
+    """In-process publish/subscribe of channel names, safe to publish from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        """Register the running event loop for ``channel``; returns the subscription"""
+        subscription = (channel, asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        channel = subscription[0]
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel):
+        """Wake up every stream subscribed to ``channel``"""
+        with self._lock:
+            subscriptions = list(self._subscribers.get(channel, ()))
+        for _, loop, event in subscriptions:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The loop of a disconnected client is already closed
+                pass
+
+
+broker = MessageBroker()
+
+# Cursor before any message, for streams opened on an empty conversation
+START_CURSOR = format_cursor(datetime(1970, 1, 1, tzinfo=dt_timezone.utc), 0)
+
+
+def chat_channel(user_id, other_user_id):
+    first_id, second_id = sorted([user_id, other_user_id])
+    return f"chat:{first_id}:{second_id}"
+
+
+def group_channel(group_id):
+    return f"group:{group_id}"
+
+
+def format_event(data, event_id=None, event='message'):
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_cursor(request):
+    """Cursor to resume from: ``apres`` or the Last-Event-ID sent by a reconnecting EventSource"""
+    return request.headers.get('Last-Event-ID') or request.GET.get('apres')
+
+
+async def event_stream(channel, load_newer, cursor):
+    """
+    Send the messages returned by ``load_newer(cursor)`` as they arrive
+
+    ``load_newer`` runs in a sync thread and returns the payloads newer than
+    the cursor with the new cursor. It reads, or marks messages read in
+    autocommit, so it runs outside the shared sync thread and streams do not
+    queue behind each other. The stream
+    opens with a ``ready`` event and ends after
+    MESSAGING_STREAM_DURATION seconds; EventSource then reconnects from the
+    last event id, which keeps long-lived connections balanced across workers.
+    """
+    poll_interval = getattr(settings, 'MESSAGING_STREAM_POLL_INTERVAL', 5)
+    duration = getattr(settings, 'MESSAGING_STREAM_DURATION', 300)
+    load_newer = sync_to_async(load_newer, thread_sensitive=False)
+
+    subscription = broker.subscribe(channel)
+    _, loop, announced = subscription
+    deadline = loop.time() + duration
+    try:
+        yield f"retry: {poll_interval * 1000}\n" + format_event({}, event='ready')
+        while loop.time() < deadline:
+            # Cleared before loading, so a message committed meanwhile wakes the next wait
+            announced.clear()
+            payloads, cursor = await load_newer(cursor)
+            for payload in payloads:
+                yield format_event(payload, event_id=payload['cursor'])
+            if payloads:
+                continue
+
+            try:
+                await asyncio.wait_for(announced.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def chat_loader(user, other_user, limit=50):
+    """``load_newer`` of a private chat stream, marking the delivered messages as read"""
+    def load_newer(cursor):
+        if parse_cursor(cursor) is None:
+            # New stream: start after the latest message
+            latest, _ = chat_history(user, other_user, limit=1)
+            return [], message_cursor(latest[-1]) if latest else START_CURSOR
+
+        messages, _ = chat_history(user, other_user, after=cursor, limit=limit)
+        if not messages:
+            return [], cursor
+
+        if any(message.destinataire_id == user.id and not message.lu for message in messages):
+            mark_conversation_read(user, other_user)
+        payloads = [
+            dict(serialize_chat_message(message, user), cursor=message_cursor(message))
+            for message in messages
+        ]
+        return payloads, message_cursor(messages[-1])
+
+    return load_newer
+
+
+def serialize_group_message(message, user):
+    local_date = timezone.localtime(message.date_envoi)
+    return {
+        'id': message.id,
+        'contenu': message.contenu,
+        'date_envoi': message.date_envoi.isoformat(),
+        'date': local_date.strftime('%Y-%m-%d'),
+        'heure': local_date.strftime('%H:%M'),
+        'envoye': message.auteur_id == user.id,
+        'auteur': message.auteur.get_full_name() or message.auteur.username,
+    }
+
+
+def group_loader(group, user, limit=50):
+    """``load_newer`` of a group chat stream"""
+    def load_newer(cursor):
+        messages = MessageGroupe.objects.filter(groupe=group).select_related('auteur')
+        position = parse_cursor(cursor)
+        if position is None:
+            latest = messages.order_by('-date_envoi', '-id').first()
+            return [], message_cursor(latest) if latest else START_CURSOR
+
+        date, pk = position
+        messages = list(
+            messages.filter(Q(date_envoi__gt=date) | Q(date_envoi=date, id__gt=pk))
+            .order_by('date_envoi', 'id')[:limit]
+        )
+        if not messages:
+            return [], cursor
+
+        payloads = [
+            dict(serialize_group_message(message, user), cursor=message_cursor(message))
+            for message in messages
+        ]
+        return payloads, message_cursor(messages[-1])
+
+    return load_newer
+
+
+def announce_message(message):
+    """Publish a new private or group message once its transaction commits"""
+    if isinstance(message, Message):
+        broker.publish(chat_channel(message.expediteur_id, message.destinataire_id))
+    elif isinstance(message, MessageGroupe):
+        broker.publish(group_channel(message.groupe_id))
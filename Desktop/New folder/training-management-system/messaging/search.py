@@ -0,0 +1,346 @@
+"""
+Full-text search of discussions, replies, private and group messages
+Every searchable object has a DocumentRecherche row kept up to date by
+signals. On SQLite the rows are indexed by an FTS5 table that triggers keep
+in sync, on PostgreSQL by a GIN index on their tsvector; both backends rank
+the matches in the database and only load the requested page.
+"""
+
+import re
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .conversations import preview
+from .models import DocumentRecherche, GroupeChat
+
+
+DISCUSSION = 'discussion'
+REPONSE = 'reponse'
+MESSAGE = 'message'
+MESSAGE_GROUPE = 'message_groupe'
+
+DOCUMENT_TABLE = DocumentRecherche._meta.db_table
+FTS_TABLE = f'{DOCUMENT_TABLE}_fts'
+
+SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        titre, contenu,
+        content='{DOCUMENT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, titre, contenu) VALUES (new.id, new.titre, new.contenu);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, titre, contenu)
+        VALUES ('delete', old.id, old.titre, old.contenu);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF titre, contenu ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, titre, contenu)
+        VALUES ('delete', old.id, old.titre, old.contenu);
+        INSERT INTO {FTS_TABLE}(rowid, titre, contenu) VALUES (new.id, new.titre, new.contenu);
+    END
+    """,
+]
+
+# Titles weigh more than contents; queries must use this exact expression for
+# PostgreSQL to use the index
+POSTGRES_VECTOR = (
+    "(setweight(to_tsvector('french', titre), 'A') || "
+    "setweight(to_tsvector('french', contenu), 'B'))"
+)
+POSTGRES_INDEX = f'{DOCUMENT_TABLE}_tsv'
+
+# Snippet delimiters, replaced by <mark> once the snippet is escaped
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+TERM_PATTERN = re.compile(r'\w+')
+MAX_TERMS = 10
+
+
+def create_search_schema(schema_editor):
+    """Create the full-text index of the documents for the database in use"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_SCHEMA:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX {POSTGRES_INDEX} ON {DOCUMENT_TABLE} USING GIN ({POSTGRES_VECTOR})"
+        )
+
+
+def drop_search_schema(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {POSTGRES_INDEX}")
+
+
+def _discussion_values(discussion):
+    return {
+        'titre': discussion.titre,
+        'contenu': discussion.contenu,
+        'date': discussion.date_creation,
+        'auteur_id': discussion.auteur_id,
+        'discussion_id': discussion.id,
+    }
+
+
+def _reply_values(reply):
+    return {
+        'contenu': reply.contenu,
+        'date': reply.date_creation,
+        'auteur_id': reply.auteur_id,
+        'discussion_id': reply.discussion_id,
+    }
+
+
+def _message_values(message):
+    return {
+        'titre': message.sujet,
+        'contenu': message.contenu,
+        'date': message.date_envoi,
+        'auteur_id': message.expediteur_id,
+        'destinataire_id': message.destinataire_id,
+    }
+
+
+def _group_message_values(message):
+    return {
+        'contenu': message.contenu,
+        'date': message.date_envoi,
+        'auteur_id': message.auteur_id,
+        'groupe_id': message.groupe_id,
+    }
+
+
+# Indexed models: document type, fields the document is built from, builder
+INDEXED_MODELS = {
+    'messaging.FilDiscussion': (DISCUSSION, ['titre', 'contenu', 'date_creation', 'auteur'], _discussion_values),
+    'messaging.ReponseDiscussion': (REPONSE, ['contenu', 'date_creation', 'auteur', 'discussion'], _reply_values),
+    'messaging.Message': (MESSAGE, ['sujet', 'contenu', 'date_envoi', 'expediteur', 'destinataire'], _message_values),
+    'messaging.MessageGroupe': (MESSAGE_GROUPE, ['contenu', 'date_envoi', 'auteur', 'groupe'], _group_message_values),
+}
+
+
+def document_values(instance):
+    """Document type and field values of an indexed object"""
+    document_type, _, build = INDEXED_MODELS[instance._meta.label]
+    values = {'titre': '', 'destinataire_id': None, 'groupe_id': None, 'discussion_id': None}
+    values.update(build(instance))
+    return document_type, values
+
+
+def index_object(instance, created=False, update_fields=None):
+    """Create or refresh the search document of a saved object"""
+    fields = INDEXED_MODELS[instance._meta.label][1]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+
+    document_type, values = document_values(instance)
+    lookup = {'type_contenu': document_type, 'objet_id': instance.pk}
+    documents = DocumentRecherche.objects.filter(**lookup)
+
+    if not created:
+        # Only rewritten when a value changed, so saves of other fields
+        # (read flags, view counts) do not touch the full-text index
+        if documents.exclude(**values).update(**values) or documents.exists():
+            return
+
+    try:
+        with transaction.atomic():
+            DocumentRecherche.objects.create(**lookup, **values)
+    except IntegrityError:
+        # Indexed concurrently
+        documents.update(**values)
+
+
+def unindex_object(instance):
+    document_type = INDEXED_MODELS[instance._meta.label][0]
+    DocumentRecherche.objects.filter(type_contenu=document_type, objet_id=instance.pk).delete()
+
+
+def rebuild_search_documents(document_model, *source_models):
+    """
+    Recreate the search documents of every object of ``source_models``
+
+    Takes the models as arguments so migrations can pass their historical models.
+    """
+    document_model.objects.all().delete()
+    count = 0
+    for model in source_models:
+        batch = []
+        for instance in model.objects.order_by('pk').iterator(chunk_size=2000):
+            document_type, values = document_values(instance)
+            batch.append(document_model(type_contenu=document_type, objet_id=instance.pk, **values))
+            if len(batch) >= 1000:
+                document_model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        document_model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def search_terms(query):
+    return TERM_PATTERN.findall((query or '').lower())[:MAX_TERMS]
+
+
+def visible_documents(user, types=None):
+    """Documents ``user`` may read: every discussion and reply, their own messages and groups"""
+    groups = GroupeChat.objects.filter(Q(createur=user) | Q(membres=user)).values('id')
+    documents = DocumentRecherche.objects.filter(
+        Q(type_contenu__in=[DISCUSSION, REPONSE]) |
+        Q(type_contenu=MESSAGE, auteur=user) |
+        Q(type_contenu=MESSAGE, destinataire=user) |
+        Q(type_contenu=MESSAGE_GROUPE, groupe__in=groups)
+    )
+    if types:
+        documents = documents.filter(type_contenu__in=types)
+    return documents
+
+
+_fts_table_exists = None
+
+
+def _fts_available():
+    # SQLite builds without FTS5 skip the table and search without ranking
+    global _fts_table_exists
+    if _fts_table_exists is None:
+        _fts_table_exists = FTS_TABLE in connection.introspection.table_names()
+    return _fts_table_exists
+
+
+def _ranked_rows(terms, visible, limit, offset):
+    """(document id, snippet) of the matches, best first"""
+    # The visibility conditions are checked on each match rather than through
+    # a subquery listing every document the user can read
+    query = visible.query
+    visible_sql, visible_params = query.get_compiler(connection=connection).compile(query.where)
+    table = connection.ops.quote_name(DOCUMENT_TABLE)
+
+    if connection.vendor == 'postgresql':
+        sql = f"""
+            SELECT {table}.id, ts_headline('french', {table}.contenu, q, %s)
+            FROM {table}, to_tsquery('french', %s) q
+            WHERE {POSTGRES_VECTOR} @@ q AND {visible_sql}
+            ORDER BY ts_rank({POSTGRES_VECTOR}, q) DESC, {table}.date DESC
+            LIMIT %s OFFSET %s
+        """
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=10'
+        params = [options, ' & '.join(f'{term}:*' for term in terms), *visible_params, limit, offset]
+    else:
+        sql = f"""
+            SELECT {table}.id, snippet({FTS_TABLE}, 1, %s, %s, '…', 24)
+            FROM {FTS_TABLE} JOIN {table} ON {table}.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND {visible_sql}
+            ORDER BY bm25({FTS_TABLE}, 5.0, 1.0), {table}.date DESC
+            LIMIT %s OFFSET %s
+        """
+        match = ' '.join(f'"{term}"*' for term in terms)
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, match, *visible_params, limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _unranked_rows(terms, visible, limit, offset):
+    # Databases without a full-text index: every term in the title or the content
+    for term in terms:
+        visible = visible.filter(Q(titre__icontains=term) | Q(contenu__icontains=term))
+    rows = visible.order_by('-date', '-id').values_list('id', 'contenu')[offset:offset + limit]
+    return [(pk, preview(content)) for pk, content in rows]
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+class SearchResult:
+    """A matching document with its link, title and highlighted excerpt for ``user``"""
+
+    def __init__(self, document, snippet, user):
+        self.document = document
+        self.type = document.type_contenu
+        self.date = document.date
+        self.auteur = document.auteur
+        self.extrait = highlight(snippet)
+
+        if self.type == DISCUSSION:
+            self.titre = document.titre
+            self.url = reverse('messaging:discussion_detail', args=[document.discussion_id])
+        elif self.type == REPONSE:
+            self.titre = f"Re : {document.discussion.titre}"
+            self.url = reverse('messaging:discussion_detail', args=[document.discussion_id])
+        elif self.type == MESSAGE:
+            partner = document.destinataire if document.auteur_id == user.id else document.auteur
+            self.titre = document.titre or f"Conversation avec {partner}"
+            self.url = reverse('messaging:chat_conversation', args=[partner.id])
+        else:
+            self.titre = document.groupe.nom
+            self.url = reverse('messaging:group_detail', args=[document.groupe_id])
+
+
+class SearchPage:
+    """One page of ranked search results"""
+
+    def __init__(self, results, number, has_next):
+        self.results = results
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = number > 1
+        self.next_page_number = number + 1
+        self.previous_page_number = number - 1
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def search(user, query, types=None, page=1, page_size=20):
+    """
+    Ranked page of the documents visible to ``user`` containing every term of ``query``
+
+    Terms match as prefixes; ``types`` restricts the document types searched.
+    """
+    terms = search_terms(query)
+    page = max(page, 1)
+    if not terms:
+        return SearchPage([], page, False)
+
+    visible = visible_documents(user, types)
+    offset = (page - 1) * page_size
+    if connection.vendor == 'postgresql' or (connection.vendor == 'sqlite' and _fts_available()):
+        rows = _ranked_rows(terms, visible, page_size + 1, offset)
+    else:
+        rows = _unranked_rows(terms, visible, page_size + 1, offset)
+
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    documents = DocumentRecherche.objects.select_related(
+        'auteur', 'destinataire', 'groupe', 'discussion'
+    ).in_bulk([pk for pk, _ in rows])
+    results = [
+        SearchResult(documents[pk], snippet or '', user)
+        for pk, snippet in rows if pk in documents
+    ]
+    return SearchPage(results, page, has_next)
@@ -0,0 +1,51 @@
+"""
+Signal handlers keeping the conversation summaries, the real-time streams and
+the search index in step with messages and discussions
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .conversations import record_message, refresh_conversation
+from .models import FilDiscussion, Message, MessageGroupe, ReponseDiscussion
+from .realtime import announce_message
+from .search import index_object, unindex_object
+
+
+@receiver(post_save, sender=Message)
+def update_conversation(sender, instance, created, **kwargs):
+    """Record a new private message in its conversation"""
+    if created:
+        record_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def refresh_conversation_after_delete(sender, instance, **kwargs):
+    """Recompute the conversation of a deleted message"""
+    refresh_conversation(instance.expediteur_id, instance.destinataire_id)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=MessageGroupe)
+def announce_new_message(sender, instance, created, **kwargs):
+    """Wake up the streams of the conversation once the message is committed"""
+    if created:
+        transaction.on_commit(lambda: announce_message(instance))
+
+
+@receiver(post_save, sender=FilDiscussion)
+@receiver(post_save, sender=ReponseDiscussion)
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=MessageGroupe)
+def update_search_document(sender, instance, created, update_fields=None, **kwargs):
+    """Index a new or edited searchable object"""
+    index_object(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=FilDiscussion)
+@receiver(post_delete, sender=ReponseDiscussion)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=MessageGroupe)
+def delete_search_document(sender, instance, **kwargs):
+    unindex_object(instance)
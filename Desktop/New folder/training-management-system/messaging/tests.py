@@ -1,3 +1,634 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from formations.models import Formation
+from moderation.engine import bump_rules_version
+from moderation.models import ContentModerationReport, ContentModerationRule
+from moderation.services import AIContentModerator
+from training_management.test_runner import FlushCountersMixin
+from training_management.view_counts import ViewCounter
+from users.models import Utilisateur
+
+from . import search as search_module, views
+from .conversations import (
+    chat_history,
+    conversation_lookup,
+    inbox_page,
+    mark_conversation_read,
+    mark_message_read,
+    message_cursor,
+    rebuild_conversations,
+    total_unread,
+)
+from .models import Conversation, FilDiscussion, GroupeChat, Message, MessageGroupe, ReponseDiscussion
+from .realtime import (
+    MessageBroker,
+    chat_channel,
+    chat_loader,
+    event_stream,
+    group_channel,
+    group_loader,
+    stream_cursor,
+)
+from .search import MESSAGE, MESSAGE_GROUPE, search
+
+
+class ConversationTests(FlushCountersMixin, TestCase):
+    """The conversation summary agrees with its messages whatever the order they are recorded in"""
+
+    def setUp(self):
+        self.sender = Utilisateur.objects.create_user(
+            'expediteur', 'expediteur@example.com', 'x', nom='Expediteur', prenom='Test'
+        )
+        self.recipient = Utilisateur.objects.create_user(
+            'destinataire', 'destinataire@example.com', 'x', nom='Destinataire', prenom='Test'
+        )
+
+    def send(self, contenu, date_envoi=None):
+        return Message.objects.create(
+            expediteur=self.sender, destinataire=self.recipient, sujet='Sujet',
+            contenu=contenu, date_envoi=date_envoi or timezone.now()
+        )
+
+    def conversation(self):
+        return Conversation.objects.get(**conversation_lookup(self.sender.id, self.recipient.id))
+
+    def test_late_older_message_keeps_last_message(self):
+        now = timezone.now()
+        latest = self.send('Dernier', now)
+        self.send('Premier', now - timedelta(minutes=1))
+
+        conversation = self.conversation()
+        self.assertEqual(conversation.dernier_message_id, latest.id)
+        self.assertEqual(conversation.date_dernier_message, latest.date_envoi)
+        self.assertEqual(conversation.apercu, 'Dernier')
+        self.assertEqual(conversation.unread_count_for(self.recipient), 2)
+
+    def test_same_date_orders_by_id(self):
+        now = timezone.now()
+        self.send('Premier', now)
+        second = self.send('Second', now)
+        self.assertEqual(self.conversation().dernier_message_id, second.id)
+
+    def test_mark_read_keeps_messages_counted_meanwhile(self):
+        self.send('Un')
+        self.send('Deux')
+        # A message recorded between the read update and the counter update
+        Conversation.objects.update(non_lus_premier=3, non_lus_second=3)
+
+        self.assertEqual(mark_conversation_read(self.recipient, self.sender), 2)
+        self.assertEqual(self.conversation().unread_count_for(self.recipient), 1)
+
+    def test_mark_read_floors_counter_at_zero(self):
+        self.send('Un')
+        self.send('Deux')
+        Conversation.objects.update(non_lus_premier=1, non_lus_second=1)
+
+        mark_conversation_read(self.recipient, self.sender)
+        self.assertEqual(self.conversation().unread_count_for(self.recipient), 0)
+
+    def test_unread_counts_after_reading(self):
+        first, _, _ = [self.send(contenu) for contenu in ['Un', 'Deux', 'Trois']]
+        Message.objects.create(
+            expediteur=self.recipient, destinataire=self.sender, sujet='Sujet', contenu='Réponse'
+        )
+        stale = Message.objects.get(pk=first.pk)
+
+        mark_message_read(first)
+        self.assertEqual(self.conversation().unread_count_for(self.recipient), 2)
+        # A second request for the same message, loaded before the first one saved
+        mark_message_read(stale)
+        self.assertEqual(self.conversation().unread_count_for(self.recipient), 2)
+        self.assertIsNotNone(Message.objects.get(pk=first.pk).date_lecture)
+
+        self.assertEqual(mark_conversation_read(self.recipient, self.sender), 2)
+        self.assertEqual(self.conversation().unread_count_for(self.recipient), 0)
+        self.assertEqual(self.conversation().unread_count_for(self.sender), 1)
+        self.assertEqual((total_unread(self.recipient), total_unread(self.sender)), (0, 1))
+
+    def test_deleting_latest_message_restores_previous(self):
+        now = timezone.now()
+        first = self.send('Premier', now - timedelta(minutes=1))
+        latest = self.send('Dernier', now)
+
+        latest.delete()
+        conversation = self.conversation()
+        self.assertEqual((conversation.dernier_message_id, conversation.apercu), (first.id, 'Premier'))
+        self.assertEqual(conversation.date_dernier_message, first.date_envoi)
+        self.assertEqual(conversation.unread_count_for(self.recipient), 1)
+
+        first.delete()
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_rebuild_reproduces_incremental_rows(self):
+        other = Utilisateur.objects.create_user('autre', 'autre@example.com', 'x', nom='Autre', prenom='Test')
+        now = timezone.now()
+        for sender, recipient, contenu, minutes in [
+            (self.sender, self.recipient, 'Un', 3),
+            (self.recipient, self.sender, 'Deux', 2),
+            (self.sender, self.recipient, 'Trois ' * 40, 2),
+            (other, self.recipient, 'Quatre', 1),
+            (self.recipient, other, 'Cinq', 0),
+            (self.sender, self.sender, 'Note', 0),
+        ]:
+            Message.objects.create(
+                expediteur=sender, destinataire=recipient, sujet='Sujet', contenu=contenu,
+                date_envoi=now - timedelta(minutes=minutes)
+            )
+        mark_message_read(Message.objects.get(contenu='Un'))
+        mark_conversation_read(other, self.recipient)
+        Message.objects.get(contenu='Quatre').delete()
+
+        fields = [
+            'premier_utilisateur_id', 'second_utilisateur_id', 'dernier_message_id',
+            'date_dernier_message', 'apercu', 'non_lus_premier', 'non_lus_second',
+        ]
+        conversations = Conversation.objects.order_by('premier_utilisateur_id', 'second_utilisateur_id')
+        incremental = list(conversations.values(*fields))
+
+        self.assertEqual(rebuild_conversations(Message, Conversation), 3)
+        self.assertEqual(list(conversations.values(*fields)), incremental)
+
+
+INVALID_CURSORS = [
+    '', 'nimporte', '_12', '2024-01-01T10:00:00+00:00_x', '2024-13-01T10:00:00+00:00_1',
+    # Naive dates are not cursors the views issue
+    '2024-01-01T10:00:00_1',
+]
+
+
+class ChatHistoryTests(FlushCountersMixin, TestCase):
+    """Keyset pages of a chat neither skip nor repeat messages sent at the same instant"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            Utilisateur.objects.create_user(name, f'{name}@example.com', 'x', nom=name.title(), prenom='Test')
+            for name in ['alice', 'bob']
+        ]
+        start = timezone.now() - timedelta(hours=1)
+        # Three messages share the second instant, across any page of two
+        offsets = [0, 1, 1, 1, 2, 2, 3]
+        cls.messages = [
+            Message.objects.create(
+                expediteur=sender, destinataire=recipient, sujet='Sujet', contenu=f'Message {number}',
+                date_envoi=start + timedelta(minutes=offset)
+            )
+            for number, (offset, (sender, recipient)) in enumerate(
+                zip(offsets, [(cls.alice, cls.bob), (cls.bob, cls.alice)] * 4)
+            )
+        ]
+        cls.ids = [message.id for message in cls.messages]
+
+    def ids_of(self, messages):
+        return [message.id for message in messages]
+
+    def test_backward_pages_cover_every_message_once(self):
+        pages = []
+        page, has_more = chat_history(self.alice, self.bob, limit=2)
+        pages.append(self.ids_of(page))
+        while has_more:
+            page, has_more = chat_history(self.alice, self.bob, before=message_cursor(page[0]), limit=2)
+            pages.append(self.ids_of(page))
+
+        self.assertEqual([pk for page in reversed(pages) for pk in page], self.ids)
+        self.assertEqual(pages[-1], self.ids[:1])
+
+    def test_forward_pages_cover_every_message_once(self):
+        collected = []
+        cursor = message_cursor(self.messages[0])
+        has_more = True
+        while has_more:
+            page, has_more = chat_history(self.bob, self.alice, after=cursor, limit=2)
+            collected.extend(self.ids_of(page))
+            cursor = message_cursor(page[-1])
+
+        self.assertEqual(collected, self.ids[1:])
+
+    def test_has_more_at_exact_boundary(self):
+        self.assertEqual(chat_history(self.alice, self.bob, limit=7), (self.messages, False))
+        self.assertTrue(chat_history(self.alice, self.bob, limit=6)[1])
+
+        before_second = message_cursor(self.messages[1])
+        self.assertEqual(
+            chat_history(self.alice, self.bob, before=before_second, limit=1), (self.messages[:1], False)
+        )
+        after_sixth = message_cursor(self.messages[5])
+        self.assertEqual(
+            chat_history(self.alice, self.bob, after=after_sixth, limit=1), (self.messages[6:], False)
+        )
+
+    def test_invalid_cursors_return_latest_page(self):
+        latest = chat_history(self.alice, self.bob, limit=3)
+        for cursor in INVALID_CURSORS:
+            self.assertEqual(chat_history(self.alice, self.bob, before=cursor, limit=3), latest, cursor)
+            self.assertEqual(chat_history(self.alice, self.bob, after=cursor, limit=3), latest, cursor)
+
+    def test_view_pages_with_cursors(self):
+        self.client.force_login(self.alice)
+        url = reverse('messaging:chat_messages', args=[self.bob.id])
+
+        collected = []
+        with mock.patch.object(views, 'CHAT_PAGE_SIZE', 3):
+            data = self.client.get(url).json()
+            collected[:0] = [message['id'] for message in data['messages']]
+            while data['has_more']:
+                data = self.client.get(url, {'avant': data['older_cursor']}).json()
+                collected[:0] = [message['id'] for message in data['messages']]
+            self.assertEqual(collected, self.ids)
+
+            latest = self.client.get(url).json()
+            self.assertEqual(self.client.get(url, {'avant': 'nimporte'}).json(), latest)
+            newer = self.client.get(url, {'apres': latest['newer_cursor']}).json()
+        self.assertEqual(newer, {'messages': [], 'has_more': False})
+        self.assertFalse(Message.objects.filter(destinataire=self.alice, lu=False).exists())
+
+
+class InboxPageTests(FlushCountersMixin, TestCase):
+    """Inbox pages follow the last message date, then the conversation id"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Utilisateur.objects.create_user(
+            'lecteur', 'lecteur@example.com', 'x', nom='Lecteur', prenom='Test'
+        )
+        now = timezone.now()
+        for number, minutes in enumerate([0, 5, 5, 5, 10]):
+            partner = Utilisateur.objects.create_user(
+                f'contact{number}', f'contact{number}@example.com', 'x', nom='Contact', prenom='Test'
+            )
+            Message.objects.create(
+                expediteur=partner, destinataire=cls.user, sujet='Sujet', contenu='Bonjour',
+                date_envoi=now - timedelta(minutes=minutes)
+            )
+        cls.expected = list(
+            Conversation.objects.order_by('-date_dernier_message', '-id').values_list('id', flat=True)
+        )
+
+    def walk(self, page_size):
+        pages = []
+        page, cursor = inbox_page(self.user, page_size=page_size)
+        pages.append([conversation.id for conversation in page])
+        while cursor:
+            page, cursor = inbox_page(self.user, cursor, page_size=page_size)
+            pages.append([conversation.id for conversation in page])
+        return pages
+
+    def test_pages_cover_every_conversation_once(self):
+        pages = self.walk(2)
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+
+    def test_no_cursor_after_exact_last_page(self):
+        self.assertEqual(self.walk(5), [self.expected])
+        page, cursor = inbox_page(self.user, page_size=5)
+        self.assertIsNone(cursor)
+        self.assertEqual(page[0].unread_count, 1)
+
+    def test_invalid_cursors_return_first_page(self):
+        first = [conversation.id for conversation in inbox_page(self.user, page_size=2)[0]]
+        for cursor in INVALID_CURSORS:
+            page, _ = inbox_page(self.user, cursor, page_size=2)
+            self.assertEqual([conversation.id for conversation in page], first, cursor)
+
+
+class SearchVisibilityTests(FlushCountersMixin, TestCase):
+    """Search only returns the private and group messages the user may read"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = [
+            Utilisateur.objects.create_user(name, f'{name}@example.com', 'x', nom=name.title(), prenom='Test')
+            for name in ['alice', 'bob', 'carol']
+        ]
+        cls.alice_group = GroupeChat.objects.create(nom='Groupe A', createur=cls.carol)
+        cls.alice_group.membres.add(cls.alice)
+        cls.other_group = GroupeChat.objects.create(nom='Groupe B', createur=cls.carol)
+        cls.other_group.membres.add(cls.bob)
+
+        for sender, recipient, contenu in [
+            (cls.alice, cls.bob, 'planning envoyé par alice'),
+            (cls.bob, cls.alice, 'planning reçu par alice'),
+            (cls.carol, cls.bob, 'planning entre carol et bob'),
+        ]:
+            Message.objects.create(expediteur=sender, destinataire=recipient, sujet='Planning', contenu=contenu)
+        MessageGroupe.objects.create(groupe=cls.alice_group, auteur=cls.carol, contenu='planning du groupe A')
+        MessageGroupe.objects.create(groupe=cls.other_group, auteur=cls.bob, contenu='planning du groupe B')
+
+    def found(self, user):
+        page = search(user, 'planning', types=[MESSAGE, MESSAGE_GROUPE])
+        return sorted(result.document.contenu for result in page)
+
+    def assertVisibility(self):
+        self.assertEqual(self.found(self.alice), [
+            'planning du groupe A', 'planning envoyé par alice', 'planning reçu par alice',
+        ])
+        self.assertEqual(self.found(self.carol), [
+            'planning du groupe A', 'planning du groupe B', 'planning entre carol et bob',
+        ])
+
+        self.alice_group.membres.remove(self.alice)
+        self.assertNotIn('planning du groupe A', self.found(self.alice))
+
+    def test_ranked_search(self):
+        if not search_module._fts_available():
+            self.skipTest('SQLite is built without FTS5')
+        self.assertVisibility()
+
+    def test_unranked_search(self):
+        with mock.patch.object(search_module, '_fts_available', return_value=False):
+            self.assertVisibility()
+
+
+class GroupPollingTests(FlushCountersMixin, TestCase):
+    """Group messages can be polled when Server-Sent Events are unavailable"""
+
+    def setUp(self):
+        self.member = Utilisateur.objects.create_user(
+            'membre', 'membre@example.com', 'x', nom='Membre', prenom='Test'
+        )
+        self.outsider = Utilisateur.objects.create_user(
+            'externe', 'externe@example.com', 'x', nom='Externe', prenom='Test'
+        )
+        self.group = GroupeChat.objects.create(nom='Groupe', createur=self.member)
+        self.url = reverse('messaging:group_messages', args=[self.group.id])
+
+    def test_returns_messages_after_cursor(self):
+        self.client.force_login(self.member)
+        cursor = self.client.get(self.url).json()['newer_cursor']
+        MessageGroupe.objects.create(groupe=self.group, auteur=self.member, contenu='Bonjour')
+
+        data = self.client.get(self.url, {'apres': cursor}).json()
+        self.assertEqual([message['contenu'] for message in data['messages']], ['Bonjour'])
+        self.assertNotEqual(data['newer_cursor'], cursor)
+        self.assertEqual(self.client.get(self.url, {'apres': data['newer_cursor']}).json()['messages'], [])
+
+    def test_non_member_is_refused(self):
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        stream_url = reverse('messaging:group_stream', args=[self.group.id])
+        self.assertEqual(self.client.get(stream_url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(stream_url).status_code, 401)
+
+    def test_has_more_at_page_boundary(self):
+        self.client.force_login(self.member)
+        cursor = self.client.get(self.url).json()['newer_cursor']
+        for number in range(3):
+            MessageGroupe.objects.create(groupe=self.group, auteur=self.member, contenu=f'Message {number}')
+
+        with mock.patch.object(views, 'CHAT_PAGE_SIZE', 2):
+            first = self.client.get(self.url, {'apres': cursor}).json()
+            second = self.client.get(self.url, {'apres': first['newer_cursor']}).json()
+            with mock.patch.object(views, 'CHAT_PAGE_SIZE', 1):
+                last = self.client.get(self.url, {'apres': first['newer_cursor']}).json()
+
+        self.assertEqual([message['contenu'] for message in first['messages']], ['Message 0', 'Message 1'])
+        self.assertTrue(first['has_more'])
+        self.assertEqual([message['contenu'] for message in second['messages']], ['Message 2'])
+        self.assertFalse(second['has_more'])
+        # Exactly one page left: nothing beyond it
+        self.assertEqual((len(last['messages']), last['has_more']), (1, False))
+
+
+class EventStreamTests(FlushCountersMixin, TestCase):
+
+    def test_stream_opens_with_ready_event(self):
+        async def first_chunk():
+            stream = event_stream('test', lambda cursor: ([], cursor), None)
+            try:
+                return await stream.__anext__()
+            finally:
+                await stream.aclose()
+
+        chunk = asyncio.run(first_chunk())
+        self.assertTrue(chunk.startswith('retry: '))
+        self.assertIn('event: ready', chunk)
+
+    def test_broker_wakes_subscribers_of_channel(self):
+        broker = MessageBroker()
+
+        async def publish():
+            subscription = broker.subscribe('chat:1:2')
+            other = broker.subscribe('chat:1:3')
+            broker.publish('chat:1:2')
+            await asyncio.wait_for(subscription[2].wait(), timeout=1)
+            woken = other[2].is_set()
+            broker.unsubscribe(subscription)
+            broker.unsubscribe(other)
+            return woken
+
+        self.assertFalse(asyncio.run(publish()))
+        self.assertEqual(broker._subscribers, {})
+
+    def test_broker_skips_closed_loops(self):
+        broker = MessageBroker()
+
+        async def subscribe():
+            broker.subscribe('group:1')
+
+        asyncio.run(subscribe())
+        # The client disconnected without unsubscribing: its loop is closed
+        broker.publish('group:1')
+
+    def test_last_event_id_takes_precedence(self):
+        request = RequestFactory().get('/', {'apres': 'apres'}, HTTP_LAST_EVENT_ID='dernier')
+        self.assertEqual(stream_cursor(request), 'dernier')
+        self.assertEqual(stream_cursor(RequestFactory().get('/', {'apres': 'apres'})), 'apres')
+
+    def test_chat_loader_resumes_after_cursor(self):
+        alice, bob = [
+            Utilisateur.objects.create_user(name, f'{name}@example.com', 'x', nom=name.title(), prenom='Test')
+            for name in ['alice', 'bob']
+        ]
+        first, second, third = [
+            Message.objects.create(expediteur=alice, destinataire=bob, sujet='Sujet', contenu=contenu)
+            for contenu in ['Un', 'Deux', 'Trois']
+        ]
+        load_newer = chat_loader(bob, alice)
+
+        self.assertEqual(load_newer(None), ([], message_cursor(third)))
+        payloads, cursor = load_newer(message_cursor(first))
+        self.assertEqual([payload['id'] for payload in payloads], [second.id, third.id])
+        self.assertEqual([payload['cursor'] for payload in payloads], [message_cursor(second), cursor])
+        self.assertEqual(cursor, message_cursor(third))
+        self.assertEqual(Message.objects.filter(destinataire=bob, lu=False).count(), 0)
+        self.assertEqual(load_newer(cursor), ([], cursor))
+
+
+@override_settings(MESSAGING_STREAM_POLL_INTERVAL=60)
+class EventDeliveryTests(FlushCountersMixin, TransactionTestCase):
+    """A committed message is pushed to open streams without waiting for the poll"""
+
+    def setUp(self):
+        self.alice, self.bob = [
+            Utilisateur.objects.create_user(name, f'{name}@example.com', 'x', nom=name.title(), prenom='Test')
+            for name in ['alice', 'bob']
+        ]
+        self.group = GroupeChat.objects.create(nom='Groupe', createur=self.alice)
+
+    def deliver(self, channel, load_newer, send):
+        async def scenario():
+            stream = event_stream(channel, load_newer, None)
+            try:
+                ready = await stream.__anext__()
+                waiting = asyncio.ensure_future(stream.__anext__())
+                # Let the stream load its cursor and wait for an announcement
+                await asyncio.sleep(0.2)
+                self.assertFalse(waiting.done())
+                await sync_to_async(send)()
+                return ready, await asyncio.wait_for(waiting, timeout=5)
+            finally:
+                await stream.aclose()
+
+        ready, event = asyncio.run(scenario())
+        self.assertIn('event: ready', ready)
+        return event
+
+    def test_private_message_is_pushed_on_commit(self):
+        def send():
+            with transaction.atomic():
+                Message.objects.create(
+                    expediteur=self.alice, destinataire=self.bob, sujet='Sujet', contenu='Bonjour'
+                )
+
+        event = self.deliver(chat_channel(self.alice.id, self.bob.id), chat_loader(self.bob, self.alice), send)
+        self.assertIn('event: message', event)
+        self.assertIn('"contenu": "Bonjour"', event)
+        message = Message.objects.get()
+        self.assertIn(f'id: {message_cursor(message)}', event)
+
+    def test_group_message_is_pushed_on_commit(self):
+        def send():
+            MessageGroupe.objects.create(groupe=self.group, auteur=self.alice, contenu='Salut')
+
+        event = self.deliver(group_channel(self.group.id), group_loader(self.group, self.bob), send)
+        self.assertIn('"contenu": "Salut"', event)
+        self.assertIn('"envoye": false', event)
+
+
+class ModeratedPostingTests(FlushCountersMixin, TestCase):
+    """Posting views refuse blocked content before saving and moderate the rest once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            Utilisateur.objects.create_user(name, f'{name}@example.com', 'x', nom=name.title(), prenom='Test')
+            for name in ['alice', 'bob']
+        ]
+        cls.group = GroupeChat.objects.create(nom='Groupe', createur=cls.alice)
+        formation = Formation.objects.create(
+            titre='Formation', description='Description', objectifs='Objectifs', duree_heures=10,
+            niveau='debutant', prix=0, date_debut=timezone.now(), date_fin=timezone.now()
+        )
+        cls.discussion = FilDiscussion.objects.create(
+            formation=formation, auteur=cls.bob, titre='Sujet', contenu='Contenu'
+        )
+        ContentModerationRule.objects.create(
+            name='Adresse', description='Adresses postales', rule_type='pattern',
+            patterns=[r'adresse\s+\d+'], threshold=0.5, severity='medium',
+        )
+        ContentModerationRule.objects.create(
+            name='Insulte', description='Insultes', rule_type='pattern',
+            patterns=[r'imbecile'], threshold=0.5, auto_block=True, severity='high',
+        )
+
+    def setUp(self):
+        super().setUp()
+        bump_rules_version()
+        self.client.force_login(self.alice)
+        self.posts = [
+            (reverse('messaging:chat_conversation', args=[self.bob.id]), Message.objects),
+            (reverse('messaging:group_detail', args=[self.group.id]), MessageGroupe.objects),
+            (reverse('messaging:discussion_detail', args=[self.discussion.id]), ReponseDiscussion.objects),
+        ]
+
+    def post(self, url, contenu):
+        with mock.patch.object(
+            AIContentModerator, '_evaluate', autospec=True, side_effect=AIContentModerator._evaluate
+        ) as evaluate:
+            response = self.client.post(url, {'contenu': contenu})
+        self.assertEqual(response.status_code, 302)
+        return evaluate.call_count
+
+    def test_blocked_content_is_neither_saved_nor_reported(self):
+        for url, rows in self.posts:
+            self.assertEqual(self.post(url, 'espèce d’imbécile'), 1, url)
+            self.assertFalse(rows.exists(), url)
+        self.assertFalse(ContentModerationReport.objects.exists())
+
+    def test_precheck_verdict_is_reused_after_save(self):
+        for url, rows in self.posts:
+            self.assertEqual(self.post(url, f'Mon adresse 12 pour {url}'), 1, url)
+            self.assertEqual(rows.count(), 1, url)
+        self.assertEqual(
+            sorted(ContentModerationReport.objects.values_list('content_type_label', flat=True)),
+            ['discussion_reply', 'group_message', 'private_message']
+        )
+
+
+class DiscussionViewCountTests(FlushCountersMixin, TestCase):
+    """Discussion views are counted once per session and written in batches"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.reader, self.other_reader = [
+            Utilisateur.objects.create_user(name, f'{name}@example.com', 'x', nom=name.title(), prenom='Test')
+            for name in ['lecteur', 'lectrice']
+        ]
+        formation = Formation.objects.create(
+            titre='Formation', description='Description', objectifs='Objectifs', duree_heures=10,
+            niveau='debutant', prix=0, date_debut=timezone.now(), date_fin=timezone.now()
+        )
+        self.discussion = FilDiscussion.objects.create(
+            formation=formation, auteur=self.reader, titre='Sujet', contenu='Contenu'
+        )
+        self.url = reverse('messaging:discussion_detail', args=[self.discussion.id])
+
+    def view(self, user):
+        self.client.force_login(user)
+        with mock.patch.object(views, 'render', return_value=HttpResponse()) as render, \
+                mock.patch.object(views.discussion_views, '_flush_interval', 3600):
+            self.client.get(self.url)
+        return render.call_args.args[2]['discussion'].nb_vues
+
+    def test_views_are_counted_once_per_session(self):
+        self.assertEqual(self.view(self.reader), 1)
+        self.assertEqual(self.view(self.reader), 1)
+        self.assertEqual(self.view(self.other_reader), 2)
+
+        self.discussion.refresh_from_db()
+        self.assertEqual(self.discussion.nb_vues, 0)
+        views.discussion_views.flush()
+        self.discussion.refresh_from_db()
+        self.assertEqual(self.discussion.nb_vues, 2)
+
+    def test_flush_groups_objects_by_increment(self):
+        discussions = [self.discussion] + [
+            FilDiscussion.objects.create(
+                formation=self.discussion.formation, auteur=self.reader, titre=f'Sujet {number}', contenu='Contenu'
+            )
+            for number in range(2)
+        ]
+        counter = ViewCounter(FilDiscussion, flush_interval=3600)
+        for discussion, views_count in zip(discussions, [2, 2, 1]):
+            counter.add(discussion.pk, views=views_count)
+
+        with CaptureQueriesContext(connection) as queries:
+            counter.flush()
+
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            list(FilDiscussion.objects.order_by('pk').values_list('nb_vues', flat=True)), [2, 2, 1]
+        )
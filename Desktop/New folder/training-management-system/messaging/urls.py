@@ -7,11 +7,16 @@ app_name = 'messaging'
 urlpatterns = [
     path('inbox/', views.messages_inbox, name='inbox'),
     path('chat/<int:user_id>/', views.chat_conversation, name='chat_conversation'),
+    path('chat/<int:user_id>/messages/', views.chat_messages, name='chat_messages'),
+    path('chat/<int:user_id>/stream/', views.chat_stream, name='chat_stream'),
     path('message/<int:message_id>/', views.message_detail, name='message_detail'),
     path('compose/', views.message_compose, name='compose'),
     path('groups/', views.groups_list, name='groups'),
     path('groups/create/', create_group, name='create_group'),
     path('group/<int:group_id>/', views.group_detail, name='group_detail'),
+    path('group/<int:group_id>/messages/', views.group_messages, name='group_messages'),
+    path('group/<int:group_id>/stream/', views.group_stream, name='group_stream'),
+    path('recherche/', views.search_view, name='search'),
     path('discussions/', views.discussions_list, name='discussions'),
     path('discussion/<int:discussion_id>/', views.discussion_detail, name='discussion_detail'),
 ]
@@ -1,57 +1,51 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
-from django.utils import timezone
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from .conversations import (
+    chat_history,
+    inbox_page,
+    mark_conversation_read,
+    mark_message_read,
+    message_cursor,
+    serialize_chat_message,
+    total_unread,
+)
 from .models import Message, GroupeChat, MessageGroupe, FilDiscussion, ReponseDiscussion
+from .realtime import chat_channel, chat_loader, event_stream, group_channel, group_loader, stream_cursor
+from .search import DISCUSSION, REPONSE, MESSAGE, MESSAGE_GROUPE, search
 from users.models import Utilisateur, Formateur, Apprenant
+from moderation.services import moderator
+from training_management.view_counts import ViewCounter
+
+
+BLOCKED_CONTENT_MESSAGE = 'Votre message a été bloqué par la modération automatique.'
+INBOX_PAGE_SIZE = 20
+CHAT_PAGE_SIZE = 50
+SEARCH_PAGE_SIZE = 20
+SEARCH_TYPES = {
+    'discussions': [DISCUSSION, REPONSE],
+    'messages': [MESSAGE],
+    'groupes': [MESSAGE_GROUPE],
+}
+
+discussion_views = ViewCounter(FilDiscussion)
 
 
 @login_required
 def messages_inbox(request):
-    """User's message inbox"""
-    # Get all conversations (unique users the current user has exchanged messages with)
-    conversations = Message.objects.filter(
-        Q(expediteur=request.user) | Q(destinataire=request.user)
-    ).values('expediteur', 'destinataire').distinct()
-    
-    # Create a list of conversation partners
-    conversation_list = []
-    for conv in conversations:
-        if conv['expediteur'] == request.user.id:
-            partner_id = conv['destinataire']
-        else:
-            partner_id = conv['expediteur']
-        
-        # Get the partner user
-        try:
-            partner = Utilisateur.objects.get(id=partner_id)
-            # Get the latest message in this conversation
-            latest_message = Message.objects.filter(
-                Q(expediteur=request.user, destinataire=partner) |
-                Q(expediteur=partner, destinataire=request.user)
-            ).order_by('-date_envoi').first()
-            
-            # Count unread messages
-            unread_count = Message.objects.filter(
-                expediteur=partner,
-                destinataire=request.user,
-                lu=False
-            ).count()
-            
-            conversation_list.append({
-                'partner': partner,
-                'latest_message': latest_message,
-                'unread_count': unread_count
-            })
-        except Utilisateur.DoesNotExist:
-            continue
-    
-    # Sort by latest message date
-    conversation_list.sort(key=lambda x: x['latest_message'].date_envoi if x['latest_message'] else timezone.now(), reverse=True)
+    """User's message inbox, one page of conversation summaries at a time"""
+    conversations, next_cursor = inbox_page(
+        request.user, request.GET.get('curseur'), INBOX_PAGE_SIZE
+    )
     
     context = {
-        'conversations': conversation_list,
+        'conversations': conversations,
+        'next_cursor': next_cursor,
+        'total_unread': total_unread(request.user),
     }
     return render(request, 'messaging/inbox.html', context)
 
@@ -61,33 +55,29 @@ def chat_conversation(request, user_id):
     """Chat conversation view between two users"""
     other_user = get_object_or_404(Utilisateur, id=user_id)
     
-    # Get all messages between the two users
-    messages_list = Message.objects.filter(
-        Q(expediteur=request.user, destinataire=other_user) |
-        Q(expediteur=other_user, destinataire=request.user)
-    ).order_by('date_envoi')
+    # Latest messages between the two users; older ones are loaded on demand
+    messages_list, has_older = chat_history(request.user, other_user, limit=CHAT_PAGE_SIZE)
     
     # Mark messages as read
-    unread_messages = Message.objects.filter(
-        expediteur=other_user,
-        destinataire=request.user,
-        lu=False
-    )
-    unread_messages.update(lu=True, date_lecture=timezone.now())
+    mark_conversation_read(request.user, other_user)
     
     # Handle new message
     if request.method == 'POST':
         contenu = request.POST.get('contenu')
         if contenu:
-            message = Message.objects.create(
+            message = Message(
                 expediteur=request.user,
                 destinataire=other_user,
                 sujet=f"Message de {request.user.get_full_name()}",
                 contenu=contenu,
             )
+            if not moderator.precheck_instance(message):
+                messages.error(request, BLOCKED_CONTENT_MESSAGE)
+                return redirect('messaging:chat_conversation', user_id=user_id)
             
             if 'fichier_joint' in request.FILES:
                 message.fichier_joint = request.FILES['fichier_joint']
+            with transaction.atomic():
                 message.save()
             
             # Redirect to refresh the page and show the new message
@@ -95,12 +85,110 @@ def chat_conversation(request, user_id):
     
     context = {
         'other_user': other_user,
-        'messages': messages_list,
+        'chat_messages': messages_list,
+        'older_cursor': message_cursor(messages_list[0]) if has_older else None,
+        'newer_cursor': message_cursor(messages_list[-1]) if messages_list else None,
         'conversation_title': f"Chat avec {other_user.get_full_name()}",
     }
     return render(request, 'messaging/chat_interface.html', context)
 
 
+@login_required
+def chat_messages(request, user_id):
+    """
+    JSON page of a chat: ``avant`` loads the messages older than a cursor,
+    ``apres`` fetches the ones newer than a cursor
+    """
+    other_user = get_object_or_404(Utilisateur, id=user_id)
+    before = request.GET.get('avant')
+    after = request.GET.get('apres')
+    
+    messages_list, has_more = chat_history(
+        request.user, other_user, before=before, after=after, limit=CHAT_PAGE_SIZE
+    )
+    
+    # New messages shown in the open chat are read
+    if any(message.destinataire_id == request.user.id and not message.lu for message in messages_list):
+        mark_conversation_read(request.user, other_user)
+    
+    data = {
+        'messages': [serialize_chat_message(message, request.user) for message in messages_list],
+        'has_more': has_more,
+    }
+    if messages_list:
+        data['older_cursor'] = message_cursor(messages_list[0])
+        data['newer_cursor'] = message_cursor(messages_list[-1])
+    return JsonResponse(data)
+
+
+@login_required
+def group_messages(request, group_id):
+    """JSON page of the group messages newer than the ``apres`` cursor, polled without Server-Sent Events"""
+    group = get_object_or_404(GroupeChat, id=group_id)
+    if not is_group_member(group, request.user):
+        return HttpResponse(status=403)
+    
+    # One message more than the page tells whether another page follows
+    payloads, cursor = group_loader(group, request.user, CHAT_PAGE_SIZE + 1)(request.GET.get('apres'))
+    has_more = len(payloads) > CHAT_PAGE_SIZE
+    if has_more:
+        payloads = payloads[:CHAT_PAGE_SIZE]
+        cursor = payloads[-1]['cursor']
+    return JsonResponse({
+        'messages': payloads,
+        'has_more': has_more,
+        'newer_cursor': cursor,
+    })
+
+
+async def chat_stream(request, user_id):
+    """Server-Sent Events stream of the new messages of a chat"""
+    user = await sync_to_async(get_authenticated_user)(request)
+    if user is None:
+        return HttpResponse(status=401)
+    
+    other_user = await sync_to_async(get_object_or_404)(Utilisateur, id=user_id)
+    return event_stream_response(event_stream(
+        chat_channel(user.id, other_user.id),
+        chat_loader(user, other_user, CHAT_PAGE_SIZE),
+        stream_cursor(request),
+    ))
+
+
+async def group_stream(request, group_id):
+    """Server-Sent Events stream of the new messages of a group chat"""
+    user = await sync_to_async(get_authenticated_user)(request)
+    if user is None:
+        return HttpResponse(status=401)
+    
+    group = await sync_to_async(get_object_or_404)(GroupeChat, id=group_id)
+    if not await sync_to_async(is_group_member)(group, user):
+        return HttpResponse(status=403)
+    
+    return event_stream_response(event_stream(
+        group_channel(group.id),
+        group_loader(group, user, CHAT_PAGE_SIZE),
+        stream_cursor(request),
+    ))
+
+
+def get_authenticated_user(request):
+    # Loads the session user, which async code cannot do
+    return request.user if request.user.is_authenticated else None
+
+
+def is_group_member(group, user):
+    return group.createur_id == user.id or group.membres.filter(id=user.id).exists()
+
+
+def event_stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Nginx would otherwise buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def message_detail(request, message_id):
     """Message detail view"""
@@ -113,8 +201,7 @@ def message_detail(request, message_id):
     
     # Mark as read if user is the recipient
     if message.destinataire == request.user and not message.lu:
-        message.lu = True
-        message.save()
+        mark_message_read(message)
     
     return render(request, 'messaging/message_detail.html', {'message': message})
 
@@ -137,7 +224,7 @@ def message_compose(request):
             })
         try:
             destinataire = Utilisateur.objects.get(id=destinataire_id)
-            message = Message.objects.create(
+            message = Message(
                 expediteur=request.user,
                 destinataire=destinataire,
                 sujet=sujet,
@@ -145,6 +232,7 @@ def message_compose(request):
             )
             if 'fichier_joint' in request.FILES:
                 message.fichier_joint = request.FILES['fichier_joint']
+            with transaction.atomic():
                 message.save()
             messages.success(request, 'Message envoyé avec succès!')
             return redirect('messaging:inbox')
@@ -180,7 +268,7 @@ def group_detail(request, group_id):
     group = get_object_or_404(GroupeChat, id=group_id)
     
     # Check if user is a member
-    if not (group.membres.filter(id=request.user.id).exists() or group.createur == request.user):
+    if not is_group_member(group, request.user):
         messages.error(request, 'Vous n\'êtes pas membre de ce groupe.')
         return redirect('messaging:groups')
     
@@ -188,19 +276,24 @@ def group_detail(request, group_id):
     if request.method == "POST":
         contenu = request.POST.get("contenu")
         if contenu:
-            MessageGroupe.objects.create(
+            message = MessageGroupe(
                 auteur=request.user,
                 groupe=group,
                 contenu=contenu,
             )
+            if moderator.precheck_instance(message):
+                message.save()
+            else:
+                messages.error(request, BLOCKED_CONTENT_MESSAGE)
             return redirect('messaging:group_detail', group_id=group.id)
     
     # Get group messages
-    group_messages = group.messages.all().order_by('date_envoi')
+    group_messages = list(group.messages.select_related('auteur').order_by('date_envoi', 'id'))
     
     context = {
         'group': group,
         'group_messages': group_messages,
+        'newer_cursor': message_cursor(group_messages[-1]) if group_messages else None,
     }
     return render(request, 'messaging/group_detail.html', context)
 
@@ -210,28 +303,62 @@ def discussions_list(request):
     """List discussion threads"""
     discussions = FilDiscussion.objects.all().order_by('-epingle', '-derniere_reponse')
     
-    # Search functionality
+    # Search functionality, ranked by the full-text index
     query = request.GET.get('search')
+    page = None
     if query:
-        discussions = discussions.filter(
-            Q(titre__icontains=query) | Q(contenu__icontains=query)
+        page = search(
+            request.user, query, types=[DISCUSSION],
+            page=get_page_number(request), page_size=SEARCH_PAGE_SIZE
         )
+        discussions = [result.document.discussion for result in page]
     
     context = {
         'discussions': discussions,
         'query': query,
+        'page': page,
     }
     return render(request, 'messaging/discussions.html', context)
 
 
+@login_required
+def search_view(request):
+    """Full-text search of the discussions, messages and groups visible to the user"""
+    query = request.GET.get('q', '').strip()
+    search_type = request.GET.get('type')
+    if search_type not in SEARCH_TYPES:
+        search_type = None
+    
+    page = None
+    if query:
+        page = search(
+            request.user, query, types=SEARCH_TYPES.get(search_type),
+            page=get_page_number(request), page_size=SEARCH_PAGE_SIZE
+        )
+    
+    context = {
+        'query': query,
+        'search_type': search_type,
+        'page': page,
+    }
+    return render(request, 'messaging/search.html', context)
+
+
+def get_page_number(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
 @login_required
 def discussion_detail(request, discussion_id):
     """Discussion thread detail view"""
     discussion = get_object_or_404(FilDiscussion, id=discussion_id)
     
-    # Increment view count
-    discussion.nb_vues += 1
-    discussion.save()
+    # Count the view, written to the database in batches
+    discussion_views.record(request, discussion)
+    discussion.nb_vues = discussion_views.count(discussion)
     
     # Get replies
     reponses = discussion.reponses.all().order_by('date_creation')
@@ -240,19 +367,22 @@ def discussion_detail(request, discussion_id):
     if request.method == 'POST':
         contenu = request.POST.get('contenu')
         if contenu:
-            reponse = ReponseDiscussion.objects.create(
+            reponse = ReponseDiscussion(
                 discussion=discussion,
                 auteur=request.user,
                 contenu=contenu,
             )
+            if not moderator.precheck_instance(reponse):
+                messages.error(request, BLOCKED_CONTENT_MESSAGE)
+                return redirect('messaging:discussion_detail', discussion_id=discussion_id)
             
             if 'fichier_joint' in request.FILES:
                 reponse.fichier_joint = request.FILES['fichier_joint']
-                reponse.save()
+            reponse.save()
             
             # Update last reply time
             discussion.derniere_reponse = reponse.date_creation
-            discussion.save()
+            discussion.save(update_fields=['derniere_reponse'])
             
             messages.success(request, 'Réponse ajoutée!')
             return redirect('messaging:discussion_detail', discussion_id=discussion_id)
@@ -1,14 +1,21 @@
 from django.contrib import admin
+from django.db.models import Q, Sum
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
 from .models import (
+    ArchivedModerationReport,
     ContentModerationReport,
     ContentModerationRule,
     ContentModerationWhitelist,
-    ModerationStats
+    ModerationJob,
+    ModerationReportRollup,
+    ModerationStats,
+    RuleStats,
+    ShadowRuleStats
 )
-from .services import moderator
+from .forms import ContentModerationRuleForm
+from .services import moderator, with_report_relations
 
 
 @admin.register(ContentModerationReport)
@@ -16,7 +23,7 @@ class ContentModerationReportAdmin(admin.ModelAdmin):
     list_display = [
         'id', 'content_type_label', 'author', 'severity_badge', 
         'status_badge', 'ai_confidence_display', 'auto_blocked',
-        'created_at', 'review_actions'
+        'content_object_link', 'created_at', 'review_actions'
     ]
     list_filter = [
         'content_type_label', 'severity', 'status', 'auto_blocked',
@@ -26,9 +33,12 @@ class ContentModerationReportAdmin(admin.ModelAdmin):
         'original_content', 'author__nom', 'author__prenom', 
         'author__email', 'review_notes'
     ]
+    # The status and the rollup key only change through the review actions,
+    # which keep ModerationReportRollup in step
     readonly_fields = [
-        'content_type', 'object_id', 'content_object_link',
-        'ai_confidence', 'detected_issues_display', 'created_at', 'updated_at'
+        'content_type', 'object_id', 'content_object_link', 'content_type_label', 'author',
+        'ai_confidence', 'detected_issues_display', 'severity', 'status', 'auto_blocked',
+        'reviewed_by', 'review_date', 'created_at', 'updated_at'
     ]
     fieldsets = [
         ('Contenu Signalé', {
@@ -50,6 +60,13 @@ class ContentModerationReportAdmin(admin.ModelAdmin):
     ]
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
+    actions = ['approve_selected', 'reject_selected']
+    
+    def get_queryset(self, request):
+        return with_report_relations(super().get_queryset(request))
+    
+    def has_add_permission(self, request):
+        return False  # Created by the moderator, counted in the rollups
     
     def severity_badge(self, obj):
         colors = {
@@ -84,8 +101,8 @@ class ContentModerationReportAdmin(admin.ModelAdmin):
         percentage = obj.ai_confidence * 100
         color = 'red' if percentage > 80 else 'orange' if percentage > 60 else 'green'
         return format_html(
-            '<span style="color: {}; font-weight: bold;">{:.1f}%</span>',
-            color, percentage
+            '<span style="color: {}; font-weight: bold;">{}%</span>',
+            color, f"{percentage:.1f}"
         )
     ai_confidence_display.short_description = 'Confiance IA'
     
@@ -169,19 +186,88 @@ class ContentModerationReportAdmin(admin.ModelAdmin):
             messages.error(request, "Erreur lors du rejet")
         
         return redirect('admin:moderation_contentmoderationreport_changelist')
+    
+    def approve_selected(self, request, queryset):
+        reviewed = moderator.review_reports(
+            list(queryset.values_list('id', flat=True)), request.user, 'approve',
+            "Approuvé en lot via interface admin"
+        )
+        self.message_user(request, f"{reviewed} rapport(s) approuvé(s)")
+    approve_selected.short_description = "Approuver les rapports sélectionnés"
+    
+    def reject_selected(self, request, queryset):
+        reviewed = moderator.review_reports(
+            list(queryset.values_list('id', flat=True)), request.user, 'reject',
+            "Rejeté en lot via interface admin"
+        )
+        self.message_user(request, f"{reviewed} rapport(s) rejeté(s)")
+    reject_selected.short_description = "Rejeter les rapports sélectionnés"
+
+
+class RuleStatsInline(admin.TabularInline):
+    model = RuleStats
+    fields = [
+        'date', 'evaluations', 'hits', 'average_time_display',
+        'time_under_10us', 'time_under_100us', 'time_under_1ms',
+        'time_under_10ms', 'time_over_10ms'
+    ]
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    verbose_name_plural = 'Performances (30 derniers jours)'
+    
+    def get_queryset(self, request):
+        month_ago = timezone.now().date() - timezone.timedelta(days=30)
+        return super().get_queryset(request).filter(date__gte=month_ago)
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+    
+    def average_time_display(self, obj):
+        return f"{obj.average_time_us:.1f} µs"
+    average_time_display.short_description = 'Temps moyen'
+
+
+@admin.register(ArchivedModerationReport)
+class ArchivedModerationReportAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'content_type_label', 'author', 'severity', 'status',
+        'auto_blocked', 'created_at', 'review_date', 'archived_at'
+    ]
+    list_filter = ['content_type_label', 'severity', 'status', 'archived_at']
+    search_fields = ['=id', 'author__email', 'author__nom', 'author__prenom']
+    fields = [
+        'id', 'content_type_label', 'content_type', 'object_id', 'author',
+        'original_content', 'detected_issues', 'ai_confidence', 'severity',
+        'status', 'auto_blocked', 'reviewed_by', 'review_notes', 'review_date',
+        'created_at', 'archived_at'
+    ]
+    readonly_fields = fields
+    list_select_related = ['author']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        return False  # Filled by archive_moderation_reports
+    
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(ContentModerationRule)
 class ContentModerationRuleAdmin(admin.ModelAdmin):
+    form = ContentModerationRuleForm
+    inlines = [RuleStatsInline]
     list_display = [
         'name', 'rule_type', 'severity_badge', 'threshold', 
-        'auto_block', 'active', 'created_at'
+        'auto_block', 'active', 'shadow', 'recent_hits_display',
+        'recent_average_time_display', 'regex_budget_overruns', 'created_at'
     ]
-    list_filter = ['rule_type', 'severity', 'auto_block', 'active']
+    list_filter = ['rule_type', 'severity', 'auto_block', 'active', 'shadow']
     search_fields = ['name', 'description']
     fieldsets = [
         ('Règle de Base', {
-            'fields': ('name', 'description', 'rule_type', 'active')
+            'fields': ('name', 'description', 'rule_type', 'active', 'shadow')
         }),
         ('Configuration', {
             'fields': ('keywords', 'patterns', 'threshold')
@@ -189,12 +275,26 @@ class ContentModerationRuleAdmin(admin.ModelAdmin):
         ('Actions', {
             'fields': ('severity', 'auto_block')
         }),
+        ('Performance', {
+            'fields': ('regex_budget_overruns', 'last_regex_overrun'),
+            'classes': ('collapse',)
+        }),
         ('Métadonnées', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         })
     ]
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'regex_budget_overruns', 'last_regex_overrun']
+    
+    def get_queryset(self, request):
+        # Last 7 days of RuleStats, summed in the changelist query
+        week_ago = timezone.now().date() - timezone.timedelta(days=7)
+        recent = Q(daily_stats__date__gte=week_ago)
+        return super().get_queryset(request).annotate(
+            recent_hits=Sum('daily_stats__hits', filter=recent),
+            recent_evaluations=Sum('daily_stats__evaluations', filter=recent),
+            recent_time_us=Sum('daily_stats__total_time_us', filter=recent),
+        )
     
     def severity_badge(self, obj):
         colors = {
@@ -209,6 +309,17 @@ class ContentModerationRuleAdmin(admin.ModelAdmin):
             color, obj.get_severity_display()
         )
     severity_badge.short_description = 'Gravité'
+    
+    def recent_hits_display(self, obj):
+        return obj.recent_hits or 0
+    recent_hits_display.short_description = 'Détections (7 j)'
+    recent_hits_display.admin_order_field = 'recent_hits'
+    
+    def recent_average_time_display(self, obj):
+        if not obj.recent_evaluations:
+            return '-'
+        return f"{obj.recent_time_us / obj.recent_evaluations:.1f} µs"
+    recent_average_time_display.short_description = 'Temps moyen (7 j)'
 
 
 @admin.register(ContentModerationWhitelist)
@@ -255,6 +366,83 @@ class ModerationStatsAdmin(admin.ModelAdmin):
         return False  # Prevent deletion
 
 
+@admin.register(ShadowRuleStats)
+class ShadowRuleStatsAdmin(admin.ModelAdmin):
+    list_display = ['rule', 'date', 'evaluated', 'hits', 'hit_rate_display', 'overlapping_hits']
+    list_filter = ['date', 'rule']
+    readonly_fields = ['rule', 'date', 'evaluated', 'hits', 'overlapping_hits', 'sample_matches']
+    date_hierarchy = 'date'
+    ordering = ['-date']
+    
+    def hit_rate_display(self, obj):
+        return f"{obj.hit_rate:.2f}%"
+    hit_rate_display.short_description = 'Taux de détection'
+    
+    def has_add_permission(self, request):
+        return False  # Filled by the shadow rule recorder
+
+
+@admin.register(RuleStats)
+class RuleStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        'rule', 'date', 'evaluations', 'hits', 'average_time_display',
+        'time_under_10us', 'time_under_100us', 'time_under_1ms',
+        'time_under_10ms', 'time_over_10ms'
+    ]
+    list_filter = ['date', 'rule']
+    readonly_fields = [
+        'rule', 'date', 'evaluations', 'hits', 'total_time_us',
+        'time_under_10us', 'time_under_100us', 'time_under_1ms',
+        'time_under_10ms', 'time_over_10ms'
+    ]
+    date_hierarchy = 'date'
+    ordering = ['-date', '-total_time_us']
+    
+    def average_time_display(self, obj):
+        return f"{obj.average_time_us:.1f} µs"
+    average_time_display.short_description = 'Temps moyen'
+    
+    def has_add_permission(self, request):
+        return False  # Filled by the rule metrics recorder
+
+
+@admin.register(ModerationReportRollup)
+class ModerationReportRollupAdmin(admin.ModelAdmin):
+    list_display = [
+        'date', 'content_type_label', 'severity', 'reports',
+        'auto_blocked', 'pending', 'approved', 'rejected'
+    ]
+    list_filter = ['date', 'content_type_label', 'severity']
+    readonly_fields = [
+        'date', 'content_type_label', 'severity', 'reports',
+        'auto_blocked', 'pending', 'approved', 'rejected'
+    ]
+    date_hierarchy = 'date'
+    ordering = ['-date', 'content_type_label', 'severity']
+    
+    def has_add_permission(self, request):
+        return False  # Maintained with the reports, see rebuild_moderation_rollups
+
+
+@admin.register(ModerationJob)
+class ModerationJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'content_type_label', 'object_id', 'status', 'attempts',
+        'created_at', 'processed_at'
+    ]
+    list_filter = ['status', 'content_type_label', 'created_at']
+    search_fields = ['object_id', 'last_error']
+    readonly_fields = [
+        'content_type', 'object_id', 'content_type_label', 'attempts',
+        'claimed_by', 'claimed_at', 'last_error', 'created_at', 'processed_at'
+    ]
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        return False  # Jobs are queued by the moderation signals
+
+
 # Custom admin site configuration
 admin.site.site_header = "Modération de Contenu IA"
 admin.site.site_title = "Modération IA"
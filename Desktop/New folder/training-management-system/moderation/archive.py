@@ -0,0 +1,89 @@
+"""
+Moderation report archival
+Moves resolved reports out of ContentModerationReport into the compact
+ArchivedModerationReport table in bounded batches, so the listings and the
+dashboard only ever scan recent and open reports
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedModerationReport, ContentModerationReport
+from .rollups import archiving
+
+
+# Reports a moderator has closed; pending and automatically filtered reports stay hot
+ARCHIVABLE_STATUSES = ['approved', 'rejected']
+
+
+def get_archive_cutoff(older_than_days=None):
+    """Reports reviewed before this moment can be archived"""
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'MODERATION_ARCHIVE_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=older_than_days)
+
+
+def archivable_reports(cutoff):
+    return ContentModerationReport.objects.filter(
+        status__in=ARCHIVABLE_STATUSES,
+        review_date__lt=cutoff
+    )
+
+
+def archive_batch(cutoff, batch_size=500):
+    """
+    Archive and delete up to ``batch_size`` reports in one transaction
+
+    Returns:
+        int: number of reports archived
+    """
+    with transaction.atomic():
+        reports = list(archivable_reports(cutoff).order_by('pk')[:batch_size])
+        if not reports:
+            return 0
+
+        # ignore_conflicts makes a batch interrupted after the insert safe to rerun
+        ArchivedModerationReport.objects.bulk_create(
+            [ArchivedModerationReport.from_report(report) for report in reports],
+            ignore_conflicts=True
+        )
+        with archiving():
+            ContentModerationReport.objects.filter(pk__in=[report.pk for report in reports]).delete()
+
+    return len(reports)
+
+
+def archive_resolved_reports(older_than_days=None, batch_size=500, max_batches=None):
+    """
+    Archive every resolved report reviewed more than ``older_than_days`` ago
+
+    Yields:
+        int: number of reports archived by each batch
+    """
+    cutoff = get_archive_cutoff(older_than_days)
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        archived = archive_batch(cutoff, batch_size)
+        if not archived:
+            return
+        batches += 1
+        yield archived
+
+
+def reported_object_ids(content_type, object_ids):
+    """Ids among ``object_ids`` with a live or archived moderation report"""
+    reported = set(
+        ContentModerationReport.objects.filter(
+            content_type=content_type, object_id__in=object_ids
+        ).values_list('object_id', flat=True)
+    )
+    reported.update(
+        ArchivedModerationReport.objects.filter(
+            content_type=content_type, object_id__in=object_ids
+        ).values_list('object_id', flat=True)
+    )
+    return reported
@@ -0,0 +1,217 @@
+"""
+Batch scoring of the built-in heuristics
+Spam, toxicity and sentiment scores of a whole batch of texts are computed
+from feature arrays instead of text by text: character-run indicators are
+found on the code points of the batch with NumPy, the other built-in patterns
+scan the joined batch once, and the per-text formulas of the rule engine are
+applied to the resulting arrays at once
+"""
+
+from bisect import bisect_right
+from collections import namedtuple
+import re
+
+from .models import SPAM_INDICATORS, TOXIC_PATTERNS
+
+try:
+    # Optional: without NumPy the character runs are scanned with their regex
+    # and the scores are computed in Python, with the same results
+    import numpy as np
+except ImportError:
+    np = None
+
+
+TextScores = namedtuple('TextScores', ['spam', 'toxicity', 'sentiment'])
+
+# Texts are joined with a character none of the built-in patterns needs to
+# match across; matches that still run past a text are re-checked within it
+BATCH_SEPARATOR = '\n'
+
+SPAM_STEP = 0.3
+
+# Indicators that are runs of characters, keyed by their (folded) source: the
+# "all caps" run of letters or spaces and the repeated character
+CHARACTER_CLASS_RUNS = {r'[A-Z\s]{20,}': (re.compile(r'[A-Z\s]', re.IGNORECASE), 20)}
+REPEATED_CHARACTER_RUNS = {r'(.)\1{4,}': 5}
+
+
+def _spam_score(indicator_count):
+    # Same accumulation as CompiledRule._detect_spam, so floats are identical
+    score = 0.0
+    for _ in range(indicator_count):
+        score += SPAM_STEP
+    return min(score, 1.0)
+
+
+SPAM_SCORE_TABLE = [_spam_score(count) for count in range(len(SPAM_INDICATORS) + 1)]
+
+
+def _lowercase_variant(pattern):
+    """
+    Case-sensitive equivalent of an IGNORECASE pattern on lowercase ASCII text,
+    or the pattern itself when it spells uppercase letters (``[A-Z]``)
+    """
+    literals = re.sub(r'\\.', '', pattern.pattern)
+    if any('A' <= char <= 'Z' for char in literals):
+        return pattern
+    # Case-sensitive matching skips ahead on literal prefixes, IGNORECASE cannot
+    return re.compile(pattern.pattern)
+
+
+LOWERCASE_VARIANTS = {
+    pattern.pattern: _lowercase_variant(pattern) for pattern in SPAM_INDICATORS + TOXIC_PATTERNS
+}
+
+
+def pattern_presence(pattern, joined, starts, ends):
+    """
+    Indices of the joined texts in which ``pattern`` has a match
+
+    ``starts`` and ``ends`` are the offsets of every text in ``joined``. The
+    scan jumps to the next text as soon as one match is found, so each text
+    costs at most one search.
+    """
+    present = []
+    count = len(starts)
+    position = 0
+
+    while position < len(joined):
+        match = pattern.search(joined, position)
+        if match is None:
+            break
+
+        index = bisect_right(starts, match.start()) - 1
+        if match.end() <= ends[index] or pattern.search(joined, match.start(), ends[index]):
+            present.append(index)
+
+        if index + 1 >= count:
+            break
+        position = starts[index + 1]
+
+    return present
+
+
+class AsciiBatch:
+    """Lowercase ASCII texts joined once, with their offsets and code points"""
+
+    def __init__(self, texts):
+        self.starts = []
+        self.ends = []
+        offset = 0
+        for text in texts:
+            self.starts.append(offset)
+            offset += len(text)
+            self.ends.append(offset)
+            offset += len(BATCH_SEPARATOR)
+        self.joined = BATCH_SEPARATOR.join(texts)
+        self.codes = None
+        if np is not None:
+            self.codes = np.frombuffer(self.joined.encode('ascii'), dtype=np.uint8)
+
+    def presence(self, pattern):
+        """Indices of the texts in which the IGNORECASE ``pattern`` has a match"""
+        if self.codes is not None and pattern.pattern in CHARACTER_CLASS_RUNS:
+            character_class, min_length = CHARACTER_CLASS_RUNS[pattern.pattern]
+            table = np.array([bool(character_class.match(chr(code))) for code in range(128)])
+            return self._run_texts(table[self.codes], min_length)
+
+        if self.codes is not None and pattern.pattern in REPEATED_CHARACTER_RUNS:
+            # same[i]: character i + 1 repeats character i, which is not a
+            # newline ("." never matches one); the text is already lowercase
+            same = (self.codes[:-1] == self.codes[1:]) & (self.codes[:-1] != ord('\n'))
+            return self._run_texts(same, REPEATED_CHARACTER_RUNS[pattern.pattern] - 1)
+
+        return pattern_presence(
+            LOWERCASE_VARIANTS.get(pattern.pattern, pattern), self.joined, self.starts, self.ends
+        )
+
+    def _run_texts(self, flags, min_length):
+        # Runs of at least ``min_length`` set flags; separators break every run
+        flags = flags.copy()
+        flags[self.ends[:-1]] = False
+        padded = np.concatenate(([False], flags, [False]))
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        run_starts, run_ends = edges[::2], edges[1::2]
+        long_starts = run_starts[run_ends - run_starts >= min_length]
+        return np.unique(np.searchsorted(self.starts, long_starts, side='right') - 1).tolist()
+
+
+def score_texts(texts, matched_terms, negative_terms):
+    """
+    Heuristic scores of normalized texts, with the per-text formulas of CompiledRule
+
+    Args:
+        texts: NormalizedText of every text
+        matched_terms: automaton terms found in every text
+        negative_terms: automaton indices of the negative words
+
+    Returns:
+        list: one TextScores per text
+    """
+    if not texts:
+        return []
+
+    # Case-insensitive matching equals case-sensitive matching on the
+    # lowercase text only for ASCII; the few other texts (accents are already
+    # folded) keep the original patterns
+    ascii_indices = []
+    other_indices = []
+    for index, text in enumerate(texts):
+        (ascii_indices if text.folded.isascii() else other_indices).append(index)
+    batch = AsciiBatch([texts[index].folded_lower for index in ascii_indices])
+
+    def presence(pattern):
+        present = [ascii_indices[index] for index in batch.presence(pattern)] if ascii_indices else []
+        present.extend(index for index in other_indices if pattern.search(texts[index].folded))
+        return present
+
+    spam_hits = [presence(pattern) for pattern in SPAM_INDICATORS]
+    toxic_hits = [presence(pattern) for pattern in TOXIC_PATTERNS]
+    negative_counts = [len(negative_terms & terms) for terms in matched_terms]
+    token_counts = [len(text.tokens) for text in texts]
+
+    if np is None:
+        return _score_lists(len(texts), spam_hits, toxic_hits, negative_counts, token_counts)
+    return _score_arrays(len(texts), spam_hits, toxic_hits, negative_counts, token_counts)
+
+
+def _score_arrays(count, spam_hits, toxic_hits, negative_counts, token_counts):
+    spam_features = np.zeros((count, len(spam_hits)), dtype=bool)
+    for column, indices in enumerate(spam_hits):
+        spam_features[indices, column] = True
+
+    toxic_features = np.zeros((count, len(toxic_hits)), dtype=bool)
+    for column, indices in enumerate(toxic_hits):
+        toxic_features[indices, column] = True
+
+    spam = np.asarray(SPAM_SCORE_TABLE)[spam_features.sum(axis=1)]
+    toxicity = toxic_features.any(axis=1).astype(float)
+
+    negative = np.asarray(negative_counts, dtype=float)
+    tokens = np.asarray(token_counts, dtype=float)
+    sentiment = np.minimum(negative / np.maximum(tokens * 0.1, 1), 1.0)
+
+    return [
+        TextScores(*scores)
+        for scores in zip(spam.tolist(), toxicity.tolist(), sentiment.tolist())
+    ]
+
+
+def _score_lists(count, spam_hits, toxic_hits, negative_counts, token_counts):
+    spam_counts = [0] * count
+    for indices in spam_hits:
+        for index in indices:
+            spam_counts[index] += 1
+
+    toxic = set()
+    for indices in toxic_hits:
+        toxic.update(indices)
+
+    return [
+        TextScores(
+            SPAM_SCORE_TABLE[spam_counts[index]],
+            1.0 if index in toxic else 0.0,
+            min(negative_counts[index] / max(token_counts[index] * 0.1, 1), 1.0),
+        )
+        for index in range(count)
+    ]
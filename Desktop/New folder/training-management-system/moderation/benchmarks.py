@@ -0,0 +1,445 @@
+"""
+Moderation benchmarks
+Reproducible timing comparisons for the moderation rule engine
+"""
+
+import math
+import random
+import re
+import time
+
+from .default_rules import DEFAULT_RULES
+from .engine import CompiledRuleSet
+from .models import ContentModerationRule
+from .normalization import fold_accents, normalize
+from .regex_guard import GuardedPattern, validate_pattern
+
+
+CLEAN_WORDS = [
+    'bonjour', 'merci', 'le', 'cours', 'est', 'vraiment', 'clair', 'et',
+    'la', 'formation', 'avance', 'bien', 'nous', 'allons', 'revoir', 'les',
+    'exercices', 'demain', 'pendant', 'séance', 'formateur', 'explique',
+    'chapitre', 'suivant', 'question', 'réponse', 'projet', 'groupe',
+]
+
+BENCHMARK_WHITELIST = ['formation professionnelle', 'code de conduite', 'cours de français']
+
+# Patterns that backtrack catastrophically, each with the input unit that
+# triggers it; the input is ``unit * size + suffix``. ``unguarded_size`` keeps
+# the unguarded run in the tens of milliseconds: a few more units take seconds
+ADVERSARIAL_CASES = [
+    {
+        'name': 'quantificateurs imbriqués',
+        'pattern': r'(a+)+$', 'unit': 'a', 'suffix': '!', 'unguarded_size': 18,
+    },
+    {
+        'name': 'quantificateurs adjacents',
+        'pattern': r'(x+x+)+y', 'unit': 'x', 'suffix': '', 'unguarded_size': 18,
+    },
+    {
+        'name': 'mots répétés',
+        'pattern': r'^(\w+\s?)*$', 'unit': 'a', 'suffix': '!', 'unguarded_size': 18,
+    },
+    {
+        'name': 'alternatives chevauchantes',
+        'pattern': r'(a|aa)+$', 'unit': 'a', 'suffix': '!', 'unguarded_size': 24,
+    },
+    {
+        'name': 'adresse email naïve',
+        'pattern': r'^([a-zA-Z0-9])(([\-.]|[_]+)?([a-zA-Z0-9]+))*(@){1}[a-z0-9]+[.]{1}[a-z]{2,3}$',
+        'unit': 'a', 'suffix': '!', 'unguarded_size': 18,
+    },
+]
+
+
+def build_keyword_rules(extra_keywords=0):
+    """Unsaved keyword rules built from every seeded keyword list"""
+    rules = [
+        ContentModerationRule(
+            name=rule_data['name'],
+            rule_type='keyword',
+            keywords=list(rule_data['keywords']),
+            threshold=rule_data['threshold'],
+            severity=rule_data['severity'],
+            auto_block=rule_data['auto_block'],
+        )
+        for rule_data in DEFAULT_RULES
+        if rule_data['keywords']
+    ]
+
+    if extra_keywords:
+        # Synthetic rule standing in for a keyword list that keeps growing
+        rules.append(ContentModerationRule(
+            name='Mots-clés synthétiques',
+            rule_type='keyword',
+            keywords=[f'motcle{index:05d}' for index in range(extra_keywords)],
+            threshold=0.5,
+        ))
+
+    return rules
+
+
+def generate_texts(count, seed=42):
+    """Short chat-like texts, roughly one in five containing a seeded keyword"""
+    rng = random.Random(seed)
+    keywords = [keyword for rule_data in DEFAULT_RULES for keyword in rule_data['keywords']]
+
+    texts = []
+    for _ in range(count):
+        words = [rng.choice(CLEAN_WORDS) for _ in range(rng.choice([3, 8, 20, 60]))]
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        texts.append(' '.join(words))
+    return texts
+
+
+def time_per_text(func, texts, repeat=3):
+    """Best-of-``repeat`` average time per text, in microseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(texts) * 1_000_000
+
+
+def benchmark_keyword_matching(text_count=2000, extra_keywords=0, repeat=3, seed=42):
+    """
+    Compare the per-keyword substring loop with the shared automaton
+
+    Both paths must report the same keyword hits for every rule; a mismatch
+    raises AssertionError instead of producing misleading timings.
+    """
+    rules = build_keyword_rules(extra_keywords)
+    rule_set = CompiledRuleSet(rules, BENCHMARK_WHITELIST, version='benchmark')
+    texts = generate_texts(text_count, seed=seed)
+
+    def substring_loop(text):
+        text = normalize(text)
+        if any(fold_accents(item.lower()) in text.folded_lower for item in BENCHMARK_WHITELIST):
+            return None
+        return [rule._check_keywords(text) for rule in rules]
+
+    def automaton(text):
+        matched_terms = rule_set.automaton.find(normalize(text).folded_lower)
+        if not rule_set.whitelist_terms.isdisjoint(matched_terms):
+            return None
+        return [rule._check_keywords(matched_terms) for rule in rule_set.rules]
+
+    for text in texts:
+        assert substring_loop(text) == automaton(text), f"Keyword hits differ for: {text!r}"
+
+    loop_us = time_per_text(substring_loop, texts, repeat)
+    automaton_us = time_per_text(automaton, texts, repeat)
+
+    return {
+        'suite': 'keywords',
+        'texts': text_count,
+        'rules': len(rules),
+        'terms': len(rule_set.automaton),
+        'loop_us_per_text': loop_us,
+        'automaton_us_per_text': automaton_us,
+        'speedup': loop_us / automaton_us if automaton_us else None,
+    }
+
+
+def benchmark_regex_guard(sizes=(20, 1000, 20000), repeat=3):
+    """
+    Time adversarial and seeded patterns with and without the regex guard
+
+    Returns:
+        list: one dict per pattern with its save-time verdict, the unguarded
+        time on the largest input it survives and the guarded time for every
+        input size
+    """
+    cases = list(ADVERSARIAL_CASES)
+    for rule_data in DEFAULT_RULES:
+        for pattern in rule_data['patterns']:
+            cases.append({
+                'name': rule_data['name'],
+                'pattern': pattern,
+                'unit': 'mot https://exemple.com 0612345678 ',
+                'suffix': '',
+                'unguarded_size': 1000,
+            })
+
+    results = []
+    for case in cases:
+        def probe(size):
+            return case['unit'] * size + case['suffix']
+
+        errors = validate_pattern(case['pattern'])
+        unguarded = re.compile(case['pattern'], re.IGNORECASE)
+        unguarded_s = _best_time(lambda: unguarded.findall(probe(case['unguarded_size'])), repeat)
+
+        guarded = {}
+        for size in sizes:
+            text = probe(size)
+            timings = []
+            overruns = 0
+            for _ in range(repeat):
+                # Fresh pattern so the circuit breaker does not skip later runs
+                pattern = GuardedPattern(case['pattern'])
+                start = time.perf_counter()
+                pattern.findall(text)
+                timings.append(time.perf_counter() - start)
+                overruns += pattern.overruns
+            guarded[size] = {'ms': min(timings) * 1000, 'overruns': overruns}
+
+        results.append({
+            'suite': 'regex',
+            'name': case['name'],
+            'pattern': case['pattern'],
+            'rejected': bool(errors),
+            'errors': errors,
+            'unguarded_size': case['unguarded_size'],
+            'unguarded_ms': unguarded_s * 1000,
+            'guarded': guarded,
+        })
+
+    return results
+
+
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Labelled corpus: every template is filled with random clean words, so the
+# same seed always produces the same texts. ``expected`` is True when the
+# seeded rules should flag the text
+CORPUS_TEMPLATES = {
+    'clean': {
+        'expected': False,
+        'templates': [
+            "{words}",
+            "Merci pour la séance, {words}",
+            "Le connecteur de la base est expliqué au chapitre suivant, {words}",
+            "Quelle est la réponse à la question 3 ? {words}",
+            "J'ai bien aimé le module sur la formation professionnelle, {words}",
+            "Le formateur a répondu à toutes nos questions {words}",
+        ],
+    },
+    'toxic': {
+        'expected': True,
+        'templates': [
+            "{words} espèce de con",
+            "Ferme ta gueule {words}",
+            "{words} t'es vraiment un débile",
+            "Ce cours c'est de la merde, {words}",
+            "{words} sale idiot",
+            "Va te faire voir {words}",
+        ],
+    },
+    'spam': {
+        'expected': True,
+        'templates': [
+            "{words} cliquez ici https://promo.exemple.com",
+            "OFFRE LIMITÉE : ARGENT FACILE POUR TOUS {words}",
+            "Devenez riche en une semaine, {words} visitez notre site",
+            "{words} formation gratuite sur www.exemple.net",
+            "Promotion spéciale !!!!! {words}",
+        ],
+    },
+    'threat': {
+        'expected': True,
+        'templates': [
+            "{words} je vais te retrouver",
+            "Je sais où tu habites, {words}",
+            "Tu vas le regretter {words}",
+            "{words} fais attention à toi",
+            "Je vais te tuer si tu recommences, {words}",
+        ],
+    },
+}
+
+# Long texts (forum posts, task descriptions): half of them hide a violation
+# from the other categories at the end
+LONG_TEXT_WORDS = (150, 400)
+
+CORPUS_CATEGORIES = ['clean', 'toxic', 'spam', 'threat', 'long']
+
+
+def build_default_rules():
+    """Unsaved copies of the seeded rules, with their keywords and patterns"""
+    return [
+        ContentModerationRule(
+            name=rule_data['name'],
+            rule_type=rule_data['rule_type'],
+            keywords=list(rule_data['keywords']),
+            patterns=list(rule_data['patterns']),
+            threshold=rule_data['threshold'],
+            severity=rule_data['severity'],
+            auto_block=rule_data['auto_block'],
+        )
+        for rule_data in DEFAULT_RULES
+        if rule_data['active']
+    ]
+
+
+def generate_corpus(count, seed=42):
+    """
+    Labelled texts spread evenly over the corpus categories
+
+    Returns:
+        list: (text, category, expected) tuples
+    """
+    rng = random.Random(seed)
+
+    def words(low, high):
+        return ' '.join(rng.choice(CLEAN_WORDS) for _ in range(rng.randint(low, high)))
+
+    corpus = []
+    for index in range(count):
+        category = CORPUS_CATEGORIES[index % len(CORPUS_CATEGORIES)]
+
+        if category == 'long':
+            text = words(*LONG_TEXT_WORDS)
+            expected = rng.random() < 0.5
+            if expected:
+                hidden = CORPUS_TEMPLATES[rng.choice(['toxic', 'spam', 'threat'])]
+                text += ' ' + rng.choice(hidden['templates']).format(words='')
+        else:
+            definition = CORPUS_TEMPLATES[category]
+            text = rng.choice(definition['templates']).format(words=words(2, 25))
+            expected = definition['expected']
+
+        corpus.append((text.strip(), category, expected))
+    return corpus
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    # The tolerance keeps exact ranks (0.99 * 100) from rounding up
+    rank = max(math.ceil(fraction * len(sorted_values) - 1e-9) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def benchmark_corpus(text_count=5000, repeat=3, seed=42):
+    """
+    Throughput, latency and detection quality of the seeded rules
+
+    The texts are evaluated by a CompiledRuleSet built from DEFAULT_RULES, the
+    rule set AIContentModerator compiles once the rules are seeded, without
+    the verdict cache so every text is actually evaluated.
+
+    Returns:
+        dict: texts per second of the fastest run, text by text and in one
+        batch, p50/p99 of the fastest time of every text, precision and
+        recall of the flagged texts overall and per category
+    """
+    rule_set = CompiledRuleSet(build_default_rules(), BENCHMARK_WHITELIST, version='benchmark')
+    corpus = generate_corpus(text_count, seed=seed)
+
+    best_total = None
+    latencies = [None] * len(corpus)
+    verdicts = []
+    for _ in range(repeat):
+        verdicts = []
+        start = time.perf_counter()
+        for index, (text, _category, _expected) in enumerate(corpus):
+            text_start = time.perf_counter()
+            verdicts.append(rule_set.evaluate(text))
+            elapsed = time.perf_counter() - text_start
+            # Fastest time of every text: percentiles are less sensitive to
+            # a scheduler hiccup during one run
+            if latencies[index] is None or elapsed < latencies[index]:
+                latencies[index] = elapsed
+        total = time.perf_counter() - start
+        best_total = total if best_total is None else min(best_total, total)
+
+    # Same texts through the batch path used by re-moderation and the batch API
+    texts = [text for text, _category, _expected in corpus]
+    best_batch = _best_time(lambda: rule_set.evaluate_batch(texts), repeat)
+
+    latencies.sort()
+
+    categories = {
+        category: {'texts': 0, 'expected': 0, 'flagged': 0, 'true_positives': 0}
+        for category in CORPUS_CATEGORIES
+    }
+    for (_text, category, expected), verdict in zip(corpus, verdicts):
+        flagged = bool(verdict.issues)
+        counts = categories[category]
+        counts['texts'] += 1
+        counts['expected'] += int(expected)
+        counts['flagged'] += int(flagged)
+        counts['true_positives'] += int(flagged and expected)
+
+    for counts in categories.values():
+        counts.update(_detection_rates(counts))
+
+    overall = {
+        field: sum(counts[field] for counts in categories.values())
+        for field in ['texts', 'expected', 'flagged', 'true_positives']
+    }
+    overall.update(_detection_rates(overall))
+
+    return {
+        'suite': 'corpus',
+        'texts': text_count,
+        'rules': len(rule_set.rules),
+        'seed': seed,
+        'texts_per_second': text_count / best_total if best_total else None,
+        'batch_texts_per_second': text_count / best_batch if best_batch else None,
+        'p50_us': percentile(latencies, 0.50) * 1_000_000,
+        'p99_us': percentile(latencies, 0.99) * 1_000_000,
+        'max_us': latencies[-1] * 1_000_000,
+        'precision': overall['precision'],
+        'recall': overall['recall'],
+        'categories': categories,
+    }
+
+
+def _detection_rates(counts):
+    return {
+        'precision': counts['true_positives'] / counts['flagged'] if counts['flagged'] else None,
+        'recall': counts['true_positives'] / counts['expected'] if counts['expected'] else None,
+    }
+
+
+def compare_corpus_results(results, baseline, tolerance=0.2):
+    """
+    Regressions of ``results`` against a previous run of the same corpus
+
+    Returns:
+        list: human-readable regressions, empty when every throughput,
+        latency and detection figure is within ``tolerance``
+    """
+    baseline_runs = {
+        (run['texts'], run['seed']): run for run in baseline if run.get('suite') == 'corpus'
+    }
+    regressions = []
+
+    for run in results:
+        previous = baseline_runs.get((run['texts'], run['seed']))
+        if previous is None:
+            continue
+
+        for field in ['texts_per_second', 'batch_texts_per_second']:
+            if field in previous and run[field] < previous[field] * (1 - tolerance):
+                regressions.append(
+                    f"{run['texts']} texts: {field} {run[field]:.0f} (was {previous[field]:.0f})"
+                )
+        for field in ['p50_us', 'p99_us']:
+            if run[field] > previous[field] * (1 + tolerance):
+                regressions.append(
+                    f"{run['texts']} texts: {field} {run[field]:.1f} us (was {previous[field]:.1f} us)"
+                )
+        # Detection quality is deterministic for a seed: any drop is a regression
+        for field in ['precision', 'recall']:
+            if (previous[field] or 0) - (run[field] or 0) > 1e-9:
+                regressions.append(
+                    f"{run['texts']} texts: {field} {run[field] or 0:.3f} (was {previous[field] or 0:.3f})"
+                )
+
+    return regressions
@@ -0,0 +1,457 @@
+"""
+Compiled moderation rule engine
+Builds an in-memory snapshot of the active rules once and reuses it until a
+rule changes, instead of querying and recompiling rules for every message
+"""
+
+from collections import namedtuple
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from users.models import Utilisateur
+
+from .batch_scoring import score_texts
+from .matcher import KeywordAutomaton
+from .normalization import fold_accents, normalize
+from .models import (
+    ContentModerationRule,
+    ContentModerationWhitelist,
+    ModerationRulesVersion,
+    NEGATIVE_WORDS,
+    TOXIC_PATTERNS,
+    SPAM_INDICATORS,
+)
+from .regex_guard import GuardedPattern, PATTERN_ERRORS, find_pathological_constructs
+
+logger = logging.getLogger(__name__)
+
+
+SEVERITY_RANK = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+
+
+# ``incomplete``: a rule could not scan the whole text (regex timeout or input
+# over budget), so the text gets a pending report and the verdict is not cached
+Verdict = namedtuple(
+    'Verdict',
+    ['issues', 'confidence', 'severity', 'auto_block', 'whitelisted', 'shadow_hits', 'rule_ids',
+     'incomplete'],
+    defaults=[(), (), False]
+)
+
+INCOMPLETE_ISSUE_TYPE = 'Analyse incomplète'
+
+
+def get_rules_version():
+    """
+    Return the current rule-set version stamp from the database
+
+    The stamp read outside a transaction is reused for
+    MODERATION_RULES_VERSION_TTL seconds, so moderating a message costs at
+    most one primary-key lookup per interval.
+    """
+    global _local_version
+
+    cached = _local_version
+    if cached is not None and time.monotonic() < cached[1]:
+        return cached[0]
+
+    version = ModerationRulesVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    if version is None:
+        version = ModerationRulesVersion.objects.get_or_create(
+            pk=1, defaults={'version': uuid.uuid4().hex}
+        )[0].version
+
+    # A stamp read inside a transaction may be rolled back
+    if not connection.in_atomic_block:
+        ttl = getattr(settings, 'MODERATION_RULES_VERSION_TTL', 1.0)
+        _local_version = (version, time.monotonic() + ttl)
+    return version
+
+
+def bump_rules_version():
+    """
+    Invalidate every compiled rule set built from the previous version
+
+    Called in the transaction of the rule change: the new stamp becomes
+    visible to other processes together with the rules.
+    """
+    global _local_version
+
+    version = uuid.uuid4().hex
+    if not ModerationRulesVersion.objects.filter(pk=1).update(version=version, updated_at=timezone.now()):
+        ModerationRulesVersion.objects.update_or_create(pk=1, defaults={'version': version})
+    _local_version = None
+    return version
+
+
+_local_version = None
+
+
+class CompiledRule:
+    """Immutable snapshot of a ContentModerationRule ready for evaluation"""
+
+    def __init__(self, rule, term_index):
+        self.id = rule.pk
+        self.name = rule.name
+        self.rule_type = rule.rule_type
+        self.threshold = rule.threshold
+        self.auto_block = rule.auto_block
+        self.severity = rule.severity
+
+        self.keywords = tuple(rule.keywords or ())
+        # Positions of the folded keywords in the rule set's shared automaton;
+        # only keyword rules evaluate their keyword list
+        if self.rule_type == 'keyword':
+            self.keyword_terms = tuple(
+                term_index(fold_accents(keyword.lower())) for keyword in self.keywords
+            )
+        else:
+            self.keyword_terms = ()
+        self.keyword_term_set = frozenset(self.keyword_terms)
+
+        # Sentiment rules count negative words found by the same automaton
+        if self.rule_type == 'sentiment':
+            self.negative_terms = frozenset(term_index(word) for word in NEGATIVE_WORDS)
+        else:
+            self.negative_terms = frozenset()
+
+        patterns = []
+        for pattern in rule.patterns or ():
+            try:
+                problems = find_pathological_constructs(pattern)
+                if problems:
+                    # Saved before validation existed or written outside the admin
+                    logger.warning(
+                        f"Skipping pathological pattern {pattern!r} of rule {self.name}: "
+                        f"{', '.join(problems)}"
+                    )
+                    continue
+                # Patterns run on the accent-folded text and are folded as a
+                # whole, character classes included: [éè] becomes [ee] and the
+                # range [à-ÿ] becomes [a-y], so ranges are best written in ASCII
+                patterns.append(GuardedPattern(fold_accents(pattern), rule_id=self.id))
+            except PATTERN_ERRORS:
+                continue
+        self.patterns = tuple(patterns)
+
+    def __repr__(self):
+        return f"<CompiledRule {self.name} ({self.rule_type})>"
+
+    def check(self, text, matched_terms, scores=None):
+        """
+        Same contract as ContentModerationRule.check_content, on a
+        NormalizedText and the automaton terms found in it; ``scores`` are
+        the TextScores of the text when they were computed for a whole batch
+        """
+        issues = []
+        confidence = 0.0
+
+        if self.rule_type == 'keyword':
+            confidence, detected_keywords = self._check_keywords(matched_terms)
+            if detected_keywords:
+                issues.append({
+                    'type': 'Mots-clés inappropriés',
+                    'details': detected_keywords,
+                    'rule': self.name
+                })
+
+        elif self.rule_type == 'pattern':
+            confidence, detected_patterns, complete = self._check_patterns(text)
+            if detected_patterns:
+                issues.append({
+                    'type': 'Contenu inapproprié détecté',
+                    'details': detected_patterns,
+                    'rule': self.name
+                })
+            if not complete:
+                # Reported for a human to review whether or not the rule fired
+                issues.append({
+                    'type': INCOMPLETE_ISSUE_TYPE,
+                    'details': 'Texte trop long ou délai dépassé: analyse partielle',
+                    'rule': self.name,
+                    'incomplete': True,
+                })
+
+        elif self.rule_type == 'sentiment':
+            if scores is not None:
+                confidence = scores.sentiment
+            else:
+                confidence = self._analyze_sentiment(matched_terms, text)
+            if confidence >= self.threshold:
+                issues.append({
+                    'type': 'Sentiment négatif',
+                    'details': f'Score: {confidence:.2f}',
+                    'rule': self.name
+                })
+
+        elif self.rule_type == 'toxicity':
+            if scores is not None:
+                confidence = scores.toxicity
+            else:
+                confidence = self._analyze_toxicity(text)
+            if confidence >= self.threshold:
+                issues.append({
+                    'type': 'Contenu toxique',
+                    'details': f'Score: {confidence:.2f}',
+                    'rule': self.name
+                })
+
+        elif self.rule_type == 'spam':
+            if scores is not None:
+                confidence = scores.spam
+            else:
+                confidence = self._detect_spam(text)
+            if confidence >= self.threshold:
+                issues.append({
+                    'type': 'Spam détecté',
+                    'details': f'Score: {confidence:.2f}',
+                    'rule': self.name
+                })
+
+        return confidence >= self.threshold, confidence, issues
+
+    def _check_keywords(self, matched_terms):
+        if not self.keywords:
+            return 0.0, []
+        if self.keyword_term_set.isdisjoint(matched_terms):
+            return 0.0, []
+
+        detected = [
+            keyword for keyword, term in zip(self.keywords, self.keyword_terms)
+            if term in matched_terms
+        ]
+        return len(detected) / len(self.keywords), detected
+
+    def _check_patterns(self, text):
+        if not self.patterns:
+            return 0.0, [], True
+
+        detected = []
+        complete = True
+        for pattern in self.patterns:
+            matches, scanned = pattern.scan(text.folded)
+            detected.extend(matches)
+            complete = complete and scanned
+
+        return (1.0 if detected else 0.0), detected, complete
+
+    def _analyze_sentiment(self, matched_terms, text):
+        negative_count = len(self.negative_terms & matched_terms)
+        return min(negative_count / max(len(text.tokens) * 0.1, 1), 1.0)
+
+    def _analyze_toxicity(self, text):
+        for pattern in TOXIC_PATTERNS:
+            if pattern.search(text.folded):
+                return 1.0
+        return 0.0
+
+    def _detect_spam(self, text):
+        score = 0.0
+        for pattern in SPAM_INDICATORS:
+            if pattern.search(text.folded):
+                score += 0.3
+        return min(score, 1.0)
+
+
+class CompiledRuleSet:
+    """All active rules compiled once for a given version stamp"""
+
+    def __init__(self, rules, whitelist_terms, version, shadow_rules=(),
+                 whitelisted_emails=(), whitelisted_author_ids=()):
+        terms = {}
+
+        def term_index(term):
+            return terms.setdefault(term, len(terms))
+
+        self.rules = tuple(CompiledRule(rule, term_index) for rule in rules)
+        # Observed only: never create reports or block content
+        self.shadow_rules = tuple(CompiledRule(rule, term_index) for rule in shadow_rules)
+        # Rules that must act before the content is shown, even when the
+        # rest of the moderation is deferred to the worker
+        self.blocking_rules = tuple(rule for rule in self.rules if rule.auto_block)
+        self.whitelist_terms = frozenset(
+            term_index(fold_accents(term.lower())) for term in whitelist_terms
+        )
+        self.version = version
+
+        # Whitelisted authors skip evaluation: answered from memory, by email
+        # or by user id when only the foreign key of the content is known
+        self.whitelisted_emails = frozenset(whitelisted_emails)
+        self.whitelisted_author_ids = frozenset(whitelisted_author_ids)
+
+        # Heuristic scores are only worth computing in batch when a rule uses them
+        all_rules = self.rules + self.shadow_rules
+        self.scores_heuristics = any(
+            rule.rule_type in ('sentiment', 'toxicity', 'spam') for rule in all_rules
+        )
+        self.negative_terms = frozenset().union(*(rule.negative_terms for rule in all_rules))
+
+        # One automaton for every keyword, negative word and whitelisted
+        # keyword/phrase, run on the folded lowercase text
+        self.automaton = KeywordAutomaton(terms)
+
+    @classmethod
+    def build(cls, version):
+        rules = []
+        shadow_rules = []
+        for rule in ContentModerationRule.objects.filter(Q(active=True) | Q(shadow=True)):
+            (shadow_rules if rule.shadow else rules).append(rule)
+
+        whitelist_terms = ContentModerationWhitelist.objects.filter(
+            active=True,
+            whitelist_type__in=['keyword', 'phrase']
+        ).values_list('value', flat=True)
+
+        whitelisted_emails = list(ContentModerationWhitelist.objects.filter(
+            active=True,
+            whitelist_type='user'
+        ).values_list('value', flat=True))
+        whitelisted_author_ids = Utilisateur.objects.filter(
+            email__in=whitelisted_emails
+        ).values_list('id', flat=True)
+
+        return cls(
+            rules, list(whitelist_terms), version, shadow_rules,
+            whitelisted_emails, list(whitelisted_author_ids)
+        )
+
+    def is_whitelisted_author(self, author):
+        """Whether ``author`` (a Utilisateur or None) is exempt from moderation"""
+        if author is None:
+            return False
+        # The loaded email is authoritative: the ids may predate an email change
+        return author.email in self.whitelisted_emails
+
+    def is_whitelisted_author_id(self, author_id):
+        # Users who signed up after the rule set was built are only known by
+        # email: they are caught later by is_whitelisted_author. Email changes
+        # of users bump the rules version (see signals), so ids are current
+        return author_id in self.whitelisted_author_ids
+
+    def evaluate(self, content, blocking_only=False, shadow=False, profile=None):
+        """
+        Run every compiled rule (or only the auto-block ones) against the text
+
+        When ``profile`` is a list, one (rule id, seconds) pair is appended to
+        it for every rule checked.
+
+        Returns:
+            Verdict: aggregated issues, max confidence, max severity,
+            whether any violated rule requires automatic blocking, whether a
+            whitelisted keyword or phrase exempted the text, when ``shadow``
+            is set the (rule, issues) pairs of violated shadow rules, and the
+            ids of the violated active rules
+        """
+        text = normalize(content)
+        matched_terms = self.automaton.find(text.folded_lower)
+
+        if not self.whitelist_terms.isdisjoint(matched_terms):
+            return Verdict([], 0.0, 'low', False, True)
+
+        return self._evaluate_text(text, matched_terms, blocking_only, shadow, profile)
+
+    def evaluate_batch(self, contents, blocking_only=False, shadow=False):
+        """
+        Verdicts of ``evaluate`` for a list of texts
+
+        The spam, toxicity and sentiment heuristics are scored for the whole
+        batch at once (see batch_scoring) instead of text by text; the
+        verdicts are identical to calling ``evaluate`` on every text.
+        """
+        texts = [normalize(content) for content in contents]
+        matched_terms = [self.automaton.find(text.folded_lower) for text in texts]
+
+        verdicts = [None] * len(texts)
+        pending = []
+        for index, terms in enumerate(matched_terms):
+            if self.whitelist_terms.isdisjoint(terms):
+                pending.append(index)
+            else:
+                verdicts[index] = Verdict([], 0.0, 'low', False, True)
+
+        scores = [None] * len(pending)
+        if self.scores_heuristics:
+            scores = score_texts(
+                [texts[index] for index in pending],
+                [matched_terms[index] for index in pending],
+                self.negative_terms,
+            )
+
+        for index, text_scores in zip(pending, scores):
+            verdicts[index] = self._evaluate_text(
+                texts[index], matched_terms[index], blocking_only, shadow, None, text_scores
+            )
+        return verdicts
+
+    def _evaluate_text(self, text, matched_terms, blocking_only, shadow, profile, scores=None):
+        all_issues = []
+        max_confidence = 0.0
+        max_severity = 'low'
+        should_auto_block = False
+        rule_ids = []
+        incomplete = False
+
+        rules = self.blocking_rules if blocking_only else self.rules
+        for rule in rules:
+            violated, confidence, issues = self._check(rule, text, matched_terms, profile, scores)
+            rule_incomplete = any(issue.get('incomplete') for issue in issues)
+
+            if violated:
+                rule_ids.append(rule.id)
+                max_confidence = max(max_confidence, confidence)
+
+                if rule.auto_block:
+                    should_auto_block = True
+
+            if violated or rule_incomplete:
+                all_issues.extend(issues)
+                incomplete = incomplete or rule_incomplete
+
+                if SEVERITY_RANK.get(rule.severity, 0) > SEVERITY_RANK[max_severity]:
+                    max_severity = rule.severity
+
+        shadow_hits = []
+        if shadow:
+            for rule in self.shadow_rules:
+                violated, confidence, issues = self._check(rule, text, matched_terms, profile, scores)
+                if violated:
+                    shadow_hits.append((rule, issues))
+
+        return Verdict(
+            all_issues, max_confidence, max_severity, should_auto_block, False,
+            shadow_hits, tuple(rule_ids), incomplete
+        )
+
+    def _check(self, rule, text, matched_terms, profile, scores=None):
+        if profile is None:
+            return rule.check(text, matched_terms, scores)
+
+        start = time.perf_counter()
+        result = rule.check(text, matched_terms, scores)
+        profile.append((rule.id, time.perf_counter() - start))
+        return result
+
+
+_rule_set = None
+_rule_set_lock = threading.Lock()
+
+
+def get_rule_set():
+    """Return the compiled rule set, rebuilding it only when the version changed"""
+    global _rule_set
+
+    version = get_rules_version()
+    rule_set = _rule_set
+    if rule_set is not None and rule_set.version == version:
+        return rule_set
+
+    with _rule_set_lock:
+        if _rule_set is None or _rule_set.version != version:
+            _rule_set = CompiledRuleSet.build(version)
+        return _rule_set
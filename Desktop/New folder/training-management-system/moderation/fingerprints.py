@@ -0,0 +1,98 @@
+"""
+Content fingerprints of editable moderated objects
+A hash of the moderated text fields is stored when an object is created, so
+a later save is only moderated again when one of those fields actually
+changed, and saves of unrelated fields (approval flags, statuses) cost at
+most one lookup
+"""
+
+import hashlib
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ModeratedContentFingerprint
+from .normalization import canonical_text
+
+
+# Moderated models whose text can be edited, with the fields moderation reads;
+# private messages are never edited, only flagged as read or archived
+EDITABLE_TEXT_FIELDS = {
+    'courses.CommentaireCours': ['commentaire'],
+    'messaging.ReponseDiscussion': ['contenu'],
+    'messaging.MessageGroupe': ['contenu'],
+    'formations.Task': ['titre', 'description'],
+}
+
+# Fingerprint states of a save
+UNCHANGED = 'unchanged'
+CHANGED = 'changed'
+UNKNOWN = 'unknown'
+
+
+def is_editable(instance):
+    return instance._meta.label in EDITABLE_TEXT_FIELDS
+
+
+def content_fingerprint(instance):
+    fields = EDITABLE_TEXT_FIELDS[instance._meta.label]
+    text = '\x1f'.join(canonical_text(getattr(instance, field) or '') for field in fields)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _lookup(instance):
+    return {
+        'content_type': ContentType.objects.get_for_model(instance),
+        'object_id': instance.pk,
+    }
+
+
+def record_fingerprint(instance):
+    """Store the fingerprint of a newly created object"""
+    try:
+        with transaction.atomic():
+            ModeratedContentFingerprint.objects.create(
+                **_lookup(instance), fingerprint=content_fingerprint(instance)
+            )
+    except IntegrityError:
+        # Saved twice within its creation: keep the latest text
+        ModeratedContentFingerprint.objects.filter(**_lookup(instance)).update(
+            fingerprint=content_fingerprint(instance), updated_at=timezone.now()
+        )
+
+
+def update_fingerprint(instance, update_fields=None):
+    """
+    Compare an edited object with its stored fingerprint and store the new one
+
+    Returns:
+        str: UNCHANGED when no moderated field changed, CHANGED when the text
+        differs from the last moderated one, UNKNOWN for objects created
+        before fingerprints were recorded
+    """
+    fields = EDITABLE_TEXT_FIELDS[instance._meta.label]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return UNCHANGED
+
+    fingerprint = content_fingerprint(instance)
+    lookup = _lookup(instance)
+    stored = ModeratedContentFingerprint.objects.filter(**lookup).values_list(
+        'fingerprint', flat=True
+    ).first()
+
+    if stored == fingerprint:
+        return UNCHANGED
+
+    if stored is None:
+        record_fingerprint(instance)
+        return UNKNOWN
+
+    ModeratedContentFingerprint.objects.filter(**lookup).update(
+        fingerprint=fingerprint, updated_at=timezone.now()
+    )
+    return CHANGED
+
+
+def forget_fingerprint(instance):
+    ModeratedContentFingerprint.objects.filter(**_lookup(instance)).delete()
@@ -0,0 +1,26 @@
+from django import forms
+
+from .models import ContentModerationRule
+from .regex_guard import validate_pattern
+
+
+class ContentModerationRuleForm(forms.ModelForm):
+    class Meta:
+        model = ContentModerationRule
+        exclude = ['regex_budget_overruns', 'last_regex_overrun']
+
+    def clean_patterns(self):
+        patterns = self.cleaned_data.get('patterns') or []
+        if not isinstance(patterns, list):
+            raise forms.ValidationError("Les expressions régulières doivent être une liste.")
+
+        errors = []
+        for pattern in patterns:
+            if not isinstance(pattern, str):
+                errors.append(f"{pattern!r}: une expression régulière doit être une chaîne.")
+                continue
+            errors.extend(f"{pattern}: {error}" for error in validate_pattern(pattern))
+
+        if errors:
+            raise forms.ValidationError(errors)
+        return patterns
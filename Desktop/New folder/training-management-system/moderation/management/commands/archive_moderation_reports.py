@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from moderation.archive import archivable_reports, archive_resolved_reports, get_archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Move resolved moderation reports into the archive table in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int,
+            help='Archive reports reviewed more than this many days ago '
+                 '(default: MODERATION_ARCHIVE_AFTER_DAYS)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Reports moved per transaction'
+        )
+        parser.add_argument(
+            '--max-batches', type=int,
+            help='Stop after this many batches (default: until nothing is left)'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Seconds to wait between batches to limit the load on the database'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the reports that would be archived'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_reports(get_archive_cutoff(options['older_than_days'])).count()
+            self.stdout.write(f'{count} reports would be archived')
+            return
+
+        total = 0
+        for archived in archive_resolved_reports(
+            older_than_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        ):
+            total += archived
+            self.stdout.write(f'Batch: {archived} archived ({total} total)')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} moderation reports'))
@@ -0,0 +1,155 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moderation.benchmarks import (
+    CORPUS_CATEGORIES,
+    benchmark_corpus,
+    benchmark_keyword_matching,
+    benchmark_regex_guard,
+    compare_corpus_results,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the moderation rule engine against the previous implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite', choices=['keywords', 'regex', 'corpus'], default='keywords',
+            help='Benchmark suite to run'
+        )
+        parser.add_argument(
+            '--texts', type=int, default=2000,
+            help='Number of generated texts per run'
+        )
+        parser.add_argument(
+            '--extra-keywords', type=int, nargs='+', default=[0, 200, 1000],
+            help='Synthetic keywords added on top of the seeded rules, one run per value'
+        )
+        parser.add_argument(
+            '--input-sizes', type=int, nargs='+', default=[20, 1000, 20000],
+            help='Adversarial input sizes (repetitions of the triggering unit) for the regex suite'
+        )
+        parser.add_argument(
+            '--corpus-sizes', type=int, nargs='+', default=[1000, 10000],
+            help='Labelled corpus sizes for the corpus suite, one run per value'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Seed of the generated corpus'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Timing repetitions (best run is kept)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON results of a previous corpus run; fail on regressions against it'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed throughput and latency regression against the baseline (0.2 = 20%%)'
+        )
+
+    def handle(self, *args, **options):
+        if options['suite'] == 'keywords':
+            results = self.run_keywords(options)
+        elif options['suite'] == 'regex':
+            results = self.run_regex(options)
+        elif options['suite'] == 'corpus':
+            results = self.run_corpus(options)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                # Size keys of the regex suite are ints: JSON turns them into strings
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            if options['suite'] != 'corpus':
+                raise CommandError('--baseline is only supported by the corpus suite')
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+            regressions = compare_corpus_results(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regression against the baseline'))
+
+    def run_keywords(self, options):
+        self.stdout.write(self.style.SUCCESS('Keyword matching: substring loop vs automaton'))
+        self.stdout.write(f"{'terms':>8} {'loop (us)':>12} {'automaton (us)':>16} {'speedup':>9}")
+
+        results = []
+        for extra_keywords in options['extra_keywords']:
+            result = benchmark_keyword_matching(
+                text_count=options['texts'],
+                extra_keywords=extra_keywords,
+                repeat=options['repeat'],
+            )
+            results.append(result)
+            self.stdout.write(
+                f"{result['terms']:>8} {result['loop_us_per_text']:>12.1f} "
+                f"{result['automaton_us_per_text']:>16.1f} {result['speedup']:>8.1f}x"
+            )
+        return results
+
+    def run_regex(self, options):
+        sizes = options['input_sizes']
+        self.stdout.write(self.style.SUCCESS('Pattern rules: unguarded re vs regex guard'))
+        self.stdout.write(
+            f"{'pattern':<40} {'save':>8} {'re (ms)':>16} "
+            + ' '.join(f"{f'n={size} (ms)':>16}" for size in sizes)
+        )
+
+        results = benchmark_regex_guard(sizes=sizes, repeat=options['repeat'])
+        for result in results:
+            guarded = ' '.join(
+                f"{result['guarded'][size]['ms']:>11.2f}{'*' if result['guarded'][size]['overruns'] else ' ':>5}"
+                for size in sizes
+            )
+            self.stdout.write(
+                f"{result['pattern'][:40]:<40} {'rejected' if result['rejected'] else 'ok':>8} "
+                f"{result['unguarded_ms']:>9.2f} n={result['unguarded_size']:<4} {guarded}"
+            )
+
+        self.stdout.write('* budget exceeded, the evaluation was cut short')
+        return results
+
+    def run_corpus(self, options):
+        self.stdout.write(self.style.SUCCESS('Seeded rules on the labelled corpus'))
+        self.stdout.write(
+            f"{'texts':>8} {'texts/s':>10} {'batch/s':>10} {'p50 (us)':>10} {'p99 (us)':>10} "
+            f"{'precision':>10} {'recall':>8}"
+        )
+
+        results = []
+        for text_count in options['corpus_sizes']:
+            result = benchmark_corpus(
+                text_count=text_count,
+                repeat=options['repeat'],
+                seed=options['seed'],
+            )
+            results.append(result)
+            self.stdout.write(
+                f"{result['texts']:>8} {result['texts_per_second']:>10.0f} "
+                f"{result['batch_texts_per_second']:>10.0f} {result['p50_us']:>10.1f} {result['p99_us']:>10.1f} "
+                f"{result['precision']:>10.3f} {result['recall']:>8.3f}"
+            )
+
+        # Detection figures of the largest corpus, per category
+        categories = results[-1]['categories']
+        self.stdout.write(f"\n{'category':>8} {'texts':>8} {'expected':>9} {'flagged':>8} {'recall':>8}")
+        for category in CORPUS_CATEGORIES:
+            counts = categories[category]
+            recall = f"{counts['recall']:.3f}" if counts['recall'] is not None else '-'
+            self.stdout.write(
+                f"{category:>8} {counts['texts']:>8} {counts['expected']:>9} "
+                f"{counts['flagged']:>8} {recall:>8}"
+            )
+        return results
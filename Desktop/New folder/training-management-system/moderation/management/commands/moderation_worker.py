@@ -0,0 +1,66 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from moderation.queue import release_stale_jobs
+from moderation.services import process_moderation_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process deferred moderation jobs in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of jobs claimed per batch'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--max-attempts', type=int, default=3,
+            help='Attempts before a job is marked as failed'
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=300,
+            help='Seconds after which jobs claimed by a dead worker are released'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue and exit instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        worker_id = uuid.uuid4().hex
+        self.stdout.write(self.style.SUCCESS(f'Moderation worker {worker_id} started'))
+
+        total_processed = 0
+        total_failed = 0
+
+        try:
+            while True:
+                release_stale_jobs(options['stale_after'])
+
+                processed, failed = process_moderation_jobs(
+                    batch_size=options['batch_size'],
+                    worker_id=worker_id,
+                    max_attempts=options['max_attempts'],
+                )
+                total_processed += processed
+                total_failed += failed
+
+                if processed or failed:
+                    self.stdout.write(f'Batch: {processed} processed, {failed} failed')
+                    continue
+
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Worker stopped: {total_processed} processed, {total_failed} failed')
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from moderation.models import ArchivedModerationReport, ContentModerationReport, ModerationReportRollup
+from moderation.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily report rollups from the live and archived moderation reports'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = rebuild_rollups(ContentModerationReport, ModerationReportRollup, ArchivedModerationReport)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows'))
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from moderation.remoderation import Remoderator
+from moderation.services import MODERATED_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Re-scan existing content against the current moderation rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--content-type', action='append', choices=list(MODERATED_MODELS),
+            help='Content type to re-scan (repeatable, default: all)'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only re-scan content created on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Evaluate and report counts without writing anything'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Evaluation processes (default 1: evaluates in the current process)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Rows fetched and evaluated per chunk'
+        )
+        parser.add_argument(
+            '--include-reported', action='store_true',
+            help='Also re-scan content that already has a moderation report'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+
+        content_types = options['content_type'] or list(MODERATED_MODELS)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: no report will be created'))
+
+        with Remoderator(
+            workers=max(options['workers'], 1),
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            include_reported=options['include_reported'],
+        ) as remoderator:
+            for content_type_label in content_types:
+                start = time.perf_counter()
+                totals = remoderator.run(content_type_label, since=since)
+                elapsed = time.perf_counter() - start
+
+                rate = totals['scanned'] / elapsed if elapsed else 0
+                self.stdout.write(
+                    f"{content_type_label}: {totals['scanned']} scanned, "
+                    f"{totals['skipped']} skipped, {totals['flagged']} flagged, "
+                    f"{totals['auto_blocked']} auto-blocked ({rate:.0f} rows/s)"
+                )
+
+        self.stdout.write(self.style.SUCCESS('Re-moderation complete'))
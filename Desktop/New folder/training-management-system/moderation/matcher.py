@@ -0,0 +1,81 @@
+"""
+Multi-keyword matcher
+Aho-Corasick automaton that finds every keyword occurring in a text in a
+single pass, whatever the number of keywords
+"""
+
+from collections import deque
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a fixed list of terms"""
+
+    def __init__(self, terms):
+        self.terms = tuple(terms)
+
+        goto = [{}]
+        fail = [0]
+        outputs = [[]]
+        always = []
+
+        # Trie of every term
+        for index, term in enumerate(self.terms):
+            if not term:
+                # An empty term is contained in every text
+                always.append(index)
+                continue
+            state = 0
+            for char in term:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    fail.append(0)
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+
+        # Failure links, breadth first so shorter suffixes are resolved first
+        order = []
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for char, child in goto[state].items():
+                queue.append(child)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(char, 0)
+                fail[child] = target if target != child else 0
+                outputs[child].extend(outputs[fail[child]])
+
+        # Flatten into a DFA so matching needs one dict lookup per character
+        delta = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        for state in order:
+            transitions = dict(delta[fail[state]])
+            transitions.update(goto[state])
+            delta[state] = transitions
+
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+        self._always = frozenset(always)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def find(self, text):
+        """Return the indices of every term contained in ``text``"""
+        delta = self._delta
+        outputs = self._outputs
+        found = set(self._always)
+
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+
+        return found
@@ -0,0 +1,150 @@
+"""
+Buffered moderation metrics
+Counters are aggregated in memory per process and flushed to the database on
+an interval, so metrics never add a write to every moderated message
+"""
+
+import logging
+
+from django.utils import timezone
+
+from training_management.counters import BufferedCounters, increment_row
+
+from .models import ModerationStats, RuleStats, ShadowRuleStats
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsCounters(BufferedCounters):
+    """Moderation counters, flushed every MODERATION_METRICS_FLUSH_INTERVAL seconds"""
+
+    flush_interval_setting = 'MODERATION_METRICS_FLUSH_INTERVAL'
+
+
+class ShadowRuleRecorder(MetricsCounters):
+    """Hit counters and sample matches of shadow rules"""
+
+    max_samples = 10
+
+    def __init__(self, flush_interval=None):
+        super().__init__(flush_interval)
+        self._samples = {}
+
+    def record(self, rule_set, verdict, content_text):
+        """Count one evaluation of every shadow rule of ``rule_set``"""
+        if not rule_set.shadow_rules:
+            return
+
+        today = timezone.localdate()
+        hit_ids = set()
+
+        for rule, issues in verdict.shadow_hits:
+            hit_ids.add(rule.id)
+            self.add(
+                (rule.id, today),
+                evaluated=1,
+                hits=1,
+                overlapping_hits=int(bool(verdict.issues)),
+            )
+            self._add_sample((rule.id, today), {
+                'excerpt': content_text[:200],
+                'details': [issue.get('details') for issue in issues],
+                'active_rules': [issue.get('rule') for issue in verdict.issues],
+            })
+
+        for rule in rule_set.shadow_rules:
+            if rule.id not in hit_ids:
+                self.add((rule.id, today), evaluated=1)
+
+        self.maybe_flush()
+
+    def _add_sample(self, key, sample):
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            if len(samples) < self.max_samples:
+                samples.append(sample)
+
+    def flush(self):
+        with self._lock:
+            samples, self._samples = self._samples, {}
+        super().flush()
+        self._write_samples(samples)
+
+    def write(self, pending):
+        for (rule_id, date), increments in pending.items():
+            increment_row(ShadowRuleStats, {'rule_id': rule_id, 'date': date}, increments)
+
+    def _write_samples(self, samples):
+        # Samples are best effort: the list is capped, so a lost append under
+        # concurrent flushes only costs one example
+        for (rule_id, date), new_samples in samples.items():
+            try:
+                stats = ShadowRuleStats.objects.filter(rule_id=rule_id, date=date).first()
+                if stats is None or len(stats.sample_matches) >= self.max_samples:
+                    continue
+                stats.sample_matches = (stats.sample_matches + new_samples)[:self.max_samples]
+                stats.save(update_fields=['sample_matches'])
+            except Exception as e:
+                logger.error(f"Error saving shadow rule samples: {e}")
+
+
+class DailyStatsCounters(MetricsCounters):
+    """Increments of today's ModerationStats row"""
+
+    def increment(self, **increments):
+        self.add(timezone.localdate(), **increments)
+        self.maybe_flush()
+
+    def write(self, pending):
+        for date, increments in pending.items():
+            increment_row(ModerationStats, {'date': date}, increments)
+
+
+class VerdictCacheCounters(DailyStatsCounters):
+    """Daily hit and miss counters of the verdict cache"""
+
+    def record(self, hit):
+        if hit:
+            self.increment(verdict_cache_hits=1)
+        else:
+            self.increment(verdict_cache_misses=1)
+
+
+class RuleMetricsRecorder(MetricsCounters):
+    """Per-rule evaluation time histograms and hit counters"""
+
+    def record(self, profile, verdict):
+        """
+        Count the timings of the rules run for one text and the rules the
+        verdict reports as violated (cached verdicts have no timings)
+        """
+        today = timezone.localdate()
+
+        for rule_id, seconds in profile:
+            microseconds = int(seconds * 1_000_000)
+            self.add(
+                (rule_id, today),
+                evaluations=1,
+                total_time_us=microseconds,
+                **{RuleStats.latency_bucket(microseconds): 1}
+            )
+
+        for rule_id in verdict.rule_ids:
+            self.add((rule_id, today), hits=1)
+        for rule, _ in verdict.shadow_hits:
+            self.add((rule.id, today), hits=1)
+
+        self.maybe_flush()
+
+    def write(self, pending):
+        for (rule_id, date), increments in pending.items():
+            increment_row(RuleStats, {'rule_id': rule_id, 'date': date}, increments)
+
+
+shadow_recorder = ShadowRuleRecorder()
+# Content of whitelisted authors, counted without a write per message
+whitelisted_content_counters = DailyStatsCounters()
+# Content refused before it was saved, which has no report to count it
+blocked_content_counters = DailyStatsCounters()
+verdict_cache_counters = VerdictCacheCounters()
+rule_metrics = RuleMetricsRecorder()
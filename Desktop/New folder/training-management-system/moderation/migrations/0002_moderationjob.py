@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('moderation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('content_type_label', models.CharField(choices=[('course_comment', 'Commentaire de cours'), ('discussion_reply', 'Réponse de discussion'), ('group_message', 'Message de groupe'), ('private_message', 'Message privé'), ('formation_comment', 'Commentaire de formation'), ('task_description', 'Description de tâche')], max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('processing', 'En cours'), ('done', 'Terminé'), ('failed', 'Échoué')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, help_text='Identifiant du worker', max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Tâche de Modération',
+                'verbose_name_plural': 'Tâches de Modération',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='moderation__status_f55ff9_idx'), models.Index(fields=['claimed_by'], name='moderation__claimed_819e9c_idx')],
+            },
+        ),
+    ]
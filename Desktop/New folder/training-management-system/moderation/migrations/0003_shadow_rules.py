@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0002_moderationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentmoderationrule',
+            name='shadow',
+            field=models.BooleanField(default=False, help_text='Évaluer la règle sans créer de rapport ni bloquer (mode observation)'),
+        ),
+        migrations.CreateModel(
+            name='ShadowRuleStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('evaluated', models.PositiveIntegerField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('overlapping_hits', models.PositiveIntegerField(default=0, help_text='Détections sur du contenu déjà signalé par une règle active')),
+                ('sample_matches', models.JSONField(blank=True, default=list, help_text='Exemples de détections')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shadow_stats', to='moderation.contentmoderationrule')),
+            ],
+            options={
+                'verbose_name': 'Statistiques de Règle en Observation',
+                'verbose_name_plural': 'Statistiques de Règles en Observation',
+                'ordering': ['-date'],
+                'unique_together': {('rule', 'date')},
+            },
+        ),
+    ]
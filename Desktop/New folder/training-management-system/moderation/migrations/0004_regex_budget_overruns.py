@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0003_shadow_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentmoderationrule',
+            name='last_regex_overrun',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentmoderationrule',
+            name='regex_budget_overruns',
+            field=models.PositiveIntegerField(default=0, help_text="Nombre d'évaluations interrompues pour dépassement du budget de temps"),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0004_regex_budget_overruns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moderationstats',
+            name='verdict_cache_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='moderationstats',
+            name='verdict_cache_misses',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0005_verdict_cache_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuleStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('evaluations', models.PositiveIntegerField(default=0, help_text='Évaluations réellement exécutées')),
+                ('hits', models.PositiveIntegerField(default=0, help_text='Contenus signalés par la règle, y compris depuis le cache des verdicts')),
+                ('total_time_us', models.BigIntegerField(default=0, help_text="Temps cumulé d'évaluation (µs)")),
+                ('time_under_10us', models.PositiveIntegerField(default=0)),
+                ('time_under_100us', models.PositiveIntegerField(default=0)),
+                ('time_under_1ms', models.PositiveIntegerField(default=0)),
+                ('time_under_10ms', models.PositiveIntegerField(default=0)),
+                ('time_over_10ms', models.PositiveIntegerField(default=0)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='moderation.contentmoderationrule')),
+            ],
+            options={
+                'verbose_name': 'Statistiques de Règle',
+                'verbose_name_plural': 'Statistiques de Règles',
+                'ordering': ['-date'],
+                'unique_together': {('rule', 'date')},
+            },
+        ),
+    ]
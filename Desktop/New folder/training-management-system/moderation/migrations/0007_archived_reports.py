@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('moderation', '0006_rule_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedModerationReport',
+            fields=[
+                ('id', models.PositiveIntegerField(help_text="Identifiant du rapport d'origine", primary_key=True, serialize=False)),
+                ('object_id', models.PositiveIntegerField()),
+                ('content_type_label', models.CharField(choices=[('course_comment', 'Commentaire de cours'), ('discussion_reply', 'Réponse de discussion'), ('group_message', 'Message de groupe'), ('private_message', 'Message privé'), ('formation_comment', 'Commentaire de formation'), ('task_description', 'Description de tâche')], max_length=50)),
+                ('ai_confidence', models.FloatField()),
+                ('severity', models.CharField(choices=[('low', 'Faible'), ('medium', 'Moyenne'), ('high', 'Élevée'), ('critical', 'Critique')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('reviewing', 'En révision'), ('approved', 'Approuvé'), ('rejected', 'Rejeté'), ('auto_filtered', 'Filtré automatiquement')], max_length=20)),
+                ('auto_blocked', models.BooleanField(default=False)),
+                ('review_date', models.DateTimeField(blank=True, null=True)),
+                ('payload', models.BinaryField(help_text='Contenu, problèmes détectés et notes (JSON compressé)')),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Rapport de Modération Archivé',
+                'verbose_name_plural': 'Rapports de Modération Archivés',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='contentmoderationreport',
+            index=models.Index(fields=['status', 'review_date'], name='moderation__status_dc14a0_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedmoderationreport',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_moderation_reports', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedmoderationreport',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AddField(
+            model_name='archivedmoderationreport',
+            name='reviewed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_moderation_reviews', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmoderationreport',
+            index=models.Index(fields=['author', 'created_at'], name='moderation__author__f460f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmoderationreport',
+            index=models.Index(fields=['content_type', 'object_id'], name='moderation__content_ca603b_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('moderation', '0007_archived_reports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModeratedContentFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('fingerprint', models.CharField(help_text='Empreinte du texte modéré', max_length=32)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Empreinte de Contenu Modéré',
+                'verbose_name_plural': 'Empreintes de Contenu Modéré',
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    from moderation.rollups import rebuild_rollups
+
+    rebuild_rollups(
+        apps.get_model('moderation', 'ContentModerationReport'),
+        apps.get_model('moderation', 'ModerationReportRollup'),
+        apps.get_model('moderation', 'ArchivedModerationReport'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0008_content_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationReportRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Date de création des rapports')),
+                ('content_type_label', models.CharField(choices=[('course_comment', 'Commentaire de cours'), ('discussion_reply', 'Réponse de discussion'), ('group_message', 'Message de groupe'), ('private_message', 'Message privé'), ('formation_comment', 'Commentaire de formation'), ('task_description', 'Description de tâche')], max_length=50)),
+                ('severity', models.CharField(choices=[('low', 'Faible'), ('medium', 'Moyenne'), ('high', 'Élevée'), ('critical', 'Critique')], max_length=20)),
+                ('reports', models.PositiveIntegerField(default=0)),
+                ('auto_blocked', models.PositiveIntegerField(default=0)),
+                ('pending', models.PositiveIntegerField(default=0, help_text='Rapports encore en attente')),
+                ('approved', models.PositiveIntegerField(default=0)),
+                ('rejected', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Agrégat de Rapports',
+                'verbose_name_plural': 'Agrégats de Rapports',
+                'ordering': ['-date'],
+                'unique_together': {('date', 'content_type_label', 'severity')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
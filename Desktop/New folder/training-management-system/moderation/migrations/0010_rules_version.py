@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0009_report_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationRulesVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=32)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Version des Règles',
+                'verbose_name_plural': 'Versions des Règles',
+            },
+        ),
+    ]
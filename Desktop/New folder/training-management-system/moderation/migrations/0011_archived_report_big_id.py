@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0010_rules_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedmoderationreport',
+            name='id',
+            field=models.PositiveBigIntegerField(help_text="Identifiant du rapport d'origine", primary_key=True, serialize=False),
+        ),
+    ]
@@ -3,8 +3,38 @@ from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from users.models import Utilisateur
+from .normalization import fold_accents, normalize
 import re
 import json
+import zlib
+
+
+# Built-in heuristics shared by the rule model and the compiled rule engine
+# Words and patterns are accent-folded: they run on the folded text
+NEGATIVE_WORDS = [
+    fold_accents(word) for word in [
+        'nul', 'terrible', 'horreur', 'déteste', 'stupide', 'idiot',
+        'débile', 'merde', 'pourri', 'catastrophe', 'disaster'
+    ]
+]
+
+TOXIC_PATTERNS = [
+    re.compile(fold_accents(pattern), re.IGNORECASE) for pattern in [
+        r'\b(?:con+ard|sal[eo]pe?|put[ea]|merde|chier|foutre)\b',
+        r'\b(?:ferme\s+ta\s+gueule|va\s+te\s+faire)\b',
+        r'(?:espèce\s+de?|sale)\s+(?:con|idiot|débile)',
+    ]
+]
+
+SPAM_INDICATORS = [
+    re.compile(fold_accents(pattern), re.IGNORECASE) for pattern in [
+        r'(?:https?://|www\.)\S+',  # URLs
+        r'(?:achetez|vendez|gratuit|promotion|offre\s+spéciale)',  # Commercial
+        r'(?:contactez|appelez|envoyez|email)',  # Contact requests
+        r'[A-Z\s]{20,}',  # All caps spam
+        r'(.)\1{4,}',  # Repeated characters
+    ]
+]
 
 
 class ContentModerationReport(models.Model):
@@ -70,6 +100,7 @@ class ContentModerationReport(models.Model):
             models.Index(fields=['status', 'severity']),
             models.Index(fields=['auto_blocked']),
             models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['status', 'review_date']),
         ]
     
     def __str__(self):
@@ -109,6 +140,15 @@ class ContentModerationRule(models.Model):
     
     # Metadata
     active = models.BooleanField(default=True)
+    shadow = models.BooleanField(
+        default=False,
+        help_text="Évaluer la règle sans créer de rapport ni bloquer (mode observation)"
+    )
+    regex_budget_overruns = models.PositiveIntegerField(
+        default=0,
+        help_text="Nombre d'évaluations interrompues pour dépassement du budget de temps"
+    )
+    last_regex_overrun = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -125,11 +165,12 @@ class ContentModerationRule(models.Model):
         if not self.active or not content:
             return False, 0.0, []
         
+        text = normalize(content)
         issues = []
         confidence = 0.0
         
         if self.rule_type == 'keyword':
-            confidence, detected_keywords = self._check_keywords(content)
+            confidence, detected_keywords = self._check_keywords(text)
             if detected_keywords:
                 issues.append({
                     'type': 'Mots-clés inappropriés',
@@ -138,7 +179,7 @@ class ContentModerationRule(models.Model):
                 })
         
         elif self.rule_type == 'pattern':
-            confidence, detected_patterns = self._check_patterns(content)
+            confidence, detected_patterns = self._check_patterns(text)
             if detected_patterns:
                 issues.append({
                     'type': 'Contenu inapproprié détecté',
@@ -147,7 +188,7 @@ class ContentModerationRule(models.Model):
                 })
         
         elif self.rule_type == 'sentiment':
-            confidence = self._analyze_sentiment(content)
+            confidence = self._analyze_sentiment(text)
             if confidence >= self.threshold:
                 issues.append({
                     'type': 'Sentiment négatif',
@@ -156,7 +197,7 @@ class ContentModerationRule(models.Model):
                 })
         
         elif self.rule_type == 'toxicity':
-            confidence = self._analyze_toxicity(content)
+            confidence = self._analyze_toxicity(text)
             if confidence >= self.threshold:
                 issues.append({
                     'type': 'Contenu toxique',
@@ -165,7 +206,7 @@ class ContentModerationRule(models.Model):
                 })
         
         elif self.rule_type == 'spam':
-            confidence = self._detect_spam(content)
+            confidence = self._detect_spam(text)
             if confidence >= self.threshold:
                 issues.append({
                     'type': 'Spam détecté',
@@ -175,22 +216,21 @@ class ContentModerationRule(models.Model):
         
         return confidence >= self.threshold, confidence, issues
     
-    def _check_keywords(self, content):
+    def _check_keywords(self, text):
         """Check for inappropriate keywords"""
         if not self.keywords:
             return 0.0, []
         
-        content_lower = content.lower()
         detected = []
         
         for keyword in self.keywords:
-            if keyword.lower() in content_lower:
+            if fold_accents(keyword.lower()) in text.folded_lower:
                 detected.append(keyword)
         
         confidence = len(detected) / len(self.keywords) if self.keywords else 0.0
         return confidence, detected
     
-    def _check_patterns(self, content):
+    def _check_patterns(self, text):
         """Check for regex patterns"""
         if not self.patterns:
             return 0.0, []
@@ -199,7 +239,7 @@ class ContentModerationRule(models.Model):
         
         for pattern in self.patterns:
             try:
-                matches = re.findall(pattern, content, re.IGNORECASE)
+                matches = re.findall(fold_accents(pattern), text.folded, re.IGNORECASE)
                 if matches:
                     detected.extend(matches)
             except re.error:
@@ -208,47 +248,27 @@ class ContentModerationRule(models.Model):
         confidence = 1.0 if detected else 0.0
         return confidence, detected
     
-    def _analyze_sentiment(self, content):
+    def _analyze_sentiment(self, text):
         """Simple sentiment analysis (can be enhanced with AI libraries)"""
         # Simple negative sentiment detection
-        negative_words = [
-            'nul', 'terrible', 'horreur', 'déteste', 'stupide', 'idiot',
-            'débile', 'merde', 'pourri', 'catastrophe', 'disaster'
-        ]
-        
-        content_lower = content.lower()
-        negative_count = sum(1 for word in negative_words if word in content_lower)
-        total_words = len(content.split())
+        negative_count = sum(1 for word in NEGATIVE_WORDS if word in text.folded_lower)
+        total_words = len(text.tokens)
         
         return min(negative_count / max(total_words * 0.1, 1), 1.0)
     
-    def _analyze_toxicity(self, content):
+    def _analyze_toxicity(self, text):
         """Simple toxicity detection (can be enhanced with AI libraries)"""
-        toxic_patterns = [
-            r'\b(?:con+ard|sal[eo]pe?|put[ea]|merde|chier|foutre)\b',
-            r'\b(?:ferme\s+ta\s+gueule|va\s+te\s+faire)\b',
-            r'(?:espèce\s+de?|sale)\s+(?:con|idiot|débile)',
-        ]
-        
-        for pattern in toxic_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
+        for pattern in TOXIC_PATTERNS:
+            if pattern.search(text.folded):
                 return 1.0
         
         return 0.0
     
-    def _detect_spam(self, content):
+    def _detect_spam(self, text):
         """Simple spam detection"""
-        spam_indicators = [
-            r'(?:https?://|www\.)\S+',  # URLs
-            r'(?:achetez|vendez|gratuit|promotion|offre\s+spéciale)',  # Commercial
-            r'(?:contactez|appelez|envoyez|email)',  # Contact requests
-            r'[A-Z\s]{20,}',  # All caps spam
-            r'(.)\1{4,}',  # Repeated characters
-        ]
-        
         score = 0.0
-        for pattern in spam_indicators:
-            if re.search(pattern, content, re.IGNORECASE):
+        for pattern in SPAM_INDICATORS:
+            if pattern.search(text.folded):
                 score += 0.3
         
         return min(score, 1.0)
@@ -290,6 +310,8 @@ class ModerationStats(models.Model):
     auto_blocked = models.PositiveIntegerField(default=0)
     human_reviewed = models.PositiveIntegerField(default=0)
     false_positives = models.PositiveIntegerField(default=0)
+    verdict_cache_hits = models.PositiveIntegerField(default=0)
+    verdict_cache_misses = models.PositiveIntegerField(default=0)
     
     class Meta:
         verbose_name = 'Statistiques de Modération'
@@ -298,3 +320,269 @@ class ModerationStats(models.Model):
     
     def __str__(self):
         return f"Stats {self.date}: {self.flagged_content}/{self.total_content_checked} signalés"
+    
+    @property
+    def verdict_cache_hit_rate(self):
+        lookups = self.verdict_cache_hits + self.verdict_cache_misses
+        return self.verdict_cache_hits / lookups if lookups else 0.0
+
+
+class ShadowRuleStats(models.Model):
+    """Daily hit counters for rules evaluated in shadow mode"""
+    
+    rule = models.ForeignKey(ContentModerationRule, on_delete=models.CASCADE, related_name='shadow_stats')
+    date = models.DateField(default=timezone.now)
+    evaluated = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    overlapping_hits = models.PositiveIntegerField(
+        default=0,
+        help_text="Détections sur du contenu déjà signalé par une règle active"
+    )
+    sample_matches = models.JSONField(default=list, blank=True, help_text="Exemples de détections")
+    
+    class Meta:
+        verbose_name = 'Statistiques de Règle en Observation'
+        verbose_name_plural = 'Statistiques de Règles en Observation'
+        ordering = ['-date']
+        unique_together = ['rule', 'date']
+    
+    def __str__(self):
+        return f"{self.rule.name} {self.date}: {self.hits}/{self.evaluated}"
+    
+    @property
+    def hit_rate(self):
+        return (self.hits / self.evaluated * 100) if self.evaluated else 0
+
+
+class RuleStats(models.Model):
+    """Daily evaluation time and hit counters of each moderation rule"""
+    
+    # (upper bound in microseconds, counter field); the last bucket is open-ended
+    LATENCY_BUCKETS = [
+        (10, 'time_under_10us'),
+        (100, 'time_under_100us'),
+        (1000, 'time_under_1ms'),
+        (10000, 'time_under_10ms'),
+        (None, 'time_over_10ms'),
+    ]
+    
+    rule = models.ForeignKey(ContentModerationRule, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField(default=timezone.now)
+    evaluations = models.PositiveIntegerField(default=0, help_text="Évaluations réellement exécutées")
+    hits = models.PositiveIntegerField(
+        default=0,
+        help_text="Contenus signalés par la règle, y compris depuis le cache des verdicts"
+    )
+    total_time_us = models.BigIntegerField(default=0, help_text="Temps cumulé d'évaluation (µs)")
+    
+    # Latency histogram
+    time_under_10us = models.PositiveIntegerField(default=0)
+    time_under_100us = models.PositiveIntegerField(default=0)
+    time_under_1ms = models.PositiveIntegerField(default=0)
+    time_under_10ms = models.PositiveIntegerField(default=0)
+    time_over_10ms = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Statistiques de Règle'
+        verbose_name_plural = 'Statistiques de Règles'
+        ordering = ['-date']
+        unique_together = ['rule', 'date']
+    
+    def __str__(self):
+        return f"{self.rule.name} {self.date}: {self.hits} détections, {self.evaluations} évaluations"
+    
+    @classmethod
+    def latency_bucket(cls, microseconds):
+        for upper_bound, field in cls.LATENCY_BUCKETS:
+            if upper_bound is None or microseconds < upper_bound:
+                return field
+    
+    @property
+    def average_time_us(self):
+        return self.total_time_us / self.evaluations if self.evaluations else 0.0
+    
+    @property
+    def histogram(self):
+        return [(field, getattr(self, field)) for _, field in self.LATENCY_BUCKETS]
+
+
+class ModerationJob(models.Model):
+    """Deferred moderation work queued by post_save and run by moderation_worker"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('processing', 'En cours'),
+        ('done', 'Terminé'),
+        ('failed', 'Échoué'),
+    ]
+    
+    # Generic relation to the content to moderate
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    content_type_label = models.CharField(max_length=50, choices=ContentModerationReport.CONTENT_TYPE_CHOICES)
+    
+    # Queue state
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_by = models.CharField(max_length=32, blank=True, help_text="Identifiant du worker")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Tâche de Modération'
+        verbose_name_plural = 'Tâches de Modération'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['claimed_by']),
+        ]
+    
+    def __str__(self):
+        return f"Tâche {self.content_type_label} #{self.object_id} ({self.status})"
+
+
+class ArchivedModerationReport(models.Model):
+    """
+    Resolved moderation report moved out of ContentModerationReport
+    Keeps the original id and the searchable columns; the content, the
+    detected issues and the review notes are stored as compressed JSON
+    """
+    
+    id = models.PositiveBigIntegerField(primary_key=True, help_text="Identifiant du rapport d'origine")
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_type_label = models.CharField(max_length=50, choices=ContentModerationReport.CONTENT_TYPE_CHOICES)
+    author = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='archived_moderation_reports')
+    ai_confidence = models.FloatField()
+    severity = models.CharField(max_length=20, choices=ContentModerationReport.SEVERITY_CHOICES)
+    status = models.CharField(max_length=20, choices=ContentModerationReport.STATUS_CHOICES)
+    auto_blocked = models.BooleanField(default=False)
+    reviewed_by = models.ForeignKey(
+        Utilisateur, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_moderation_reviews'
+    )
+    review_date = models.DateTimeField(null=True, blank=True)
+    payload = models.BinaryField(help_text="Contenu, problèmes détectés et notes (JSON compressé)")
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Rapport de Modération Archivé'
+        verbose_name_plural = 'Rapports de Modération Archivés'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['author', 'created_at']),
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+    
+    def __str__(self):
+        return f"Archive {self.content_type_label} #{self.id} ({self.status})"
+    
+    @classmethod
+    def from_report(cls, report):
+        payload = {
+            'original_content': report.original_content,
+            'detected_issues': report.detected_issues,
+            'review_notes': report.review_notes,
+        }
+        return cls(
+            id=report.id,
+            content_type_id=report.content_type_id,
+            object_id=report.object_id,
+            content_type_label=report.content_type_label,
+            author_id=report.author_id,
+            ai_confidence=report.ai_confidence,
+            severity=report.severity,
+            status=report.status,
+            auto_blocked=report.auto_blocked,
+            reviewed_by_id=report.reviewed_by_id,
+            review_date=report.review_date,
+            payload=zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8')),
+            created_at=report.created_at,
+        )
+    
+    @property
+    def payload_data(self):
+        return json.loads(zlib.decompress(bytes(self.payload)).decode('utf-8'))
+    
+    @property
+    def original_content(self):
+        return self.payload_data['original_content']
+    
+    @property
+    def detected_issues(self):
+        return self.payload_data['detected_issues']
+    
+    @property
+    def review_notes(self):
+        return self.payload_data['review_notes']
+
+
+class ModeratedContentFingerprint(models.Model):
+    """Hash of the text last moderated for an editable object"""
+    
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    fingerprint = models.CharField(max_length=32, help_text="Empreinte du texte modéré")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Empreinte de Contenu Modéré'
+        verbose_name_plural = 'Empreintes de Contenu Modéré'
+        unique_together = ['content_type', 'object_id']
+    
+    def __str__(self):
+        return f"Empreinte {self.content_type_id}:{self.object_id}"
+
+
+class ModerationReportRollup(models.Model):
+    """Daily report counters per content type and severity, kept up to date with the reports"""
+    
+    # Report status -> counter of the reports currently in that status
+    STATUS_COUNTERS = {
+        'pending': 'pending',
+        'approved': 'approved',
+        'rejected': 'rejected',
+    }
+    
+    date = models.DateField(help_text="Date de création des rapports")
+    content_type_label = models.CharField(max_length=50, choices=ContentModerationReport.CONTENT_TYPE_CHOICES)
+    severity = models.CharField(max_length=20, choices=ContentModerationReport.SEVERITY_CHOICES)
+    reports = models.PositiveIntegerField(default=0)
+    auto_blocked = models.PositiveIntegerField(default=0)
+    pending = models.PositiveIntegerField(default=0, help_text="Rapports encore en attente")
+    approved = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Agrégat de Rapports'
+        verbose_name_plural = 'Agrégats de Rapports'
+        ordering = ['-date']
+        unique_together = ['date', 'content_type_label', 'severity']
+    
+    def __str__(self):
+        return f"{self.date} {self.content_type_label}/{self.severity}: {self.reports} rapports"
+
+
+class ModerationRulesVersion(models.Model):
+    """
+    Version stamp of the active rules and whitelist, shared by every process
+    A single row, rewritten in the transaction that changes a rule or a
+    whitelist entry; processes rebuild their compiled rules when it differs
+    """
+    
+    version = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Version des Règles'
+        verbose_name_plural = 'Versions des Règles'
+    
+    def __str__(self):
+        return f"Règles {self.version}"
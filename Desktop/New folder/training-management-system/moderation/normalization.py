@@ -0,0 +1,59 @@
+"""
+Text normalization for moderation
+Every text is lowercased, accent-folded and tokenized once, and the same forms
+are handed to every rule, so "débile", "DÉBILE" and "debile" all match the
+same keywords and patterns
+"""
+
+from collections import namedtuple
+import unicodedata
+
+
+NormalizedText = namedtuple('NormalizedText', ['raw', 'folded', 'folded_lower', 'tokens'])
+
+
+def _build_fold_table():
+    table = {}
+
+    # Latin-1 Supplement and Latin Extended-A/B: keep the base letter when it is ASCII
+    for codepoint in range(0xC0, 0x250):
+        char = chr(codepoint)
+        base = ''.join(
+            c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c)
+        )
+        if base != char and base.isascii():
+            table[codepoint] = base
+
+    # Combining accents of decomposed input
+    for codepoint in range(0x300, 0x370):
+        table[codepoint] = None
+
+    table.update({
+        ord('œ'): 'oe', ord('Œ'): 'OE', ord('æ'): 'ae', ord('Æ'): 'AE', ord('ß'): 'ss',
+        # French typography: curly apostrophes and (narrow) non-breaking spaces
+        ord('\u2018'): "'", ord('\u2019'): "'",
+        ord('\u00a0'): ' ', ord('\u202f'): ' ',
+    })
+    return table
+
+
+FOLD_TABLE = _build_fold_table()
+
+
+def fold_accents(text):
+    """Strip accents and French typographic variants, keeping the case"""
+    if text.isascii():
+        return text
+    return text.translate(FOLD_TABLE)
+
+
+def canonical_text(content):
+    """NFC form without surrounding whitespace: equal texts hash equally"""
+    return unicodedata.normalize('NFC', content).strip()
+
+
+def normalize(content):
+    """Compute once every form of ``content`` the moderation rules work on"""
+    folded = fold_accents(content)
+    folded_lower = folded.lower()
+    return NormalizedText(content, folded, folded_lower, tuple(folded_lower.split()))
@@ -0,0 +1,82 @@
+"""
+Database-backed moderation job queue
+Lets post_save hand content over to the moderation_worker command instead of
+running every rule and writing reports inside the request
+"""
+
+from datetime import timedelta
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ModerationJob
+
+
+def enqueue_moderation(instance, content_type_label):
+    """Queue an instance for deferred moderation"""
+    return ModerationJob.objects.create(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+        content_type_label=content_type_label,
+    )
+
+
+def claim_jobs(batch_size, worker_id=None):
+    """
+    Atomically take up to ``batch_size`` pending jobs for one worker
+
+    Jobs are tagged with the worker id, so two workers never process the
+    same job even on databases without SKIP LOCKED support.
+    """
+    worker_id = worker_id or uuid.uuid4().hex
+
+    with transaction.atomic():
+        pending = ModerationJob.objects.filter(status='pending').order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        job_ids = list(pending.values_list('id', flat=True)[:batch_size])
+
+        ModerationJob.objects.filter(id__in=job_ids, status='pending').update(
+            status='processing',
+            claimed_by=worker_id,
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+
+    return list(
+        ModerationJob.objects.filter(claimed_by=worker_id, status='processing')
+        .select_related('content_type')
+    )
+
+
+def complete_jobs(job_ids):
+    """Mark jobs as done"""
+    return ModerationJob.objects.filter(id__in=job_ids).update(
+        status='done',
+        processed_at=timezone.now(),
+        last_error='',
+    )
+
+
+def fail_job(job, error, max_attempts):
+    """Record a failure and put the job back in the queue until it runs out of attempts"""
+    status = 'failed' if job.attempts >= max_attempts else 'pending'
+    ModerationJob.objects.filter(id=job.id).update(
+        status=status,
+        claimed_by='',
+        last_error=str(error),
+        processed_at=timezone.now() if status == 'failed' else None,
+    )
+    return status
+
+
+def release_stale_jobs(timeout_seconds):
+    """Return jobs claimed by a worker that died mid-batch to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    return ModerationJob.objects.filter(status='processing', claimed_at__lt=cutoff).update(
+        status='pending',
+        claimed_by='',
+    )
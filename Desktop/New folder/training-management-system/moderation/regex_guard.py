@@ -0,0 +1,268 @@
+"""
+Bounded execution of admin-supplied moderation regexes
+Rejects patterns known to backtrack catastrophically when a rule is saved and
+enforces a time budget whenever a pattern runs on user content
+"""
+
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+try:
+    # Optional: the regex module can abort a match after a timeout
+    import regex
+except ImportError:
+    regex = None
+
+PATTERN_ERRORS = (re.error,) if regex is None else (re.error, regex.error)
+logger = logging.getLogger(__name__)
+
+
+REPEAT_OPCODES = {'MAX_REPEAT', 'MIN_REPEAT'}
+
+# Units repeated into long inputs that make backtracking patterns explode
+ADVERSARIAL_UNITS = ['a', ' ', '0', 'aa ', 'A ', 'a@', '!', 'http://']
+
+PROBE_SIZES = [10, 20, 100, 1000, 5000]
+
+
+class RegexTimeout(Exception):
+    pass
+
+
+def get_regex_timeout():
+    return getattr(settings, 'MODERATION_REGEX_TIMEOUT', 0.05)
+
+
+def get_regex_max_input():
+    return getattr(settings, 'MODERATION_REGEX_MAX_INPUT', 20000)
+
+
+def get_regex_max_overruns():
+    return getattr(settings, 'MODERATION_REGEX_MAX_OVERRUNS', 3)
+
+
+def get_regex_cooldown():
+    return getattr(settings, 'MODERATION_REGEX_COOLDOWN', 300)
+
+
+def compile_pattern(pattern):
+    """Compile with the regex module when available, re otherwise"""
+    if regex is not None:
+        return regex.compile(pattern, regex.IGNORECASE | regex.V0)
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def bounded_findall(compiled, content, timeout):
+    """findall that raises RegexTimeout once ``timeout`` seconds are spent"""
+    if regex is not None:
+        try:
+            return compiled.findall(content, timeout=timeout)
+        except TimeoutError:
+            raise RegexTimeout()
+
+    # re cannot be interrupted: the overrun is detected after the fact
+    start = time.perf_counter()
+    matches = compiled.findall(content)
+    if time.perf_counter() - start > timeout:
+        raise RegexTimeout()
+    return matches
+
+
+def _is_unbounded(high):
+    return high == sre_parse.MAXREPEAT
+
+
+def _first_literal(items):
+    if items and str(items[0][0]) == 'LITERAL':
+        return items[0][1]
+    return None
+
+
+def _contains_variable_repeat(items):
+    for op, av in items:
+        name = str(op)
+        if name in REPEAT_OPCODES:
+            low, high, body = av
+            if high != low:
+                return True
+            if _contains_variable_repeat(body):
+                return True
+        elif name == 'SUBPATTERN':
+            if _contains_variable_repeat(av[-1]):
+                return True
+        elif name == 'BRANCH':
+            # (a|aa) is parsed as a(?:|a): alternatives of different widths
+            # backtrack like an optional quantifier
+            if len({branch.getwidth() for branch in av[1]}) > 1:
+                return True
+            if any(_contains_variable_repeat(branch) for branch in av[1]):
+                return True
+    return False
+
+
+def _find_problems(items, inside_repeat=False):
+    problems = []
+
+    for op, av in items:
+        name = str(op)
+
+        if name in REPEAT_OPCODES:
+            low, high, body = av
+            repeats_a_lot = _is_unbounded(high) or high >= 10
+            if repeats_a_lot and _contains_variable_repeat(body):
+                problems.append("quantificateurs imbriqués (ex. (a+)+)")
+            problems.extend(_find_problems(body, inside_repeat or repeats_a_lot))
+
+        elif name == 'SUBPATTERN':
+            problems.extend(_find_problems(av[-1], inside_repeat))
+
+        elif name == 'BRANCH':
+            branches = av[1]
+            if inside_repeat:
+                firsts = [_first_literal(branch) for branch in branches]
+                known = [first for first in firsts if first is not None]
+                if len(known) != len(set(known)) or any(
+                    branch and str(branch[0][0]) == 'ANY' for branch in branches
+                ):
+                    problems.append("alternatives qui se chevauchent dans une répétition (ex. (a|ab)*)")
+            for branch in branches:
+                problems.extend(_find_problems(branch, inside_repeat))
+
+    return problems
+
+
+def find_pathological_constructs(pattern):
+    """Return a description of every construct known to backtrack catastrophically"""
+    return sorted(set(_find_problems(sre_parse.parse(pattern))))
+
+
+def probe_pattern(pattern, budget=None):
+    """
+    Time a pattern on adversarial inputs of growing size
+
+    Returns:
+        tuple: (slowest input description, seconds) of the first probe over
+        budget, or None when every probe stays within budget
+    """
+    budget = budget if budget is not None else get_regex_timeout()
+    compiled = compile_pattern(pattern)
+
+    for unit in ADVERSARIAL_UNITS:
+        for size in PROBE_SIZES:
+            probe = unit * size + '!'
+            start = time.perf_counter()
+            try:
+                bounded_findall(compiled, probe, budget)
+            except RegexTimeout:
+                return f"{unit!r} x {size}", time.perf_counter() - start
+    return None
+
+
+def validate_pattern(pattern):
+    """
+    Check an admin-supplied pattern before it is saved
+
+    Returns:
+        list: human-readable errors, empty when the pattern is safe
+    """
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return [f"Expression invalide: {e}"]
+
+    errors = [f"Motif dangereux: {problem}" for problem in find_pathological_constructs(pattern)]
+    if errors:
+        return errors
+
+    slow = probe_pattern(pattern)
+    if slow:
+        probe, elapsed = slow
+        errors.append(f"Motif trop lent: {elapsed * 1000:.0f} ms sur l'entrée {probe}")
+    return errors
+
+
+def record_regex_overrun(rule_id):
+    """Count a budget overrun on the rule without touching its version stamp"""
+    from .models import ContentModerationRule
+
+    try:
+        # queryset.update() skips post_save, so the compiled rules stay valid
+        ContentModerationRule.objects.filter(pk=rule_id).update(
+            regex_budget_overruns=F('regex_budget_overruns') + 1,
+            last_regex_overrun=timezone.now(),
+        )
+    except Exception as e:
+        logger.error(f"Error recording regex overrun for rule {rule_id}: {e}")
+
+
+class GuardedPattern:
+    """A compiled rule pattern evaluated within a time and input budget"""
+
+    def __init__(self, pattern, rule_id=None):
+        self.pattern = pattern
+        self.rule_id = rule_id
+        self.compiled = compile_pattern(pattern)
+        self.timeout = get_regex_timeout()
+        self.max_input = get_regex_max_input()
+        self.max_overruns = get_regex_max_overruns()
+        self.cooldown = get_regex_cooldown()
+        self.overruns = 0
+        self._disabled_until = None
+
+    def __repr__(self):
+        return f"<GuardedPattern {self.pattern!r}>"
+
+    @property
+    def disabled(self):
+        """
+        Circuit breaker of patterns run with re, which cannot be interrupted:
+        a pattern that keeps blowing its budget is skipped for a cool-down.
+        With the regex module every run is bounded, so it is never skipped.
+        """
+        if self._disabled_until is None:
+            return False
+        if time.monotonic() >= self._disabled_until:
+            self._disabled_until = None
+            self.overruns = 0
+            return False
+        return True
+
+    def findall(self, content):
+        return self.scan(content)[0]
+
+    def scan(self, content):
+        """
+        Matches of the pattern in ``content``
+
+        Returns:
+            tuple: (matches, complete); ``complete`` is False when the text was
+            not fully scanned (timeout, input over the size budget, pattern
+            skipped by the circuit breaker), so no match does not mean clean
+        """
+        if self.disabled:
+            return [], False
+
+        complete = len(content) <= self.max_input
+        try:
+            return bounded_findall(self.compiled, content[:self.max_input], self.timeout), complete
+        except RegexTimeout:
+            self.overruns += 1
+            logger.warning(
+                f"Moderation pattern {self.pattern!r} (rule {self.rule_id}) exceeded "
+                f"its {self.timeout * 1000:.0f} ms budget"
+            )
+            if self.rule_id is not None:
+                record_regex_overrun(self.rule_id)
+            if regex is None and self.overruns >= self.max_overruns:
+                self._disabled_until = time.monotonic() + self.cooldown
+            return [], False
@@ -0,0 +1,136 @@
+"""
+Bulk re-moderation of existing content
+Streams every moderated model in chunks, evaluates the texts against the
+compiled rules across a process pool and bulk-creates the resulting reports
+"""
+
+from multiprocessing import Pool
+import pickle
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+
+from .archive import reported_object_ids
+from .engine import get_rule_set
+from .models import ContentModerationReport
+from .remoderation_worker import evaluate_texts, init_worker
+from .rollups import record_reports_created
+from .services import MODERATED_MODELS, get_moderated_content, set_content_blocked
+
+
+class Remoderator:
+    """Re-scan stored content against the current compiled rules"""
+
+    def __init__(self, workers=1, chunk_size=2000, dry_run=False, include_reported=False):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.include_reported = include_reported
+
+        self.rule_set = get_rule_set()
+        self.pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # Children must not inherit the parent's open database connections
+            connections.close_all()
+            # Pickled up front: a spawned child unpickles the rules after django.setup()
+            self.pool = Pool(
+                self.workers, initializer=init_worker, initargs=(pickle.dumps(self.rule_set),)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def run(self, content_type_label, since=None):
+        """
+        Re-moderate every object of one content type
+
+        Returns:
+            dict: scanned, skipped, flagged and auto_blocked counts
+        """
+        model_path, date_field, related = MODERATED_MODELS[content_type_label]
+        model = apps.get_model(model_path)
+        content_type = ContentType.objects.get_for_model(model)
+
+        queryset = model.objects.select_related(*related).order_by('pk')
+        if since:
+            queryset = queryset.filter(**{f'{date_field}__gte': since})
+
+        totals = {'scanned': 0, 'skipped': 0, 'flagged': 0, 'auto_blocked': 0}
+
+        chunk = []
+        for instance in queryset.iterator(chunk_size=self.chunk_size):
+            chunk.append(instance)
+            if len(chunk) >= self.chunk_size:
+                self._process_chunk(model, content_type, content_type_label, chunk, totals)
+                chunk = []
+        if chunk:
+            self._process_chunk(model, content_type, content_type_label, chunk, totals)
+
+        return totals
+
+    def _evaluate(self, texts):
+        if self.pool is None:
+            return self.rule_set.evaluate_batch(texts)
+
+        slice_size = max(1, len(texts) // (self.workers * 4))
+        slices = [texts[start:start + slice_size] for start in range(0, len(texts), slice_size)]
+        return [verdict for verdicts in self.pool.map(evaluate_texts, slices) for verdict in verdicts]
+
+    def _process_chunk(self, model, content_type, content_type_label, chunk, totals):
+        totals['scanned'] += len(chunk)
+
+        reported_ids = set()
+        if not self.include_reported:
+            # Archived reports count: their content was already reviewed
+            reported_ids = reported_object_ids(content_type, [instance.pk for instance in chunk])
+
+        # Only send texts that can still produce a report to the workers
+        candidates = []
+        for instance in chunk:
+            content_text, author, _ = get_moderated_content(instance)
+            if instance.pk in reported_ids or self.rule_set.is_whitelisted_author(author):
+                totals['skipped'] += 1
+            elif content_text and content_text.strip():
+                candidates.append((instance, content_text, author))
+
+        verdicts = self._evaluate([content_text for _, content_text, _ in candidates])
+
+        reports = []
+        blocked_ids = []
+        for (instance, content_text, author), verdict in zip(candidates, verdicts):
+            if verdict.whitelisted or not verdict.issues:
+                continue
+
+            reports.append(ContentModerationReport(
+                content_type=content_type,
+                object_id=instance.pk,
+                content_type_label=content_type_label,
+                original_content=content_text,
+                author=author,
+                ai_confidence=verdict.confidence,
+                detected_issues=verdict.issues,
+                severity=verdict.severity,
+                status='auto_filtered' if verdict.auto_block else 'pending',
+                auto_blocked=verdict.auto_block,
+            ))
+            if verdict.auto_block:
+                blocked_ids.append(instance.pk)
+
+        totals['flagged'] += len(reports)
+        totals['auto_blocked'] += len(blocked_ids)
+
+        if self.dry_run or not reports:
+            return
+
+        with transaction.atomic():
+            ContentModerationReport.objects.bulk_create(reports, batch_size=500)
+            record_reports_created(reports)
+            if blocked_ids:
+                set_content_blocked(model, blocked_ids, True)
@@ -0,0 +1,26 @@
+"""
+Pool worker of the bulk re-moderation
+Kept free of model imports: under the spawn start method a child imports this
+module and unpickles its arguments before Django is set up
+"""
+
+import pickle
+
+import django
+from django.apps import apps
+
+
+# Rule set of a pool worker process, set once by the pool initializer
+_worker_rule_set = None
+
+
+def init_worker(pickled_rule_set):
+    """Set Django up in a spawned child, then load the parent's compiled rules"""
+    global _worker_rule_set
+    if not apps.ready:
+        django.setup()
+    _worker_rule_set = pickle.loads(pickled_rule_set)
+
+
+def evaluate_texts(texts):
+    return _worker_rule_set.evaluate_batch(texts)
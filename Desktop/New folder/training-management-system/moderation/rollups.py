@@ -0,0 +1,174 @@
+"""
+Moderation report rollups
+Reports are counted per creation day, content type and severity as they are
+created and reviewed, in the same transaction, so the dashboard and the
+statistics read a few rollup rows whatever the number of reports
+"""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from training_management.counters import increment_row
+
+from .models import ModerationReportRollup, ModerationStats
+
+
+def rollup_key(report):
+    """(date, content type, severity) of the rollup row counting ``report``"""
+    return timezone.localdate(report.created_at), report.content_type_label, report.severity
+
+
+def _apply(increments):
+    for (date, content_type_label, severity), counts in increments.items():
+        counts = {field: value for field, value in counts.items() if value}
+        if counts:
+            increment_row(
+                ModerationReportRollup,
+                {'date': date, 'content_type_label': content_type_label, 'severity': severity},
+                counts
+            )
+
+
+def record_reports_created(reports):
+    """Count new reports, with one upsert per rollup row"""
+    increments = {}
+    for report in reports:
+        counts = increments.setdefault(rollup_key(report), Counter())
+        counts['reports'] += 1
+        counts['auto_blocked'] += int(report.auto_blocked)
+        status_counter = ModerationReportRollup.STATUS_COUNTERS.get(report.status)
+        if status_counter:
+            counts[status_counter] += 1
+    _apply(increments)
+
+
+def record_status_changes(changes):
+    """Move reviewed reports between the status counters, from (report, old status, new status)"""
+    increments = {}
+    for report, old_status, new_status in changes:
+        old_counter = ModerationReportRollup.STATUS_COUNTERS.get(old_status)
+        new_counter = ModerationReportRollup.STATUS_COUNTERS.get(new_status)
+        if old_counter == new_counter:
+            continue
+        counts = increments.setdefault(rollup_key(report), Counter())
+        if old_counter:
+            counts[old_counter] -= 1
+        if new_counter:
+            counts[new_counter] += 1
+    _apply(increments)
+
+
+_state = threading.local()
+
+
+@contextmanager
+def archiving():
+    """Deletes inside this block move reports to the archive, which the rollups still count"""
+    previous = getattr(_state, 'archiving', False)
+    _state.archiving = True
+    try:
+        yield
+    finally:
+        _state.archiving = previous
+
+
+def record_report_deleted(report):
+    """Uncount a deleted report, unless it is being archived"""
+    if getattr(_state, 'archiving', False):
+        return
+    counts = Counter(reports=1, auto_blocked=int(report.auto_blocked))
+    status_counter = ModerationReportRollup.STATUS_COUNTERS.get(report.status)
+    if status_counter:
+        counts[status_counter] += 1
+    date, content_type_label, severity = rollup_key(report)
+    rollup = ModerationReportRollup.objects.filter(
+        date=date, content_type_label=content_type_label, severity=severity
+    )
+    for field, value in counts.items():
+        if value:
+            # Floored at zero for rows counted before the rollups existed
+            rollup.filter(**{f'{field}__gte': value}).update(**{field: F(field) - value})
+
+
+def pending_report_count():
+    return ModerationReportRollup.objects.aggregate(total=Sum('pending'))['total'] or 0
+
+
+def rebuild_rollups(report_model, rollup_model, archived_model=None):
+    """
+    Recompute every rollup row from the reports, including archived ones
+
+    Takes the models as arguments so migrations can pass their historical models.
+    """
+    totals = {}
+    sources = [report_model] if archived_model is None else [report_model, archived_model]
+    for model in sources:
+        rows = (
+            model.objects.annotate(day=TruncDate('created_at'))
+            .values('day', 'content_type_label', 'severity', 'status', 'auto_blocked')
+            .annotate(count=Count('pk'))
+            .order_by()
+        )
+        for row in rows:
+            key = (row['day'], row['content_type_label'], row['severity'])
+            counts = totals.setdefault(key, Counter())
+            counts['reports'] += row['count']
+            if row['auto_blocked']:
+                counts['auto_blocked'] += row['count']
+            status_counter = ModerationReportRollup.STATUS_COUNTERS.get(row['status'])
+            if status_counter:
+                counts[status_counter] += row['count']
+
+    rollup_model.objects.all().delete()
+    rollup_model.objects.bulk_create([
+        rollup_model(date=day, content_type_label=label, severity=severity, **counts)
+        for (day, label, severity), counts in totals.items()
+    ], batch_size=500)
+    return len(totals)
+
+
+def chart_data(days=30):
+    """
+    Daily series of the last ``days`` days for the dashboard charts, read
+    from the daily stats and the rollups only
+
+    Returns:
+        dict: dates, activity counters per day and report counts per day by
+        content type and by severity
+    """
+    today = timezone.localdate()
+    dates = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    index = {date: position for position, date in enumerate(dates)}
+
+    activity_fields = [
+        'total_content_checked', 'flagged_content', 'auto_blocked',
+        'human_reviewed', 'false_positives',
+    ]
+    activity = {field: [0] * days for field in activity_fields}
+    for row in ModerationStats.objects.filter(date__gte=dates[0], date__lte=today).values('date', *activity_fields):
+        for field in activity_fields:
+            activity[field][index[row['date']]] = row[field]
+
+    by_content_type = {}
+    by_severity = {}
+    rows = ModerationReportRollup.objects.filter(date__gte=dates[0], date__lte=today).values(
+        'date', 'content_type_label', 'severity', 'reports'
+    )
+    for row in rows:
+        position = index[row['date']]
+        by_content_type.setdefault(row['content_type_label'], [0] * days)[position] += row['reports']
+        by_severity.setdefault(row['severity'], [0] * days)[position] += row['reports']
+
+    return {
+        'dates': [date.isoformat() for date in dates],
+        'activity': activity,
+        'reports_by_content_type': by_content_type,
+        'reports_by_severity': by_severity,
+        'pending_reviews': pending_report_count(),
+    }
@@ -3,27 +3,54 @@ AI Content Moderation Service
 Provides intelligent content analysis and filtering capabilities
 """
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.utils import timezone
+from training_management.counters import increment_row
 from .models import (
     ContentModerationReport, 
     ContentModerationRule, 
-    ContentModerationWhitelist,
     ModerationStats
 )
+from .engine import get_rule_set
+from .fingerprints import UNCHANGED, UNKNOWN, is_editable, record_fingerprint, update_fingerprint
+from .metrics import (
+    blocked_content_counters,
+    rule_metrics,
+    shadow_recorder,
+    whitelisted_content_counters,
+)
+from .rollups import pending_report_count, record_reports_created, record_status_changes
+from .queue import enqueue_moderation, claim_jobs, complete_jobs, fail_job
+from .verdict_cache import verdict_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Instance attribute holding the verdict of precheck_instance until the
+# post-save moderation; None when the content needed no evaluation, DEFERRED
+# when it passed the auto-block rules and waits for the worker
+PRECHECK_ATTRIBUTE = '_moderation_verdict'
+DEFERRED = 'deferred'
+
+
+def with_report_relations(reports):
+    """
+    Load the relations report lists display in a constant number of queries
+
+    Authors, reviewers and content types are joined, and content objects are
+    fetched with one query per content type instead of one per report.
+    """
+    return reports.select_related(
+        'author', 'reviewed_by', 'content_type'
+    ).prefetch_related('content_object')
+
 
 class AIContentModerator:
     """Main AI content moderation service"""
     
-    def __init__(self):
-        self.rules = ContentModerationRule.objects.filter(active=True)
-        self.whitelist = ContentModerationWhitelist.objects.filter(active=True)
-    
-    def moderate_content(self, content_object, content_text, author, content_type_label):
+    def moderate_content(self, content_object, content_text, author, content_type_label, verdict=None):
         """
         Moderate any content using AI analysis
         
@@ -32,6 +59,8 @@ class AIContentModerator:
             content_text: The actual text content to analyze
             author: The Utilisateur who created the content
             content_type_label: Type label from ContentModerationReport.CONTENT_TYPE_CHOICES
+            verdict: Verdict computed by precheck_instance or requires_inline_moderation,
+                so the rules are not run again
         
         Returns:
             tuple: (is_safe, report) - is_safe is False if content should be blocked
@@ -39,57 +68,93 @@ class AIContentModerator:
         if not content_text or not content_text.strip():
             return True, None
         
-        # Check whitelist first
-        if self._is_whitelisted(content_text, author):
+        if verdict is None:
+            # Check user whitelist first
+            if self._is_whitelisted_author(author):
+                whitelisted_content_counters.increment(total_content_checked=1)
+                return True, None
+            
+            verdict = self._evaluate(content_text)
+        
+        if verdict.whitelisted:
             self._update_stats(checked=True)
             return True, None
         
-        # Analyze content with all active rules
-        all_issues = []
-        max_confidence = 0.0
-        max_severity = 'low'
-        should_auto_block = False
-        
-        for rule in self.rules:
-            violated, confidence, issues = rule.check_content(content_text)
-            
-            if violated:
-                all_issues.extend(issues)
-                max_confidence = max(max_confidence, confidence)
-                
-                # Determine severity level
-                if rule.severity == 'critical':
-                    max_severity = 'critical'
-                elif rule.severity == 'high' and max_severity not in ['critical']:
-                    max_severity = 'high'
-                elif rule.severity == 'medium' and max_severity not in ['critical', 'high']:
-                    max_severity = 'medium'
-                
-                if rule.auto_block:
-                    should_auto_block = True
-        
         # Create moderation report if issues found
-        if all_issues:
+        if verdict.issues:
             report = self._create_report(
                 content_object=content_object,
                 content_type_label=content_type_label,
                 original_content=content_text,
                 author=author,
-                ai_confidence=max_confidence,
-                detected_issues=all_issues,
-                severity=max_severity,
-                auto_blocked=should_auto_block
+                ai_confidence=verdict.confidence,
+                detected_issues=verdict.issues,
+                severity=verdict.severity,
+                auto_blocked=verdict.auto_block
             )
             
-            self._update_stats(checked=True, flagged=True, auto_blocked=should_auto_block)
+            self._update_stats(checked=True, flagged=True, auto_blocked=verdict.auto_block)
             
             # Return False if content should be blocked
-            return not should_auto_block, report
+            return not verdict.auto_block, report
         
         # No issues found
         self._update_stats(checked=True)
         return True, None
     
+    def _evaluate(self, content_text):
+        """
+        Run the compiled active rules on a text; whitelisted keywords and
+        phrases are matched in the same pass, and repeated texts are answered
+        from the verdict cache
+        """
+        rule_set = get_rule_set()
+        profile = []
+        verdict = verdict_cache.evaluate(rule_set, content_text, profile=profile)
+        rule_metrics.record(profile, verdict)
+        
+        # Shadow rules only feed their hit counters
+        if not verdict.whitelisted:
+            shadow_recorder.record(rule_set, verdict, content_text)
+        return verdict
+    
+    def precheck_instance(self, instance):
+        """
+        Moderate an instance before it is first saved
+        
+        Auto-blocked content is refused before any write: no row, no report,
+        and its stats are counted in memory. Otherwise the verdict is attached
+        to the instance and the post-save moderation reuses it. Content types
+        in 'deferred' mode only go through the auto-block rules here; the
+        other rules are left to the worker.
+        
+        Returns:
+            bool: False if the content is blocked and must not be saved
+        """
+        content_text, author, content_type_label = get_moderated_content(instance)
+        verdict = None
+        
+        if content_text and content_text.strip():
+            if self._is_whitelisted_author(author):
+                whitelisted_content_counters.increment(total_content_checked=1)
+            elif get_moderation_mode(content_type_label) == 'deferred':
+                verdict = self.requires_inline_moderation(content_text)
+                if verdict is None:
+                    setattr(instance, PRECHECK_ATTRIBUTE, DEFERRED)
+                    return True
+            else:
+                verdict = self._evaluate(content_text)
+        
+        if verdict is not None and verdict.auto_block:
+            blocked_content_counters.increment(
+                total_content_checked=1, flagged_content=1, auto_blocked=1
+            )
+            logger.info(f"{content_type_label} blocked before saving - {verdict.severity} severity")
+            return False
+        
+        setattr(instance, PRECHECK_ATTRIBUTE, verdict)
+        return True
+    
     def moderate_course_comment(self, comment_instance):
         """Moderate course comments"""
         return self.moderate_content(
@@ -135,25 +200,93 @@ class AIContentModerator:
             content_type_label='task_description'
         )
     
-    def _is_whitelisted(self, content, author):
-        """Check if content or author is whitelisted"""
-        # Check user whitelist
-        user_whitelist = self.whitelist.filter(
-            whitelist_type='user',
-            value=author.email
-        ).exists()
+    def moderate_instance(self, instance):
+        """Moderate any instance of a moderated model"""
+        content_text, author, content_type_label = get_moderated_content(instance)
+        return self.moderate_content(
+            content_object=instance,
+            content_text=content_text,
+            author=author,
+            content_type_label=content_type_label
+        )
+    
+    def requires_inline_moderation(self, content_text):
+        """
+        Check whether an auto-block rule fires, so the content cannot wait for the worker
         
-        if user_whitelist:
-            return True
+        Returns:
+            Verdict: when an auto-block rule fires, the verdict of every rule,
+            to be passed to moderate_content; None when the content can be deferred
+        """
+        if not content_text or not content_text.strip():
+            return None
+        
+        if not get_rule_set().evaluate(content_text, blocking_only=True).issues:
+            # The worker evaluates and records every rule later
+            return None
+        
+        # Blocked now, so the report, the metrics and the stats need every rule
+        return self._evaluate(content_text)
+    
+    def check_texts(self, texts, author=None):
+        """
+        Evaluate texts against the compiled rules without writing anything
+        
+        Returns:
+            list: one dict per text with is_safe, blocked, confidence, severity,
+            issues and whitelisted
+        """
+        if self._is_whitelisted_author(author):
+            return [self._verdict_result(None, whitelisted=True) for _ in texts]
+        
+        rule_set = get_rule_set()
+        # Blank texts are safe without evaluation; the others are scored in one batch
+        filled = [index for index, text in enumerate(texts) if text and text.strip()]
+        evaluated = verdict_cache.evaluate_many(rule_set, [texts[index] for index in filled])
+        
+        verdicts = [None] * len(texts)
+        for index, verdict in zip(filled, evaluated):
+            verdicts[index] = verdict
+        return [self._verdict_result(verdict) for verdict in verdicts]
+    
+    def _verdict_result(self, verdict, whitelisted=False):
+        if verdict is None or not verdict.issues:
+            return {
+                'is_safe': True,
+                'blocked': False,
+                'confidence': 0.0,
+                'severity': None,
+                'issues': [],
+                'whitelisted': whitelisted or bool(verdict and verdict.whitelisted),
+            }
         
-        # Check keyword/phrase whitelist
-        content_lower = content.lower()
+        return {
+            'is_safe': not verdict.auto_block,
+            'blocked': verdict.auto_block,
+            'confidence': verdict.confidence,
+            'severity': verdict.severity,
+            'issues': verdict.issues,
+            'whitelisted': False,
+        }
+    
+    def _is_whitelisted_author(self, author):
+        """Check if author is whitelisted, from the compiled whitelist"""
+        return get_rule_set().is_whitelisted_author(author)
+    
+    def skip_whitelisted_instance(self, instance):
+        """
+        Skip moderation of an instance whose author is whitelisted, decided
+        from its author foreign key before any related object is loaded
         
-        for item in self.whitelist.filter(whitelist_type__in=['keyword', 'phrase']):
-            if item.value.lower() in content_lower:
-                return True
+        Returns:
+            bool: True when the instance needs no moderation
+        """
+        author_id = get_moderated_author_id(instance)
+        if author_id is None or not get_rule_set().is_whitelisted_author_id(author_id):
+            return False
         
-        return False
+        whitelisted_content_counters.increment(total_content_checked=1)
+        return True
     
     def _create_report(self, content_object, content_type_label, original_content, 
                       author, ai_confidence, detected_issues, severity, auto_blocked):
@@ -162,50 +295,48 @@ class AIContentModerator:
         
         status = 'auto_filtered' if auto_blocked else 'pending'
         
-        report = ContentModerationReport.objects.create(
-            content_type=content_type,
-            object_id=content_object.pk,
-            content_type_label=content_type_label,
-            original_content=original_content,
-            author=author,
-            ai_confidence=ai_confidence,
-            detected_issues=detected_issues,
-            severity=severity,
-            status=status,
-            auto_blocked=auto_blocked
-        )
+        with transaction.atomic():
+            report = ContentModerationReport.objects.create(
+                content_type=content_type,
+                object_id=content_object.pk,
+                content_type_label=content_type_label,
+                original_content=original_content,
+                author=author,
+                ai_confidence=ai_confidence,
+                detected_issues=detected_issues,
+                severity=severity,
+                status=status,
+                auto_blocked=auto_blocked
+            )
+            record_reports_created([report])
         
         logger.info(f"Content moderation report created: {report.id} - {severity} severity")
         return report
     
     def _update_stats(self, checked=False, flagged=False, auto_blocked=False):
         """Update daily moderation statistics"""
-        today = timezone.now().date()
-        
-        stats, created = ModerationStats.objects.get_or_create(
-            date=today,
-            defaults={
-                'total_content_checked': 0,
-                'flagged_content': 0,
-                'auto_blocked': 0,
-                'human_reviewed': 0,
-                'false_positives': 0,
-            }
+        self._increment_stats(
+            total_content_checked=int(checked),
+            flagged_content=int(flagged),
+            auto_blocked=int(auto_blocked),
         )
+    
+    def _increment_stats(self, **increments):
+        """
+        Atomically add to today's ModerationStats counters
         
-        if checked:
-            stats.total_content_checked += 1
-        if flagged:
-            stats.flagged_content += 1
-        if auto_blocked:
-            stats.auto_blocked += 1
-        
-        stats.save()
+        Uses a single UPDATE ... SET field = field + n so concurrent workers
+        never overwrite each other's increments.
+        """
+        increments = {field: value for field, value in increments.items() if value}
+        if increments:
+            increment_row(ModerationStats, {'date': timezone.localdate()}, increments)
     
     def review_report(self, report_id, reviewer, decision, notes=""):
         """Human review of a moderation report"""
         try:
             report = ContentModerationReport.objects.get(id=report_id)
+            previous_status = report.status
             
             report.reviewed_by = reviewer
             report.review_notes = notes
@@ -222,7 +353,9 @@ class AIContentModerator:
                 if not report.auto_blocked:
                     self._block_content(report.content_object)
             
-            report.save()
+            with transaction.atomic():
+                report.save()
+                record_status_changes([(report, previous_status, report.status)])
             
             # Update stats
             self._update_human_review_stats(report, decision)
@@ -234,6 +367,65 @@ class AIContentModerator:
             logger.error(f"Moderation report {report_id} not found")
             return False
     
+    def review_reports(self, report_ids, reviewer, decision, notes=""):
+        """
+        Human review of many moderation reports at once
+        
+        Reports already approved or rejected are left untouched. Content is
+        blocked or unblocked with one UPDATE per content type and the stats
+        are incremented once for the whole batch.
+        
+        Returns:
+            int: number of reports reviewed
+        """
+        if decision not in ('approve', 'reject'):
+            raise ValueError(f"Unknown review decision: {decision}")
+        
+        with transaction.atomic():
+            reports = list(
+                ContentModerationReport.objects.select_for_update()
+                .filter(id__in=report_ids)
+                .exclude(status__in=['approved', 'rejected'])
+                .only(
+                    'id', 'content_type_id', 'object_id', 'content_type_label',
+                    'auto_blocked', 'severity', 'status', 'created_at'
+                )
+            )
+            if not reports:
+                return 0
+            
+            # Approving unblocks auto-blocked content, rejecting blocks the rest
+            to_toggle = {}
+            for report in reports:
+                if report.auto_blocked == (decision == 'approve'):
+                    to_toggle.setdefault(report.content_type_id, []).append(report.object_id)
+            
+            for content_type_id, object_ids in to_toggle.items():
+                model = ContentType.objects.get_for_id(content_type_id).model_class()
+                if model is not None:
+                    set_content_blocked(model, object_ids, blocked=decision == 'reject')
+            
+            status = 'approved' if decision == 'approve' else 'rejected'
+            now = timezone.now()
+            ContentModerationReport.objects.filter(id__in=[report.id for report in reports]).update(
+                status=status,
+                reviewed_by=reviewer,
+                review_notes=notes,
+                review_date=now,
+                updated_at=now,
+            )
+            record_status_changes((report, report.status, status) for report in reports)
+            
+            false_positives = 0
+            if decision == 'approve':
+                false_positives = sum(
+                    1 for report in reports if report.severity in ['medium', 'high', 'critical']
+                )
+            self._increment_stats(human_reviewed=len(reports), false_positives=false_positives)
+        
+        logger.info(f"{len(reports)} moderation reports reviewed: {decision}")
+        return len(reports)
+    
     def _block_content(self, content_object):
         """Block content (implementation depends on model)"""
         # This would be implemented based on each model's blocking mechanism
@@ -256,39 +448,28 @@ class AIContentModerator:
     
     def _update_human_review_stats(self, report, decision):
         """Update statistics for human reviews"""
-        today = timezone.now().date()
-        
-        stats, created = ModerationStats.objects.get_or_create(
-            date=today,
-            defaults={
-                'total_content_checked': 0,
-                'flagged_content': 0,
-                'auto_blocked': 0,
-                'human_reviewed': 0,
-                'false_positives': 0,
-            }
-        )
-        
-        stats.human_reviewed += 1
-        
-        if decision == 'approve' and report.severity in ['medium', 'high', 'critical']:
-            stats.false_positives += 1
+        false_positive = decision == 'approve' and report.severity in ['medium', 'high', 'critical']
         
-        stats.save()
+        self._increment_stats(
+            human_reviewed=1,
+            false_positives=int(false_positive),
+        )
     
     def get_moderation_dashboard_data(self):
         """Get data for moderation dashboard"""
-        today = timezone.now().date()
+        # Local days, like the rollups and the daily stats
+        now = timezone.localtime()
+        today = now.date()
         
         # Recent reports
-        recent_reports = ContentModerationReport.objects.filter(
-            created_at__date=today
+        recent_reports = with_report_relations(
+            ContentModerationReport.objects.filter(
+                created_at__gte=now.replace(hour=0, minute=0, second=0, microsecond=0)
+            )
         ).order_by('-created_at')[:10]
         
-        # Pending reviews
-        pending_reviews = ContentModerationReport.objects.filter(
-            status='pending'
-        ).count()
+        # Pending reviews, from the rollups instead of counting reports
+        pending_reviews = pending_report_count()
         
         # Today's stats
         today_stats = ModerationStats.objects.filter(date=today).first()
@@ -313,34 +494,193 @@ class AIContentModerator:
         }
 
 
+# Moderated models: label -> (model, creation date field, authors to select_related)
+MODERATED_MODELS = {
+    'course_comment': ('courses.CommentaireCours', 'date_creation', ['apprenant__utilisateur']),
+    'discussion_reply': ('messaging.ReponseDiscussion', 'date_creation', ['auteur']),
+    'group_message': ('messaging.MessageGroupe', 'date_envoi', ['auteur']),
+    'private_message': ('messaging.Message', 'date_envoi', ['expediteur']),
+    'task_description': ('formations.Task', 'date_creation', ['createur']),
+}
+
+
+def get_moderated_content(instance):
+    """
+    Extract what moderation needs from a moderated model instance
+    
+    Returns:
+        tuple: (content_text, author, content_type_label)
+    """
+    model_name = instance.__class__.__name__
+    
+    if model_name == 'CommentaireCours':
+        return instance.commentaire, instance.apprenant.utilisateur, 'course_comment'
+    elif model_name == 'ReponseDiscussion':
+        return instance.contenu, instance.auteur, 'discussion_reply'
+    elif model_name == 'MessageGroupe':
+        return instance.contenu, instance.auteur, 'group_message'
+    elif model_name == 'Message':
+        return instance.contenu, instance.expediteur, 'private_message'
+    elif model_name == 'Task':
+        return f"{instance.titre} {instance.description}", instance.createur, 'task_description'
+    
+    raise ValueError(f"{model_name} is not a moderated model")
+
+
+def get_moderated_author_id(instance):
+    """Author id of a moderated instance when it is a direct foreign key, else None"""
+    model_name = instance.__class__.__name__
+    
+    if model_name in ('ReponseDiscussion', 'MessageGroupe'):
+        return instance.auteur_id
+    elif model_name == 'Message':
+        return instance.expediteur_id
+    elif model_name == 'Task':
+        return instance.createur_id
+    
+    # Course comments reach their author through the learner profile
+    return None
+
+
+def get_moderation_mode(content_type_label):
+    """Return 'inline' or 'deferred' for a content type label"""
+    return getattr(settings, 'MODERATION_MODES', {}).get(content_type_label, 'inline')
+
+
+def apply_moderation_result(instance, is_safe, report):
+    """Hide content that was blocked automatically"""
+    if instance.__class__.__name__ == 'CommentaireCours':
+        if not is_safe and report and report.auto_blocked:
+            instance.approuve = False
+            instance.save()
+
+
+def set_content_blocked(model, object_ids, blocked):
+    """Block or unblock many objects of one model with a single UPDATE"""
+    field_names = {field.name for field in model._meta.get_fields()}
+    
+    if 'approuve' in field_names:
+        return model.objects.filter(pk__in=object_ids).update(approuve=not blocked)
+    elif 'active' in field_names:
+        return model.objects.filter(pk__in=object_ids).update(active=not blocked)
+    return 0
+
+
 # Global moderator instance
 moderator = AIContentModerator()
 
 
-def moderate_content_on_save(sender, instance, created, **kwargs):
+def moderate_content_on_save(sender, instance, created, update_fields=None, **kwargs):
     """Signal handler for automatic content moderation"""
-    if not created:
-        return  # Only moderate new content
+    # Private messages are never edited: only new ones are moderated
+    if not created and not is_editable(instance):
+        return
     
     try:
-        # Determine content type and moderate accordingly
-        if sender.__name__ == 'CommentaireCours':
-            is_safe, report = moderator.moderate_course_comment(instance)
-            if not is_safe and report and report.auto_blocked:
-                instance.approuve = False
-                instance.save()
-        
-        elif sender.__name__ == 'ReponseDiscussion':
-            is_safe, report = moderator.moderate_discussion_reply(instance)
-            
-        elif sender.__name__ == 'MessageGroupe':
-            is_safe, report = moderator.moderate_group_message(instance)
-            
-        elif sender.__name__ == 'Message':
-            is_safe, report = moderator.moderate_private_message(instance)
+        # Content checked by precheck_instance already has its verdict
+        prechecked = created and PRECHECK_ATTRIBUTE in instance.__dict__
+        verdict = instance.__dict__.pop(PRECHECK_ATTRIBUTE, None) if prechecked else None
+        
+        if not prechecked and moderator.skip_whitelisted_instance(instance):
+            return
+        
+        if created:
+            if is_editable(instance):
+                record_fingerprint(instance)
+        else:
+            # Edits are moderated again only when the moderated text changed
+            change = update_fingerprint(instance, update_fields)
+            if change == UNCHANGED:
+                return
+        
+        if prechecked and verdict is None:
+            # Blank content or whitelisted author
+            return
+        
+        content_text, author, content_type_label = get_moderated_content(instance)
+        
+        if prechecked:
+            if verdict == DEFERRED:
+                enqueue_moderation(instance, content_type_label)
+                return
             
-        elif sender.__name__ == 'Task':
-            is_safe, report = moderator.moderate_task_description(instance)
+            # Blocked content never reaches the database, so only reports are left
+            moderator.moderate_content(
+                content_object=instance,
+                content_text=content_text,
+                author=author,
+                content_type_label=content_type_label,
+                verdict=verdict
+            )
+            return
+        
+        if not created and change == UNKNOWN and ContentModerationReport.objects.filter(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk,
+            original_content=content_text
+        ).exists():
+            # Created before fingerprints and already reported with this text
+            return
+        
+        # Deferred content only waits for the worker when no auto-block rule fires
+        verdict = None
+        if get_moderation_mode(content_type_label) == 'deferred':
+            verdict = moderator.requires_inline_moderation(content_text)
+            if verdict is None:
+                enqueue_moderation(instance, content_type_label)
+                return
+        
+        is_safe, report = moderator.moderate_content(
+            content_object=instance,
+            content_text=content_text,
+            author=author,
+            content_type_label=content_type_label,
+            verdict=verdict
+        )
+        apply_moderation_result(instance, is_safe, report)
     
     except Exception as e:
         logger.error(f"Error in content moderation: {e}")
+
+
+def process_moderation_jobs(batch_size=100, worker_id=None, max_attempts=3):
+    """
+    Run one batch of deferred moderation jobs
+    
+    Returns:
+        tuple: (processed, failed) job counts for the batch
+    """
+    jobs = claim_jobs(batch_size, worker_id)
+    if not jobs:
+        return 0, 0
+    
+    # Load every target object with one query per content type
+    ids_by_model = {}
+    for job in jobs:
+        ids_by_model.setdefault(job.content_type.model_class(), set()).add(job.object_id)
+    instances = {
+        model: model.objects.in_bulk(ids)
+        for model, ids in ids_by_model.items()
+        if model is not None
+    }
+    
+    done_ids = []
+    failed = 0
+    for job in jobs:
+        instance = instances.get(job.content_type.model_class(), {}).get(job.object_id)
+        if instance is None:
+            # Content deleted before the worker reached it
+            done_ids.append(job.id)
+            continue
+        
+        try:
+            is_safe, report = moderator.moderate_instance(instance)
+            apply_moderation_result(instance, is_safe, report)
+            done_ids.append(job.id)
+        except Exception as e:
+            logger.error(f"Error in deferred moderation job {job.id}: {e}")
+            fail_job(job, e, max_attempts)
+            failed += 1
+    
+    complete_jobs(done_ids)
+    return len(done_ids), failed
@@ -2,14 +2,57 @@
 Signal handlers for automatic content moderation
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from courses.models import CommentaireCours
 from messaging.models import MessageGroupe, Message, ReponseDiscussion
 from formations.models import Task
+from users.models import Utilisateur
+from .engine import bump_rules_version
+from .fingerprints import forget_fingerprint
+from .models import ContentModerationReport, ContentModerationRule, ContentModerationWhitelist
+from .rollups import record_report_deleted
 from .services import moderate_content_on_save
 
 
+# Compiled rule set invalidation
+@receiver(post_save, sender=ContentModerationRule)
+@receiver(post_delete, sender=ContentModerationRule)
+@receiver(post_save, sender=ContentModerationWhitelist)
+@receiver(post_delete, sender=ContentModerationWhitelist)
+def invalidate_compiled_rules(sender, instance, **kwargs):
+    """Stamp a new rules version, committed together with the rule change"""
+    bump_rules_version()
+
+
+@receiver(post_init, sender=Utilisateur)
+def remember_loaded_email(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred email is not loaded
+    instance._moderation_loaded_email = instance.__dict__.get('email')
+
+
+@receiver(post_save, sender=Utilisateur)
+def invalidate_whitelisted_author_ids(sender, instance, created, raw, update_fields, **kwargs):
+    """Rebuild the whitelisted author ids when a user's email enters or leaves the whitelist"""
+    if raw or (update_fields is not None and 'email' not in update_fields):
+        return
+    previous_email = instance._moderation_loaded_email
+    instance._moderation_loaded_email = instance.email
+    if previous_email == instance.email and not created:
+        return
+    if ContentModerationWhitelist.objects.filter(
+        active=True, whitelist_type='user', value__in=[email for email in (previous_email, instance.email) if email]
+    ).exists():
+        bump_rules_version()
+
+
+# Rollup accounting of reports deleted from the admin or with their author
+@receiver(post_delete, sender=ContentModerationReport)
+def uncount_deleted_report(sender, instance, **kwargs):
+    """Remove a deleted report from its rollup row"""
+    record_report_deleted(instance)
+
+
 # Course comments moderation
 @receiver(post_save, sender=CommentaireCours)
 def moderate_course_comment(sender, instance, created, **kwargs):
@@ -43,3 +86,13 @@ def moderate_private_message(sender, instance, created, **kwargs):
 def moderate_task_description(sender, instance, created, **kwargs):
     """Automatically moderate task descriptions"""
     moderate_content_on_save(sender, instance, created, **kwargs)
+
+
+# Fingerprints of deleted editable content
+@receiver(post_delete, sender=CommentaireCours)
+@receiver(post_delete, sender=ReponseDiscussion)
+@receiver(post_delete, sender=MessageGroupe)
+@receiver(post_delete, sender=Task)
+def forget_content_fingerprint(sender, instance, **kwargs):
+    """Drop the stored fingerprint of deleted content"""
+    forget_fingerprint(instance)
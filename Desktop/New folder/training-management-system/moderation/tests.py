@@ -1,3 +1,1061 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+
+from django.db import connection
+from django.db.models import Count, Q, QuerySet, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from courses.models import CommentaireCours, Cours
+from messaging.models import GroupeChat, Message, MessageGroupe
+from training_management.counters import flush_all
+from training_management.test_runner import FlushCountersMixin
+from users.models import Apprenant, Formateur, Utilisateur
+
+from . import batch_scoring, regex_guard, remoderation, signals
+from .archive import archive_batch, archive_resolved_reports
+from .benchmarks import (
+    BENCHMARK_WHITELIST,
+    CORPUS_CATEGORIES,
+    benchmark_corpus,
+    build_default_rules,
+    compare_corpus_results,
+    generate_corpus,
+    percentile,
+)
+from .default_rules import DEFAULT_RULES
+from .engine import CompiledRuleSet, bump_rules_version, get_rule_set, get_rules_version
+from .fingerprints import CHANGED, UNCHANGED, UNKNOWN, forget_fingerprint, update_fingerprint
+from .matcher import KeywordAutomaton
+from .metrics import DailyStatsCounters, RuleMetricsRecorder, rule_metrics, verdict_cache_counters
+from .models import (
+    ArchivedModerationReport,
+    ContentModerationReport,
+    ContentModerationRule,
+    ContentModerationWhitelist,
+    ModerationJob,
+    ModerationReportRollup,
+    ModerationRulesVersion,
+    ModerationStats,
+    RuleStats,
+)
+from .normalization import fold_accents, normalize
+from .queue import claim_jobs, complete_jobs, enqueue_moderation, fail_job, release_stale_jobs
+from .regex_guard import GuardedPattern
+from .services import AIContentModerator, moderator, with_report_relations
+from .verdict_cache import VerdictCache
+
+
+
+class ModerationTestCase(FlushCountersMixin, TestCase):
+    """Buffered metrics are written to the test database after each test"""
+
+
+class ModerationTransactionTestCase(FlushCountersMixin, TransactionTestCase):
+    """Buffered metrics are written to the test database after each test"""
+
+
+class AddressRuleTestCase(ModerationTestCase):
+    """An author and a pattern rule flagging postal addresses"""
+
+    address_rule_options = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Utilisateur.objects.create_user(
+            'auteur', 'auteur@example.com', 'x', nom='Auteur', prenom='Test'
+        )
+        cls.address_rule = ContentModerationRule.objects.create(**{
+            'name': 'Adresse',
+            'description': 'Adresses postales',
+            'rule_type': 'pattern',
+            'patterns': [r'adresse\s+\d+'],
+            'threshold': 0.5,
+            'severity': 'medium',
+            **cls.address_rule_options,
+        })
+
+    def setUp(self):
+        super().setUp()
+        # Versions of rolled back tests are reused: stamp one the process has not compiled
+        bump_rules_version()
+
+
+class ModerationStatsConcurrencyTests(ModerationTransactionTestCase):
+    """Concurrent moderation must not lose ModerationStats increments"""
+
+    threads = 8
+    increments_per_thread = 25
+
+    def run_concurrently(self, func):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.increments_per_thread):
+                    func()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_concurrent_content_checks_are_all_counted(self):
+        moderator = AIContentModerator()
+
+        self.run_concurrently(
+            lambda: moderator._update_stats(checked=True, flagged=True, auto_blocked=True)
+        )
+
+        expected = self.threads * self.increments_per_thread
+        stats = ModerationStats.objects.get(date=timezone.now().date())
+        self.assertEqual(stats.total_content_checked, expected)
+        self.assertEqual(stats.flagged_content, expected)
+        self.assertEqual(stats.auto_blocked, expected)
+
+    def test_concurrent_human_reviews_are_all_counted(self):
+        moderator = AIContentModerator()
+
+        class Report:
+            severity = 'high'
+
+        self.run_concurrently(
+            lambda: moderator._update_human_review_stats(Report(), 'approve')
+        )
+
+        expected = self.threads * self.increments_per_thread
+        stats = ModerationStats.objects.get(date=timezone.now().date())
+        self.assertEqual(stats.human_reviewed, expected)
+        self.assertEqual(stats.false_positives, expected)
+        self.assertEqual(stats.total_content_checked, 0)
+
+
+class KeywordAutomatonTests(ModerationTestCase):
+    """The automaton finds the same terms as a substring test of every term"""
+
+    def assertMatchesSubstringScan(self, terms, text):
+        expected = {index for index, term in enumerate(terms) if term in text}
+        self.assertEqual(KeywordAutomaton(terms).find(text), expected, (terms, text))
+
+    def test_overlapping_terms(self):
+        terms = ['he', 'she', 'his', 'hers', 'h', 'ers', '', 'she']
+        for text in ['ushers', 'ahishers', 'sh', '', 'hhhhe', 'xyz']:
+            self.assertMatchesSubstringScan(terms, text)
+
+    def test_random_terms_and_texts(self):
+        generator = random.Random(0)
+        for _ in range(200):
+            terms = [
+                ''.join(generator.choice('abc') for _ in range(generator.randint(1, 4)))
+                for _ in range(generator.randint(1, 8))
+            ]
+            text = ''.join(generator.choice('abcd') for _ in range(generator.randint(0, 30)))
+            self.assertMatchesSubstringScan(terms, text)
+
+    def test_default_rule_keywords(self):
+        terms = [keyword.lower() for rule in DEFAULT_RULES for keyword in rule.get('keywords', [])]
+        generator = random.Random(1)
+        for _ in range(50):
+            text = ' '.join(generator.sample(terms, 3) + ['bonjour', 'cours'])
+            self.assertMatchesSubstringScan(terms, text)
+
+
+class BatchScoringTests(ModerationTestCase):
+    """Batch evaluation gives the verdicts of evaluating every text on its own"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rule_set = CompiledRuleSet(build_default_rules(), BENCHMARK_WHITELIST, version='test')
+        cls.texts = [text for text, _category, _expected in generate_corpus(250, seed=7)] + [
+            'Ça suffit, ÉNORME arnaque!!! Gagnez 1000€ maintenant',
+            'Straße und Größe: idiot',
+            '',
+            'CLIQUEZ ICI http://exemple.com GRATUIT GRATUIT',
+        ]
+
+    def assertBatchMatchesEvaluate(self):
+        self.assertEqual(
+            self.rule_set.evaluate_batch(self.texts),
+            [self.rule_set.evaluate(text) for text in self.texts]
+        )
+
+    def test_numpy_scoring(self):
+        if batch_scoring.np is None:
+            self.skipTest('numpy is not installed')
+        self.assertBatchMatchesEvaluate()
+
+    def test_pure_python_scoring(self):
+        with mock.patch.object(batch_scoring, 'np', None):
+            self.assertBatchMatchesEvaluate()
+
+
+class BenchmarkTests(ModerationTestCase):
+    """The corpus benchmark is reproducible and its baseline check catches regressions"""
+
+    def test_corpus_is_reproducible_and_balanced(self):
+        corpus = generate_corpus(50, seed=3)
+        self.assertEqual(corpus, generate_corpus(50, seed=3))
+        self.assertNotEqual(corpus, generate_corpus(50, seed=4))
+        categories = Counter(category for _text, category, _expected in corpus)
+        self.assertEqual(categories, {category: 10 for category in CORPUS_CATEGORIES})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_corpus_benchmark_counts_every_text(self):
+        result = benchmark_corpus(text_count=50, repeat=1, seed=3)
+        self.assertEqual(sum(counts['texts'] for counts in result['categories'].values()), 50)
+        self.assertEqual(result['categories']['clean']['expected'], 0)
+        self.assertLessEqual(result['p50_us'], result['p99_us'])
+        self.assertGreater(result['recall'], 0)
+
+    def test_regressions_against_baseline(self):
+        baseline = [{
+            'suite': 'corpus', 'texts': 50, 'seed': 3,
+            'texts_per_second': 1000, 'batch_texts_per_second': 2000,
+            'p50_us': 100, 'p99_us': 500, 'precision': 0.9, 'recall': 0.8,
+        }]
+        within = dict(baseline[0], texts_per_second=900, p99_us=550)
+        self.assertEqual(compare_corpus_results([within], baseline), [])
+
+        worse = dict(baseline[0], texts_per_second=500, recall=0.7)
+        regressions = compare_corpus_results([worse], baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('50 texts: texts_per_second'))
+
+    def test_command_fails_on_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            options = {'suite': 'corpus', 'corpus_sizes': [25], 'seed': 3, 'repeat': 1, 'stdout': StringIO()}
+            call_command('benchmark_moderation', output=output, **options)
+
+            with open(output) as results_file:
+                results = json.load(results_file)
+            results[0]['recall'] = 1.5
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file)
+
+            with self.assertRaisesMessage(CommandError, 'recall'):
+                call_command('benchmark_moderation', baseline=baseline, **options)
+
+
+class GuardedPatternTests(ModerationTestCase):
+    """A pattern that was not run on the whole text never reports it clean"""
+
+    def test_timeouts_do_not_disable_pattern_with_regex_module(self):
+        pattern = GuardedPattern(r'adresse\s+\d+')
+        pattern.timeout = 0
+
+        with self.assertLogs('moderation', 'WARNING') as logs:
+            for _ in range(pattern.max_overruns + 2):
+                self.assertEqual(pattern.scan('adresse 1'), ([], False))
+        self.assertEqual(len(logs.records), pattern.max_overruns + 2)
+
+        pattern.timeout = 1
+        self.assertFalse(pattern.disabled)
+        self.assertEqual(pattern.scan('mon adresse 12'), (['adresse 12'], True))
+
+    def test_breaker_without_regex_module_reports_incomplete_and_resets(self):
+        with mock.patch.object(regex_guard, 'regex', None):
+            pattern = GuardedPattern(r'adresse\s+\d+')
+            pattern.timeout = 0
+            pattern.cooldown = 0.05
+
+            with self.assertLogs('moderation', 'WARNING'):
+                for _ in range(pattern.max_overruns):
+                    pattern.scan('adresse 1')
+            self.assertTrue(pattern.disabled)
+            self.assertEqual(pattern.scan('adresse 1'), ([], False))
+
+            time.sleep(0.06)
+            pattern.timeout = 1
+            self.assertFalse(pattern.disabled)
+            self.assertEqual(pattern.scan('adresse 1'), (['adresse 1'], True))
+
+    def test_input_over_budget_is_incomplete(self):
+        pattern = GuardedPattern(r'adresse\s+\d+')
+        pattern.max_input = 100
+
+        matches, complete = pattern.scan('x ' * 100 + 'adresse 1')
+        self.assertEqual(matches, [])
+        self.assertFalse(complete)
+
+
+class IncompleteScanModerationTests(AddressRuleTestCase):
+    """Texts that were not fully scanned get a pending report and are not cached"""
+
+    address_rule_options = {'auto_block': True, 'severity': 'high'}
+
+    def test_padded_text_gets_pending_report(self):
+        with override_settings(MODERATION_REGEX_MAX_INPUT=100):
+            bump_rules_version()
+            is_safe, report = AIContentModerator().moderate_content(
+                self.author, 'x ' * 100 + 'adresse 1', self.author, 'private_message'
+            )
+
+        self.assertTrue(is_safe)
+        self.assertIsNotNone(report)
+        self.assertEqual(report.status, 'pending')
+        self.assertFalse(report.auto_blocked)
+        self.assertEqual(report.severity, 'high')
+        self.assertTrue(any(issue.get('incomplete') for issue in report.detected_issues))
+
+    def test_timed_out_verdict_is_not_cached(self):
+        cache = VerdictCache(max_entries=100)
+        rule_set = get_rule_set()
+        patterns = [pattern for rule in rule_set.rules for pattern in rule.patterns]
+        for pattern in patterns:
+            pattern.timeout = 0
+
+        with self.assertLogs('moderation', 'WARNING'):
+            verdict = cache.evaluate(rule_set, 'adresse 1')
+        self.assertTrue(verdict.incomplete)
+        self.assertFalse(verdict.auto_block)
+        self.assertEqual(len(cache), 0)
+
+        for pattern in patterns:
+            pattern.timeout = 1
+        verdict = cache.evaluate(rule_set, 'adresse 1')
+        self.assertFalse(verdict.incomplete)
+        self.assertTrue(verdict.auto_block)
+        self.assertEqual(len(cache), 1)
+
+
+class NormalizationTests(ModerationTestCase):
+    """Keywords and patterns match whatever the case and accents of the text"""
+
+    def setUp(self):
+        self.keyword_rule = ContentModerationRule.objects.create(
+            name='Insulte',
+            description='Insultes',
+            rule_type='keyword',
+            keywords=['Débile'],
+            threshold=0.5,
+            severity='medium',
+        )
+        self.pattern_rule = ContentModerationRule.objects.create(
+            name='Réunion',
+            description='Réunions hors plateforme',
+            rule_type='pattern',
+            patterns=[r'r[ée]union\s+à\s+\d+h'],
+            threshold=0.5,
+            severity='low',
+        )
+        bump_rules_version()
+
+    def matched_rules(self, content):
+        return set(get_rule_set().evaluate(content).rule_ids)
+
+    def test_keywords_match_folded_text(self):
+        for content in ['débile', 'DÉBILE', 'debile', 'de\u0301bile']:
+            self.assertEqual(self.matched_rules(f'Un avis {content}'), {self.keyword_rule.pk}, content)
+
+    def test_patterns_match_raw_text(self):
+        for content in ['réunion à 18h', 'Reunion a 18h', 'RÉUNION\u00a0À 18H']:
+            self.assertEqual(self.matched_rules(f'Une {content} ?'), {self.pattern_rule.pk}, content)
+        self.assertEqual(self.matched_rules('Une réunion demain'), set())
+
+    def test_character_ranges_are_folded(self):
+        self.assertEqual(fold_accents('[à-ÿ]+'), '[a-y]+')
+        self.assertEqual(normalize('Œuvre’s').folded_lower, "oeuvre's")
+
+
+class VerdictCacheTests(AddressRuleTestCase):
+    """Repeated texts are answered from the cache until the rules change"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = VerdictCache(max_entries=100, shared=False)
+        verdict_cache_counters.flush()
+
+    def evaluations(self, rule_set):
+        return mock.patch.object(rule_set, 'evaluate', wraps=rule_set.evaluate)
+
+    def test_repeated_text_hits_cache(self):
+        rule_set = get_rule_set()
+        with self.evaluations(rule_set) as evaluate:
+            first = self.cache.evaluate(rule_set, 'mon adresse 12')
+            second = self.cache.evaluate(rule_set, 'mon adresse 12')
+
+        self.assertEqual(evaluate.call_count, 1)
+        self.assertIs(second, first)
+
+    def test_version_bump_invalidates_cache(self):
+        self.cache.evaluate(get_rule_set(), 'mon adresse 12')
+        bump_rules_version()
+        rule_set = get_rule_set()
+
+        with self.evaluations(rule_set) as evaluate:
+            self.cache.evaluate(rule_set, 'mon adresse 12')
+        self.assertEqual(evaluate.call_count, 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_hit_and_miss_counters(self):
+        rule_set = get_rule_set()
+        self.cache.evaluate(rule_set, 'mon adresse 12')
+        self.cache.evaluate(rule_set, 'mon adresse 12')
+        self.cache.evaluate_many(rule_set, ['mon adresse 12', 'merci', 'merci'])
+
+        verdict_cache_counters.flush()
+        stats = ModerationStats.objects.get(date=timezone.localdate())
+        self.assertEqual((stats.verdict_cache_hits, stats.verdict_cache_misses), (3, 2))
+
+
+class RuleMetricsTests(AddressRuleTestCase):
+    """Rules record their evaluation times and hits per day"""
+
+    def setUp(self):
+        super().setUp()
+        rule_metrics.flush()
+
+    def test_cached_verdicts_count_hits_but_not_evaluations(self):
+        moderator = AIContentModerator()
+        for content in ['mon adresse 12', 'mon adresse 12', 'bonjour']:
+            moderator.moderate_content(self.author, content, self.author, 'private_message')
+
+        rule_metrics.flush()
+        stats = RuleStats.objects.get(rule=self.address_rule, date=timezone.localdate())
+        self.assertEqual((stats.evaluations, stats.hits), (2, 2))
+        self.assertEqual(sum(count for _, count in stats.histogram), 2)
+
+    def test_timings_fill_latency_buckets(self):
+        recorder = RuleMetricsRecorder(flush_interval=3600)
+        profile = [(self.address_rule.pk, 0.000005), (self.address_rule.pk, 0.0005), (self.address_rule.pk, 0.02)]
+        recorder.record(profile, mock.Mock(rule_ids=[self.address_rule.pk], shadow_hits=[]))
+        recorder.flush()
+
+        stats = RuleStats.objects.get(rule=self.address_rule)
+        self.assertEqual(stats.evaluations, 3)
+        self.assertEqual(stats.total_time_us, 20505)
+        self.assertEqual(dict(stats.histogram), {
+            'time_under_10us': 1, 'time_under_100us': 0, 'time_under_1ms': 1,
+            'time_under_10ms': 0, 'time_over_10ms': 1,
+        })
+
+
+class ReportRollupTests(AddressRuleTestCase):
+    """ModerationReportRollup totals follow the reports through their lifecycle"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reviewer = Utilisateur.objects.create_user(
+            'moderateur', 'moderateur@example.com', 'x', nom='Moderateur', prenom='Test'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.moderator = AIContentModerator()
+        self.reports = [
+            self.moderator.moderate_content(self.author, f'adresse {number}', self.author, 'private_message')[1]
+            for number in range(4)
+        ]
+
+    def assertRollupsMatchReports(self):
+        rollups = ModerationReportRollup.objects.aggregate(
+            reports=Sum('reports'), pending=Sum('pending'),
+            approved=Sum('approved'), rejected=Sum('rejected')
+        )
+        reports = ContentModerationReport.objects.aggregate(
+            reports=Count('pk'),
+            pending=Count('pk', filter=Q(status='pending')),
+            approved=Count('pk', filter=Q(status='approved')),
+            rejected=Count('pk', filter=Q(status='rejected')),
+        )
+        self.assertEqual({field: value or 0 for field, value in rollups.items()}, reports)
+
+    def test_create_and_review(self):
+        self.assertRollupsMatchReports()
+        self.assertTrue(self.moderator.review_report(self.reports[0].pk, self.reviewer, 'approve'))
+        self.assertRollupsMatchReports()
+        reviewed = self.moderator.review_reports(
+            [report.pk for report in self.reports[1:3]], self.reviewer, 'reject'
+        )
+        self.assertEqual(reviewed, 2)
+        self.assertRollupsMatchReports()
+
+    def test_delete(self):
+        self.moderator.review_report(self.reports[0].pk, self.reviewer, 'approve')
+        ContentModerationReport.objects.get(pk=self.reports[0].pk).delete()
+        self.assertRollupsMatchReports()
+        ContentModerationReport.objects.filter(pk=self.reports[1].pk).delete()
+        self.assertRollupsMatchReports()
+
+    def test_author_deletion_cascades(self):
+        self.author.delete()
+        self.assertEqual(ContentModerationReport.objects.count(), 0)
+        self.assertRollupsMatchReports()
+
+    def test_archived_reports_stay_counted(self):
+        self.moderator.review_report(self.reports[0].pk, self.reviewer, 'approve')
+        self.assertEqual(archive_batch(timezone.now() + timedelta(days=1)), 1)
+        totals = ModerationReportRollup.objects.aggregate(reports=Sum('reports'), approved=Sum('approved'))
+        self.assertEqual(totals, {'reports': 4, 'approved': 1})
+
+    def test_dashboard_counts_local_days(self):
+        # 00:30 on March 11th in Paris, still March 10th in UTC
+        now = datetime(2026, 3, 10, 23, 30, tzinfo=dt_timezone.utc)
+        ContentModerationReport.objects.filter(pk=self.reports[0].pk).update(created_at=now - timedelta(minutes=20))
+        ContentModerationReport.objects.exclude(pk=self.reports[0].pk).update(created_at=now - timedelta(minutes=40))
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            data = self.moderator.get_moderation_dashboard_data()
+        self.assertEqual([report.pk for report in data['recent_reports']], [self.reports[0].pk])
+        self.assertEqual(data['today_stats'].date, date(2026, 3, 11))
+
+
+class ReportArchiveTests(AddressRuleTestCase):
+    """Archiving moves old resolved reports and keeps their content readable"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reviewer = Utilisateur.objects.create_user(
+            'moderateur', 'moderateur@example.com', 'x', nom='Moderateur', prenom='Test'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.reports = [
+            moderator.moderate_content(self.author, content, self.author, 'private_message')[1]
+            for content in [
+                'Écrivez-moi à mon adresse 12, « rue de l’Été » 🙂',
+                'adresse 7 ' + 'très long ' * 200,
+                'adresse 3',
+                'adresse 4',
+            ]
+        ]
+        moderator.review_report(self.reports[0].pk, self.reviewer, 'approve', 'Faux positif, évidemment')
+        moderator.review_report(self.reports[1].pk, self.reviewer, 'reject', '')
+        moderator.review_report(self.reports[2].pk, self.reviewer, 'reject', 'Récent')
+        ContentModerationReport.objects.filter(pk__in=[self.reports[0].pk, self.reports[1].pk]).update(
+            review_date=timezone.now() - timedelta(days=100)
+        )
+
+    def test_old_resolved_reports_round_trip(self):
+        old = ContentModerationReport.objects.filter(pk__in=[self.reports[0].pk, self.reports[1].pk])
+        expected = {report.pk: report for report in old}
+
+        output = StringIO()
+        call_command('archive_moderation_reports', batch_size=1, stdout=output)
+        self.assertIn('(2 total)', output.getvalue())
+
+        self.assertEqual(
+            sorted(ContentModerationReport.objects.values_list('pk', flat=True)),
+            [self.reports[2].pk, self.reports[3].pk]
+        )
+        for archived in ArchivedModerationReport.objects.all():
+            report = expected.pop(archived.pk)
+            self.assertEqual(archived.original_content, report.original_content)
+            self.assertEqual(archived.detected_issues, report.detected_issues)
+            self.assertEqual(archived.review_notes, report.review_notes)
+            self.assertEqual(
+                (archived.author_id, archived.reviewed_by_id, archived.status, archived.severity,
+                 archived.review_date, archived.created_at, archived.object_id),
+                (report.author_id, report.reviewed_by_id, report.status, report.severity,
+                 report.review_date, report.created_at, report.object_id)
+            )
+        self.assertEqual(expected, {})
+
+        repeated = ArchivedModerationReport.objects.get(pk=self.reports[1].pk)
+        self.assertLess(len(repeated.payload), len(repeated.original_content) // 10)
+
+    def test_rerun_after_interrupted_batch(self):
+        report = ContentModerationReport.objects.get(pk=self.reports[0].pk)
+        # Inserted by a batch whose delete did not happen
+        ArchivedModerationReport.from_report(report).save()
+
+        self.assertEqual(list(archive_resolved_reports()), [2])
+        self.assertEqual(ArchivedModerationReport.objects.count(), 2)
+        self.assertEqual(
+            ArchivedModerationReport.objects.get(pk=report.pk).original_content, report.original_content
+        )
+
+
+def create_course():
+    """A course and a learner who can comment on it"""
+    formateur = Formateur.objects.create(utilisateur=Utilisateur.objects.create_user(
+        'formateur', 'formateur@example.com', 'x', nom='Formateur', prenom='Test'
+    ))
+    apprenant = Apprenant.objects.create(utilisateur=Utilisateur.objects.create_user(
+        'apprenant', 'apprenant@example.com', 'x', nom='Apprenant', prenom='Test'
+    ))
+    cours = Cours.objects.create(
+        titre='Cours', description='Description', contenu='Contenu', formateur=formateur,
+        duree_minutes=30, niveau='debutant', categorie='Test', mots_cles='test'
+    )
+    return cours, apprenant
+
+
+class ContentFingerprintTests(AddressRuleTestCase):
+    """Edited content is moderated again only when its moderated text changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cours, cls.apprenant = create_course()
+
+    def comment(self, commentaire):
+        return CommentaireCours.objects.create(
+            cours=self.cours, apprenant=self.apprenant, note=4, commentaire=commentaire
+        )
+
+    def test_update_fingerprint_states(self):
+        comment = self.comment('Très bon cours')
+
+        self.assertEqual(update_fingerprint(comment), UNCHANGED)
+        comment.approuve = False
+        self.assertEqual(update_fingerprint(comment, update_fields=['approuve']), UNCHANGED)
+
+        comment.commentaire = 'Très bon cours, merci'
+        self.assertEqual(update_fingerprint(comment), CHANGED)
+        self.assertEqual(update_fingerprint(comment), UNCHANGED)
+
+        forget_fingerprint(comment)
+        self.assertEqual(update_fingerprint(comment), UNKNOWN)
+        self.assertEqual(update_fingerprint(comment), UNCHANGED)
+
+    def test_edited_comment_is_moderated_again(self):
+        comment = self.comment('Très bon cours')
+        self.assertFalse(ContentModerationReport.objects.exists())
+
+        comment.approuve = False
+        comment.save(update_fields=['approuve'])
+        comment.save()
+        self.assertFalse(ContentModerationReport.objects.exists())
+
+        comment.commentaire = 'Écrivez-moi, adresse 12'
+        comment.save()
+        report = ContentModerationReport.objects.get()
+        self.assertEqual((report.object_id, report.content_type_label), (comment.pk, 'course_comment'))
+
+        comment.save()
+        self.assertEqual(ContentModerationReport.objects.count(), 1)
+
+
+class ReviewReportsTests(ModerationTestCase):
+    """Bulk review has the effects of reviewing every report on its own"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cours, cls.apprenant = create_course()
+        cls.reviewer = Utilisateur.objects.create_user(
+            'moderateur', 'moderateur@example.com', 'x', nom='Moderateur', prenom='Test'
+        )
+
+    def create_reports(self):
+        reports = []
+        for severity, auto_blocked in [('high', True), ('medium', False), ('low', False)]:
+            comment = CommentaireCours.objects.create(
+                cours=self.cours, apprenant=self.apprenant, note=3,
+                commentaire='Commentaire', approuve=not auto_blocked
+            )
+            reports.append(moderator._create_report(
+                comment, 'course_comment', comment.commentaire, self.apprenant.utilisateur,
+                0.9, [], severity, auto_blocked
+            ))
+        return reports
+
+    def effects(self, reports):
+        rows = []
+        for report in reports:
+            report.refresh_from_db()
+            rows.append((
+                report.status, report.reviewed_by_id, report.review_notes,
+                report.review_date is not None,
+                CommentaireCours.objects.get(pk=report.object_id).approuve,
+            ))
+        return rows
+
+    def review_stats(self):
+        stats = ModerationStats.objects.filter(date=timezone.now().date()).first()
+        return (stats.human_reviewed, stats.false_positives) if stats else (0, 0)
+
+    def assertSameEffects(self, decision):
+        single = self.create_reports()
+        for report in single:
+            self.assertTrue(moderator.review_report(report.id, self.reviewer, decision, 'Note'))
+        single_stats = self.review_stats()
+
+        batch = self.create_reports()
+        reviewed = moderator.review_reports([report.id for report in batch], self.reviewer, decision, 'Note')
+        batch_stats = self.review_stats()
+
+        self.assertEqual(reviewed, 3)
+        self.assertEqual(self.effects(batch), self.effects(single))
+        self.assertEqual(
+            (batch_stats[0] - single_stats[0], batch_stats[1] - single_stats[1]), single_stats
+        )
+
+        status = 'approved' if decision == 'approve' else 'rejected'
+        totals = ModerationReportRollup.objects.aggregate(pending=Sum('pending'), reviewed=Sum(status))
+        self.assertEqual(totals, {'pending': 0, 'reviewed': 6})
+
+    def test_approve(self):
+        self.assertSameEffects('approve')
+
+    def test_reject(self):
+        self.assertSameEffects('reject')
+
+    def test_reviewed_reports_are_skipped(self):
+        report = self.create_reports()[0]
+        moderator.review_report(report.id, self.reviewer, 'approve')
+        self.assertEqual(moderator.review_reports([report.id], self.reviewer, 'reject'), 0)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'approved')
+
+
+class ReportListQueryTests(ModerationTestCase):
+    """Report lists load their relations in a number of queries independent of the page size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cours, cls.apprenant = create_course()
+        cls.staff = Utilisateur.objects.create_user(
+            'moderateur', 'moderateur@example.com', 'x', nom='Moderateur', prenom='Test', is_staff=True
+        )
+
+    def create_reports(self, count):
+        author = self.apprenant.utilisateur
+        for number in range(count):
+            comment = CommentaireCours.objects.create(
+                cours=self.cours, apprenant=self.apprenant, note=3, commentaire=f'Commentaire {number}'
+            )
+            message = Message.objects.create(
+                expediteur=author, destinataire=self.staff, sujet='Sujet', contenu=f'Message {number}'
+            )
+            for content_object, label in [(comment, 'course_comment'), (message, 'private_message')]:
+                moderator._create_report(content_object, label, 'Contenu', author, 0.9, [], 'medium', False)
+
+    def test_pending_reports_view(self):
+        self.client.force_login(self.staff)
+        url = reverse('moderation:pending_reports')
+        for count in [1, 5]:
+            self.create_reports(count)
+            # Session, user, count, the page of reports with their users,
+            # then one query per content type
+            with self.assertNumQueries(6):
+                response = self.client.get(url)
+            self.assertEqual(len(response.context['page_obj']), ContentModerationReport.objects.count())
+
+    def test_relations_are_prefetched(self):
+        self.create_reports(3)
+        ContentModerationReport.objects.update(reviewed_by=self.staff)
+
+        # Reports with their users and content types, then one query per content type
+        with self.assertNumQueries(3):
+            reports = list(with_report_relations(ContentModerationReport.objects.all()))
+            for report in reports:
+                self.assertEqual((report.author.nom, report.reviewed_by.nom), ('Apprenant', 'Moderateur'))
+                self.assertIsInstance(report.content_object, report.content_type.model_class())
+                self.assertEqual(report.content_object.pk, report.object_id)
+
+
+class ModerationQueueTests(ModerationTestCase):
+    """Jobs are claimed by one worker at a time, retried, and released when a worker dies"""
+
+    def setUp(self):
+        self.author = Utilisateur.objects.create_user(
+            'auteur', 'auteur@example.com', 'x', nom='Auteur', prenom='Test'
+        )
+        self.jobs = [enqueue_moderation(self.author, 'private_message') for _ in range(3)]
+
+    def test_claim_takes_oldest_pending_jobs_once(self):
+        first = claim_jobs(2, worker_id='premier')
+        self.assertEqual([job.id for job in first], [job.id for job in self.jobs[:2]])
+        self.assertTrue(all(job.status == 'processing' and job.attempts == 1 for job in first))
+
+        second = claim_jobs(2, worker_id='second')
+        self.assertEqual([job.id for job in second], [self.jobs[2].id])
+        self.assertEqual(claim_jobs(2, worker_id='troisieme'), [])
+
+        self.assertEqual(complete_jobs([job.id for job in first]), 2)
+        self.assertEqual(ModerationJob.objects.filter(status='done').count(), 2)
+
+    def test_claim_skips_locked_rows_when_supported(self):
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True), \
+                mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                                  side_effect=select_for_update) as locked:
+            claimed = claim_jobs(3, worker_id='premier')
+
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(locked.call_args.kwargs, {'skip_locked': True})
+
+    def test_failed_job_is_retried_until_max_attempts(self):
+        ModerationJob.objects.exclude(pk=self.jobs[0].pk).delete()
+
+        job, = claim_jobs(1, worker_id='premier')
+        self.assertEqual(fail_job(job, ValueError('erreur'), max_attempts=2), 'pending')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.claimed_by, job.last_error), ('pending', '', 'erreur'))
+
+        job, = claim_jobs(1, worker_id='premier')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(fail_job(job, ValueError('erreur'), max_attempts=2), 'failed')
+        self.assertEqual(claim_jobs(1, worker_id='premier'), [])
+        job.refresh_from_db()
+        self.assertIsNotNone(job.processed_at)
+
+    def test_release_stale_jobs(self):
+        stale, fresh = claim_jobs(2, worker_id='premier')
+        ModerationJob.objects.filter(pk=stale.pk).update(claimed_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(release_stale_jobs(60), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.claimed_by), ('pending', ''))
+        self.assertEqual(fresh.status, 'processing')
+        self.assertEqual([job.id for job in claim_jobs(3, worker_id='second')], [self.jobs[0].id, self.jobs[2].id])
+
+
+@override_settings(MODERATION_MODES={'group_message': 'deferred'})
+class DeferredModerationTests(AddressRuleTestCase):
+    """Deferred content types only run the auto-block rules before the worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.group = GroupeChat.objects.create(nom='Groupe', createur=cls.author)
+        ContentModerationRule.objects.create(
+            name='Insulte', description='Insultes', rule_type='pattern',
+            patterns=[r'imbecile'], threshold=0.5, auto_block=True, severity='high',
+        )
+
+    def message(self, contenu):
+        return MessageGroupe(groupe=self.group, auteur=self.author, contenu=contenu)
+
+    def test_precheck_defers_content_passing_blocking_rules(self):
+        message = self.message('adresse 12')
+        self.assertTrue(moderator.precheck_instance(message))
+        message.save()
+
+        self.assertEqual(ModerationJob.objects.filter(object_id=message.pk).count(), 1)
+        self.assertFalse(ContentModerationReport.objects.exists())
+
+    def test_precheck_blocks_content_failing_blocking_rules(self):
+        self.assertFalse(moderator.precheck_instance(self.message('imbecile')))
+
+    def test_blocked_content_is_reported_with_every_rule(self):
+        self.message('imbecile, adresse 12').save()
+
+        report = ContentModerationReport.objects.get()
+        self.assertTrue(report.auto_blocked)
+        self.assertEqual({issue['rule'] for issue in report.detected_issues}, {'Adresse', 'Insulte'})
+        self.assertFalse(ModerationJob.objects.exists())
+
+    def test_prechecked_blocked_content_is_refused(self):
+        message = self.message('imbecile, adresse 12')
+        with mock.patch.object(moderator, '_evaluate', wraps=moderator._evaluate) as evaluate:
+            self.assertFalse(moderator.precheck_instance(message))
+        evaluate.assert_called_once_with('imbecile, adresse 12')
+
+
+class WhitelistedAuthorTests(ModerationTestCase):
+    """Whitelisted authors follow email changes"""
+
+    def setUp(self):
+        self.user = Utilisateur.objects.create_user(
+            'confiance', 'confiance@example.com', 'x', nom='Confiance', prenom='Test'
+        )
+        ContentModerationWhitelist.objects.create(
+            whitelist_type='user', value='confiance@example.com', created_by=self.user
+        )
+
+    def test_email_leaving_whitelist(self):
+        self.assertTrue(get_rule_set().is_whitelisted_author_id(self.user.pk))
+
+        self.user.email = 'autre@example.com'
+        self.user.save()
+        rule_set = get_rule_set()
+        self.assertFalse(rule_set.is_whitelisted_author_id(self.user.pk))
+        self.assertFalse(rule_set.is_whitelisted_author(self.user))
+
+    def test_email_entering_whitelist(self):
+        other = Utilisateur.objects.create_user(
+            'autre', 'autre@example.com', 'x', nom='Autre', prenom='Test'
+        )
+        self.assertFalse(get_rule_set().is_whitelisted_author_id(other.pk))
+
+        self.user.email = 'ancienne@example.com'
+        self.user.save()
+        other.email = 'confiance@example.com'
+        other.save()
+        self.assertTrue(get_rule_set().is_whitelisted_author_id(other.pk))
+        self.assertFalse(get_rule_set().is_whitelisted_author_id(self.user.pk))
+
+    def test_saves_keeping_email_leave_rules_version(self):
+        user = Utilisateur.objects.get(pk=self.user.pk)
+        with mock.patch.object(signals, 'bump_rules_version') as bump:
+            with self.assertNumQueries(1):
+                user.save(update_fields=['last_login'])
+            user.nom = 'Renommé'
+            user.save()
+            Utilisateur.objects.create_user('nouveau', 'nouveau@example.com', 'x', nom='Nouveau', prenom='Test')
+        bump.assert_not_called()
+
+
+@override_settings(MODERATION_API_MAX_CHARS=100)
+class ModerationApiTests(ModerationTestCase):
+    """The batch moderation API is reserved to staff and both endpoints are bounded in size"""
+
+    def setUp(self):
+        self.staff = Utilisateur.objects.create_user(
+            'moderateur', 'moderateur@example.com', 'x', nom='Moderateur', prenom='Test', is_staff=True
+        )
+
+    def post(self, name, data):
+        return self.client.post(
+            reverse(f'moderation:{name}'), json.dumps(data), content_type='application/json'
+        )
+
+    def test_batch_is_refused_to_non_staff(self):
+        response = self.post('api_moderate_batch', {'texts': ['bonjour']})
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('error', response.json())
+
+        self.client.force_login(Utilisateur.objects.create_user(
+            'apprenant', 'apprenant@example.com', 'x', nom='Apprenant', prenom='Test'
+        ))
+        self.assertEqual(self.post('api_moderate_batch', {'texts': ['bonjour']}).status_code, 403)
+
+    def test_single_content_keeps_its_access(self):
+        response = self.post('api_moderate', {'content': 'bonjour'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_gets_verdicts(self):
+        self.client.force_login(self.staff)
+        response = self.post('api_moderate_batch', {'texts': ['bonjour', 'merci']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_texts_over_character_budget_are_rejected(self):
+        self.client.force_login(self.staff)
+        response = self.post('api_moderate_batch', {'texts': ['a' * 60, 'b' * 60]})
+        self.assertEqual(response.status_code, 413)
+        response = self.post('api_moderate', {'content': 'a' * 101})
+        self.assertEqual(response.status_code, 413)
+
+
+class RulesVersionTests(ModerationTransactionTestCase):
+    """Rule changes reach every process through the version stamp in the database"""
+
+    def setUp(self):
+        # The stamp of the previous test may still be cached in this process
+        bump_rules_version()
+
+    def create_rule(self, name):
+        return ContentModerationRule.objects.create(
+            name=name, description=name, rule_type='keyword', keywords=[name.lower()], severity='low'
+        )
+
+    def test_rule_change_bumps_stored_version(self):
+        version = get_rules_version()
+        self.create_rule('Interdit')
+
+        stored = ModerationRulesVersion.objects.get(pk=1).version
+        self.assertNotEqual(stored, version)
+        self.assertEqual(get_rule_set().version, stored)
+        self.assertIn('Interdit', [rule.name for rule in get_rule_set().rules])
+
+    @override_settings(MODERATION_RULES_VERSION_TTL=0.05)
+    def test_version_changed_by_another_process_is_picked_up(self):
+        rule_set = get_rule_set()
+
+        # Another process saves a rule: only the database row changes here
+        with mock.patch('moderation.signals.bump_rules_version'):
+            self.create_rule('Autre')
+        ModerationRulesVersion.objects.filter(pk=1).update(version='autre-processus')
+        self.assertEqual(get_rule_set().version, rule_set.version)
+
+        time.sleep(0.06)
+        rebuilt = get_rule_set()
+        self.assertEqual(rebuilt.version, 'autre-processus')
+        self.assertIn('Autre', [rule.name for rule in rebuilt.rules])
+
+
+class RemoderateCommandTests(ModerationTransactionTestCase):
+    """manage.py remoderate reports stored content, in process or across a pool"""
+
+    def setUp(self):
+        bump_rules_version()
+        author = Utilisateur.objects.create_user(
+            'auteur', 'auteur@example.com', 'x', nom='Auteur', prenom='Test'
+        )
+        group = GroupeChat.objects.create(nom='Groupe', createur=author)
+        for contenu in ['adresse 12', 'bonjour', 'adresse 7 rue', 'merci']:
+            MessageGroupe.objects.create(groupe=group, auteur=author, contenu=contenu)
+        ContentModerationRule.objects.create(
+            name='Adresse', description='Adresses postales', rule_type='pattern',
+            patterns=[r'adresse\s+\d+'], threshold=0.5, severity='medium',
+        )
+
+    def remoderate(self, workers):
+        output = StringIO()
+        call_command('remoderate', content_type=['group_message'], workers=workers, stdout=output)
+        self.assertIn('group_message: 4 scanned, 0 skipped, 2 flagged', output.getvalue())
+        self.assertEqual(
+            sorted(ContentModerationReport.objects.values_list('original_content', flat=True)),
+            ['adresse 12', 'adresse 7 rue']
+        )
+
+    def test_single_process(self):
+        self.remoderate(workers=1)
+
+    def test_worker_pool(self):
+        self.remoderate(workers=2)
+
+    def test_spawned_workers(self):
+        # The default start method on macOS and Windows: children start without Django set up
+        with mock.patch.object(remoderation, 'Pool', multiprocessing.get_context('spawn').Pool):
+            self.remoderate(workers=2)
+
+
+class BufferedCountersTests(ModerationTestCase):
+    """Increments survive a failed flush"""
+
+    def test_failed_write_keeps_increments(self):
+        counters = DailyStatsCounters(flush_interval=3600)
+        counters.add(timezone.now().date(), total_content_checked=2)
+
+        with mock.patch.object(DailyStatsCounters, 'write', side_effect=RuntimeError('base indisponible')):
+            with self.assertLogs('training_management.counters', 'ERROR'):
+                counters.flush()
+        counters.add(timezone.now().date(), total_content_checked=1)
+
+        counters.flush()
+        self.assertEqual(ModerationStats.objects.get().total_content_checked, 3)
+
+    def test_flush_all_writes_every_instance(self):
+        first, second = DailyStatsCounters(flush_interval=3600), DailyStatsCounters(flush_interval=3600)
+        first.add(timezone.now().date(), flagged_content=1)
+        second.add(timezone.now().date(), flagged_content=1)
+
+        flush_all()
+        self.assertEqual(ModerationStats.objects.get().flagged_content, 2)
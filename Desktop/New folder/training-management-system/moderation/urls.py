@@ -8,7 +8,10 @@ urlpatterns = [
     path('pending/', views.pending_reports, name='pending_reports'),
     path('report/<int:report_id>/', views.review_report, name='review_report'),
     path('stats/', views.moderation_stats, name='stats'),
+    path('stats/shadow/', views.shadow_rule_stats, name='shadow_stats'),
     path('test/', views.test_content, name='test_content'),
     path('api/moderate/', views.api_moderate_content, name='api_moderate'),
+    path('api/moderate/batch/', views.api_moderate_batch, name='api_moderate_batch'),
+    path('api/dashboard/charts/', views.api_dashboard_charts, name='api_dashboard_charts'),
     path('admin/complaints/', views.admin_complaints_list, name='admin_complaints_list'),
 ]
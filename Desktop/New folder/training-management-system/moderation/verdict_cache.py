@@ -0,0 +1,188 @@
+"""
+Verdict cache for repeated texts
+Identical short messages ("merci", "ok", copy-pasted announcements) are
+evaluated once per rule-set version and answered from a bounded LRU, optionally
+backed by the shared Django cache so every process benefits
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .engine import Verdict
+from .metrics import verdict_cache_counters
+from .normalization import canonical_text
+
+logger = logging.getLogger(__name__)
+
+
+# Bumped whenever the stored verdict tuple changes shape
+SHARED_CACHE_KEY_PREFIX = 'moderation:verdict:2'
+
+
+def text_key(content, version):
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+    return f"{version}:{digest}"
+
+
+class VerdictCache:
+    """Bounded LRU of verdicts keyed by text hash and rule-set version"""
+
+    def __init__(self, max_entries=None, shared=None, shared_timeout=None):
+        self.max_entries = (
+            max_entries if max_entries is not None
+            else getattr(settings, 'MODERATION_VERDICT_CACHE_SIZE', 10000)
+        )
+        self.shared = (
+            shared if shared is not None
+            else getattr(settings, 'MODERATION_VERDICT_CACHE_SHARED', False)
+        )
+        self.shared_timeout = (
+            shared_timeout if shared_timeout is not None
+            else getattr(settings, 'MODERATION_VERDICT_CACHE_TIMEOUT', 3600)
+        )
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def evaluate(self, rule_set, content, profile=None):
+        """
+        Verdict of ``rule_set.evaluate(content, shadow=True)``, computed once
+        per distinct normalized text and rule-set version; ``profile`` only
+        receives rule timings when the rules actually run
+        """
+        # The canonical text is both hashed and evaluated
+        content = canonical_text(content)
+        if not self.max_entries:
+            return rule_set.evaluate(content, shadow=True, profile=profile)
+
+        key = text_key(content, rule_set.version)
+
+        verdict = self._get_local(key, rule_set.version)
+        if verdict is None and self.shared:
+            verdict = self._get_shared(key, rule_set)
+            if verdict is not None:
+                self._set_local(key, verdict)
+
+        if verdict is not None:
+            verdict_cache_counters.record(hit=True)
+            return verdict
+
+        verdict_cache_counters.record(hit=False)
+        verdict = rule_set.evaluate(content, shadow=True, profile=profile)
+        self._store(key, verdict)
+        return verdict
+
+    def evaluate_many(self, rule_set, contents):
+        """
+        Verdicts of ``evaluate`` for a list of texts; the texts missing from
+        the cache are evaluated together with ``rule_set.evaluate_batch``
+        """
+        contents = [canonical_text(content) for content in contents]
+        if not self.max_entries:
+            return rule_set.evaluate_batch(contents, shadow=True)
+
+        keys = [text_key(content, rule_set.version) for content in contents]
+        verdicts = {}
+        missing = {}
+
+        for key, content in zip(keys, contents):
+            if key in verdicts or key in missing:
+                # Repeated within the batch: evaluated or looked up once
+                verdict_cache_counters.record(hit=True)
+                continue
+
+            verdict = self._get_local(key, rule_set.version)
+            if verdict is None and self.shared:
+                verdict = self._get_shared(key, rule_set)
+                if verdict is not None:
+                    self._set_local(key, verdict)
+
+            verdict_cache_counters.record(hit=verdict is not None)
+            if verdict is None:
+                missing[key] = content
+            else:
+                verdicts[key] = verdict
+
+        if missing:
+            evaluated = rule_set.evaluate_batch(list(missing.values()), shadow=True)
+            for key, verdict in zip(missing, evaluated):
+                verdicts[key] = verdict
+                self._store(key, verdict)
+
+        return [verdicts[key] for key in keys]
+
+    def _store(self, key, verdict):
+        if verdict.incomplete:
+            # A partial scan (regex timeout, oversized text) is evaluated
+            # again next time instead of being answered as clean
+            return
+        self._set_local(key, verdict)
+        if self.shared:
+            self._set_shared(key, verdict)
+
+    def _get_local(self, key, version):
+        with self._lock:
+            if self._version != version:
+                # Verdicts of the previous rules can never be hit again
+                self._entries.clear()
+                self._version = version
+                return None
+
+            verdict = self._entries.get(key)
+            if verdict is not None:
+                self._entries.move_to_end(key)
+            return verdict
+
+    def _set_local(self, key, verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, key, rule_set):
+        try:
+            data = cache.get(f"{SHARED_CACHE_KEY_PREFIX}:{key}")
+        except Exception as e:
+            logger.error(f"Error reading shared verdict cache: {e}")
+            return None
+
+        if data is None:
+            return None
+
+        issues, confidence, severity, auto_block, whitelisted, shadow_hits, rule_ids = data
+        # Shadow hits are stored as rule ids: compiled rules stay in process
+        shadow_rules = {rule.id: rule for rule in rule_set.shadow_rules}
+        shadow_hits = [
+            (shadow_rules[rule_id], rule_issues)
+            for rule_id, rule_issues in shadow_hits
+            if rule_id in shadow_rules
+        ]
+        return Verdict(issues, confidence, severity, auto_block, whitelisted, shadow_hits, rule_ids)
+
+    def _set_shared(self, key, verdict):
+        data = (
+            verdict.issues, verdict.confidence, verdict.severity,
+            verdict.auto_block, verdict.whitelisted,
+            [(rule.id, rule_issues) for rule, rule_issues in verdict.shadow_hits],
+            verdict.rule_ids,
+        )
+        try:
+            cache.set(f"{SHARED_CACHE_KEY_PREFIX}:{key}", data, self.shared_timeout)
+        except Exception as e:
+            logger.error(f"Error writing shared verdict cache: {e}")
+
+
+verdict_cache = VerdictCache()
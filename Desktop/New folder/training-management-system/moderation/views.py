@@ -1,12 +1,30 @@
 
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
 from django.core.paginator import Paginator
-from .models import ContentModerationReport, ContentModerationRule, ModerationStats
-from .services import moderator
+from django.db.models import Sum
+from .models import (
+    ContentModerationReport,
+    ContentModerationRule,
+    ModerationReportRollup,
+    ModerationStats,
+    RuleStats,
+    ShadowRuleStats,
+)
+from .metrics import (
+    blocked_content_counters,
+    rule_metrics,
+    shadow_recorder,
+    verdict_cache_counters,
+    whitelisted_content_counters,
+)
+from .rollups import chart_data
+from .services import moderator, with_report_relations
+from .verdict_cache import verdict_cache
 import json
 
 @staff_member_required
@@ -18,6 +36,11 @@ def admin_complaints_list(request):
 @staff_member_required
 def moderation_dashboard(request):
     """Main moderation dashboard"""
+    # Include this process's pending counters in the stats below
+    verdict_cache_counters.flush()
+    whitelisted_content_counters.flush()
+    blocked_content_counters.flush()
+    rule_metrics.flush()
     dashboard_data = moderator.get_moderation_dashboard_data()
     
     # Get weekly stats
@@ -26,12 +49,32 @@ def moderation_dashboard(request):
         date__gte=week_ago
     ).order_by('-date')
     
+    # Most expensive rules of the week
+    rule_costs = list(
+        RuleStats.objects.filter(date__gte=week_ago)
+        .values('rule_id', 'rule__name', 'rule__rule_type')
+        .annotate(
+            evaluations=Sum('evaluations'),
+            hits=Sum('hits'),
+            total_time_us=Sum('total_time_us'),
+            # Evaluations of 1 ms or more
+            slow_evaluations=Sum('time_under_10ms') + Sum('time_over_10ms'),
+        )
+        .order_by('-total_time_us')[:10]
+    )
+    for rule_cost in rule_costs:
+        evaluations = rule_cost['evaluations']
+        rule_cost['average_time_us'] = rule_cost['total_time_us'] / evaluations if evaluations else 0
+    
     context = {
         'recent_reports': dashboard_data['recent_reports'],
         'pending_reviews': dashboard_data['pending_reviews'],
         'today_stats': dashboard_data['today_stats'],
         'active_rules': dashboard_data['active_rules'],
         'weekly_stats': weekly_stats,
+        'rule_costs': rule_costs,
+        'verdict_cache_size': len(verdict_cache),
+        'verdict_cache_max_entries': verdict_cache.max_entries,
     }
     
     return render(request, 'moderation/dashboard.html', context)
@@ -40,8 +83,25 @@ def moderation_dashboard(request):
 @staff_member_required
 def pending_reports(request):
     """View pending moderation reports"""
-    reports = ContentModerationReport.objects.filter(
-        status='pending'
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        report_ids = [
+            int(report_id) for report_id in request.POST.getlist('report_ids')
+            if report_id.isdigit()
+        ]
+        
+        if action in ['approve', 'reject'] and report_ids:
+            reviewed = moderator.review_reports(
+                report_ids, request.user, action, request.POST.get('notes', '')
+            )
+            messages.success(request, f'{reviewed} rapport(s) traité(s) ({action})')
+        else:
+            messages.error(request, 'Sélectionnez au moins un rapport et une action')
+        
+        return redirect(request.get_full_path())
+    
+    reports = with_report_relations(
+        ContentModerationReport.objects.filter(status='pending')
     ).order_by('-created_at')
     
     # Filter by severity if requested
@@ -104,12 +164,28 @@ def moderation_stats(request):
         date__gte=thirty_days_ago
     ).order_by('-date')
     
-    # Calculate totals
-    total_checked = sum(stat.total_content_checked for stat in stats)
-    total_flagged = sum(stat.flagged_content for stat in stats)
-    total_auto_blocked = sum(stat.auto_blocked for stat in stats)
-    total_human_reviewed = sum(stat.human_reviewed for stat in stats)
-    total_false_positives = sum(stat.false_positives for stat in stats)
+    # Calculate totals in the database
+    totals = stats.aggregate(
+        checked=Sum('total_content_checked'),
+        flagged=Sum('flagged_content'),
+        auto_blocked=Sum('auto_blocked'),
+        human_reviewed=Sum('human_reviewed'),
+        false_positives=Sum('false_positives'),
+    )
+    total_checked = totals['checked'] or 0
+    total_flagged = totals['flagged'] or 0
+    total_auto_blocked = totals['auto_blocked'] or 0
+    total_human_reviewed = totals['human_reviewed'] or 0
+    total_false_positives = totals['false_positives'] or 0
+    
+    # Reports of the period by content type and severity, from the rollups
+    rollups = ModerationReportRollup.objects.filter(date__gte=thirty_days_ago)
+    reports_by_content_type = rollups.values('content_type_label').annotate(
+        reports=Sum('reports'), pending=Sum('pending')
+    ).order_by('-reports')
+    reports_by_severity = rollups.values('severity').annotate(
+        reports=Sum('reports'), pending=Sum('pending')
+    ).order_by('-reports')
     
     # Calculate rates
     flagging_rate = (total_flagged / total_checked * 100) if total_checked > 0 else 0
@@ -126,11 +202,74 @@ def moderation_stats(request):
         'flagging_rate': flagging_rate,
         'auto_block_rate': auto_block_rate,
         'false_positive_rate': false_positive_rate,
+        'reports_by_content_type': reports_by_content_type,
+        'reports_by_severity': reports_by_severity,
     }
     
     return render(request, 'moderation/stats.html', context)
 
 
+@staff_member_required
+def api_dashboard_charts(request):
+    """Daily series of the dashboard charts, read from the precomputed rollups"""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return JsonResponse({'error': 'days must be an integer'}, status=400)
+    
+    # Include this process's pending counters, as the dashboard does
+    verdict_cache_counters.flush()
+    whitelisted_content_counters.flush()
+    blocked_content_counters.flush()
+    return JsonResponse(chart_data(min(max(days, 1), 365)))
+
+
+@staff_member_required
+def shadow_rule_stats(request):
+    """Hit rates of rules evaluated in shadow mode over the last 30 days"""
+    # Make this process's buffered counters visible immediately
+    shadow_recorder.flush()
+    
+    thirty_days_ago = timezone.now().date() - timezone.timedelta(days=30)
+    daily_stats = ShadowRuleStats.objects.filter(
+        rule__shadow=True,
+        date__gte=thirty_days_ago
+    ).order_by('-date')
+    
+    rules = {
+        rule.id: {
+            'rule': rule,
+            'evaluated': 0,
+            'hits': 0,
+            'overlapping_hits': 0,
+            'samples': [],
+        }
+        for rule in ContentModerationRule.objects.filter(shadow=True)
+    }
+    
+    for stat in daily_stats:
+        row = rules.get(stat.rule_id)
+        if row is None:
+            continue
+        row['evaluated'] += stat.evaluated
+        row['hits'] += stat.hits
+        row['overlapping_hits'] += stat.overlapping_hits
+        if not row['samples']:
+            row['samples'] = stat.sample_matches
+    
+    shadow_rules = []
+    for row in rules.values():
+        row['hit_rate'] = (row['hits'] / row['evaluated'] * 100) if row['evaluated'] > 0 else 0
+        row['overlap_rate'] = (row['overlapping_hits'] / row['hits'] * 100) if row['hits'] > 0 else 0
+        shadow_rules.append(row)
+    
+    context = {
+        'shadow_rules': shadow_rules,
+    }
+    
+    return render(request, 'moderation/shadow_stats.html', context)
+
+
 @staff_member_required
 def test_content(request):
     """Test content moderation on sample text"""
@@ -184,6 +323,14 @@ def test_content(request):
     return render(request, 'moderation/test_content.html', context)
 
 
+def too_large_response(texts):
+    """413 response when the texts exceed the character budget of one request, else None"""
+    max_chars = getattr(settings, 'MODERATION_API_MAX_CHARS', 200000)
+    if sum(len(text) for text in texts) > max_chars:
+        return JsonResponse({'error': f'At most {max_chars} characters per request'}, status=413)
+    return None
+
+
 def api_moderate_content(request):
     """API endpoint for content moderation (for AJAX calls)"""
     if request.method != 'POST':
@@ -192,41 +339,33 @@ def api_moderate_content(request):
     try:
         data = json.loads(request.body)
         content_text = data.get('content', '')
-        content_type = data.get('content_type', 'test')
         
         if not content_text:
             return JsonResponse({'error': 'No content provided'}, status=400)
+        if not isinstance(content_text, str):
+            return JsonResponse({'error': 'content must be a string'}, status=400)
         
-        # Use dummy object for API testing
-        class DummyContent:
-            pk = 0
-            def save(self):
-                pass
-        
-        dummy_obj = DummyContent()
+        too_large = too_large_response([content_text])
+        if too_large:
+            return too_large
         
-        # Moderate content
-        is_safe, report = moderator.moderate_content(
-            content_object=dummy_obj,
-            content_text=content_text,
-            author=request.user if request.user.is_authenticated else None,
-            content_type_label=content_type
-        )
+        # Verdict only: nothing is written to the database
+        result = moderator.check_texts(
+            [content_text],
+            author=request.user if request.user.is_authenticated else None
+        )[0]
         
         response_data = {
-            'is_safe': is_safe,
-            'blocked': False
+            'is_safe': result['is_safe'],
+            'blocked': result['blocked']
         }
         
-        if report:
+        if result['issues']:
             response_data.update({
-                'confidence': report.ai_confidence,
-                'severity': report.severity,
-                'issues': report.detected_issues,
-                'blocked': report.auto_blocked
+                'confidence': result['confidence'],
+                'severity': result['severity'],
+                'issues': result['issues'],
             })
-            # Clean up test report
-            report.delete()
         
         return JsonResponse(response_data)
         
@@ -236,6 +375,42 @@ def api_moderate_content(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def api_moderate_batch(request):
+    """API endpoint returning one verdict per text, evaluated in memory"""
+    if not (request.user.is_active and request.user.is_staff):
+        return JsonResponse({'error': 'Staff access required'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    texts = data.get('texts') if isinstance(data, dict) else None
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return JsonResponse({'error': 'texts must be a list of strings'}, status=400)
+    
+    max_texts = getattr(settings, 'MODERATION_BATCH_MAX_TEXTS', 1000)
+    if len(texts) > max_texts:
+        return JsonResponse({'error': f'At most {max_texts} texts per request'}, status=400)
+    
+    too_large = too_large_response(texts)
+    if too_large:
+        return too_large
+    
+    try:
+        results = moderator.check_texts(
+            texts,
+            author=request.user if request.user.is_authenticated else None
+        )
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'count': len(results), 'results': results})
+
+
 @staff_member_required
 def test_content(request):
     """Test content moderation interface"""
@@ -0,0 +1,118 @@
+"""
+Shared counter primitives
+Atomic F() upserts, and per-process counters aggregated in memory and flushed
+on an interval, used by the moderation metrics and the page view counts
+"""
+
+import atexit
+import logging
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Every BufferedCounters of the process, flushed together at exit
+_instances = weakref.WeakSet()
+_flush_at_exit = True
+
+
+def flush_all():
+    """Write the pending counters of every BufferedCounters"""
+    for counters in list(_instances):
+        counters.flush()
+
+
+def disable_exit_flush():
+    """
+    Keep pending counters from being written at interpreter exit
+
+    The test runner calls this: at exit the test database is already
+    destroyed and the connection points at the development database again.
+    """
+    global _flush_at_exit
+    _flush_at_exit = False
+
+
+@atexit.register
+def _flush_at_interpreter_exit():
+    if _flush_at_exit:
+        flush_all()
+
+
+def increment_row(model, lookup, increments):
+    """Atomically add ``increments`` to the row matching ``lookup``, creating it if needed"""
+    updates = {field: F(field) + value for field, value in increments.items()}
+
+    if model.objects.filter(**lookup).update(**updates):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **increments)
+    except IntegrityError:
+        # Another process created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+class BufferedCounters:
+    """Per-process counters keyed by an arbitrary tuple, flushed on an interval"""
+
+    # Setting holding the flush interval in seconds, unless one is passed
+    flush_interval_setting = None
+    default_flush_interval = 30
+
+    def __init__(self, flush_interval=None):
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        _instances.add(self)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        if self.flush_interval_setting is None:
+            return self.default_flush_interval
+        return getattr(settings, self.flush_interval_setting, self.default_flush_interval)
+
+    def add(self, key, **increments):
+        with self._lock:
+            counters = self._pending.setdefault(key, {})
+            for field, value in increments.items():
+                counters[field] = counters.get(field, 0) + value
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write every pending counter to the database"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return
+
+        try:
+            self.write(pending)
+        except Exception as e:
+            logger.error(f"Error flushing {self.__class__.__name__}: {e}")
+            self._restore(pending)
+
+    def _restore(self, pending):
+        # Failed increments go back in the buffer for the next flush
+        with self._lock:
+            for key, increments in pending.items():
+                counters = self._pending.setdefault(key, {})
+                for field, value in increments.items():
+                    counters[field] = counters.get(field, 0) + value
+
+    def write(self, pending):
+        raise NotImplementedError
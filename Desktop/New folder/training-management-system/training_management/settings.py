@@ -89,6 +89,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test database: the in-memory shared cache raises
+        # "table is locked" instead of waiting, which breaks threaded tests
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -172,3 +177,59 @@ CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 # Internationalization
 LANGUAGE_CODE = 'fr-fr'
 TIME_ZONE = 'Europe/Paris'
+
+# Content moderation
+# 'inline' runs every rule inside post_save; 'deferred' only runs the
+# auto-block rules inline and queues the rest for `manage.py moderation_worker`
+MODERATION_MODES = {
+    'course_comment': 'inline',
+    'discussion_reply': 'inline',
+    'group_message': 'inline',
+    'private_message': 'inline',
+    'task_description': 'inline',
+}
+
+# The rules version stamp lives in the database; each process reads it again
+# at most every MODERATION_RULES_VERSION_TTL seconds to notice rule changes
+MODERATION_RULES_VERSION_TTL = 1.0
+
+# Seconds between flushes of the in-memory moderation metrics (shadow rules)
+MODERATION_METRICS_FLUSH_INTERVAL = 30
+
+# Buffered counters are written at exit too, except under the test runner
+TEST_RUNNER = 'training_management.test_runner.TestRunner'
+
+# Time budget (seconds) of one admin-supplied regex on one text; patterns are
+# run on at most MODERATION_REGEX_MAX_INPUT characters, and texts that were not
+# fully scanned get a pending report. Without the regex module, a pattern is
+# skipped for MODERATION_REGEX_COOLDOWN seconds after
+# MODERATION_REGEX_MAX_OVERRUNS overruns in a process
+MODERATION_REGEX_TIMEOUT = 0.05
+MODERATION_REGEX_MAX_INPUT = 20000
+MODERATION_REGEX_MAX_OVERRUNS = 3
+MODERATION_REGEX_COOLDOWN = 300
+
+# Largest number of texts accepted by one call to the batch moderation API,
+# and largest combined length of the texts of one moderation API call (413 above)
+MODERATION_BATCH_MAX_TEXTS = 1000
+MODERATION_API_MAX_CHARS = 200000
+
+# Verdicts of identical texts are reused until the rules change: at most
+# MODERATION_VERDICT_CACHE_SIZE per process (0 disables the cache), optionally
+# shared between processes through the default Django cache
+MODERATION_VERDICT_CACHE_SIZE = 10000
+MODERATION_VERDICT_CACHE_SHARED = False
+MODERATION_VERDICT_CACHE_TIMEOUT = 3600
+
+# Approved and rejected moderation reports reviewed more than this many days
+# ago are moved to the archive by `manage.py archive_moderation_reports`
+MODERATION_ARCHIVE_AFTER_DAYS = 90
+
+# Page views are counted once per session and object every
+# VIEW_COUNTS_DEDUP_WINDOW seconds and written to the database every
+# VIEW_COUNTS_FLUSH_INTERVAL seconds. Sessions are remembered in the
+# VIEW_COUNTS_CACHE cache: the default local-memory cache only deduplicates
+# within one process, so point it at a shared cache when running several workers
+VIEW_COUNTS_CACHE = 'default'
+VIEW_COUNTS_DEDUP_WINDOW = 1800
+VIEW_COUNTS_FLUSH_INTERVAL = 30
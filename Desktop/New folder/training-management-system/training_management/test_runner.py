@@ -0,0 +1,23 @@
+"""
+Test runner and test helpers of the project
+"""
+
+from django.test.runner import DiscoverRunner
+
+from .counters import disable_exit_flush, flush_all
+
+
+class TestRunner(DiscoverRunner):
+    """Django's runner, without writing buffered counters at exit"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        disable_exit_flush()
+
+
+class FlushCountersMixin:
+    """Flush the buffered counters into the test database after each test"""
+
+    def tearDown(self):
+        flush_all()
+        super().tearDown()